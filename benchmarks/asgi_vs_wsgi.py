@@ -0,0 +1,224 @@
+"""Синхронный gunicorn (WSGI) против gunicorn + uvicorn (ASGI) при равном числе процессов.
+
+Нужна база с применёнными миграциями и вещами; лучше PostgreSQL:
+
+    DATABASE_URL=postgres://postgres@localhost:5432/inventory python benchmarks/asgi_vs_wsgi.py
+
+Для каждого режима поднимается сервер с --workers процессами. Пока идёт
+замер, --exports клиентов без перерыва качают /export/ — медленный запрос,
+который в синхронном воркере занимает его целиком. Остальные клиенты читают
+карточки вещей и первую страницу списка. Память — сумма RSS всех процессов
+сервера по /proc, максимум за время замера; сравнение «при равной памяти» —
+по запросам в секунду на 100 МБ.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+MODES = ('wsgi', 'asgi')
+
+
+def server_command(mode, port, workers):
+    bind = f'127.0.0.1:{port}'
+    if mode == 'wsgi':
+        return ['gunicorn', 'config.wsgi:application', '--bind', bind, '--workers', str(workers)]
+    return [
+        'gunicorn', '-c', 'config/gunicorn_asgi.py', 'config.asgi:application',
+        '--bind', bind, '--workers', str(workers), '--access-logfile', os.devnull,
+    ]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def fetch(port, path, timeout=30):
+    # Новое соединение на запрос: синхронный gunicorn не держит keep-alive
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        size = 0
+        while chunk := response.read(64 * 1024):
+            size += len(chunk)
+        return response.status, size
+    finally:
+        connection.close()
+
+
+def wait_ready(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Сервер завершился при старте')
+        try:
+            if fetch(port, '/', timeout=2)[0] == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Сервер не ответил за отведённое время')
+
+
+def tree_rss(pid):
+    """RSS процесса и всех его потомков, байты"""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            status = Path(f'/proc/{current}/status').read_text()
+            total += int(next(line.split()[1] for line in status.splitlines() if line.startswith('VmRSS:'))) * 1024
+            for task in Path(f'/proc/{current}/task').iterdir():
+                pending.extend(int(child) for child in (task / 'children').read_text().split())
+        except (OSError, StopIteration):
+            continue
+    return total
+
+
+def run_mode(mode, args, paths):
+    port = free_port()
+    env = {**os.environ, 'QUERY_BUDGET': 'false', 'DEBUG': 'False', 'PYTHONUNBUFFERED': '1'}
+    process = subprocess.Popen(
+        server_command(mode, port, args.workers),
+        cwd=BASE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(port, process)
+        # Прогрев: шаблоны, пул соединений, кэш
+        for path in paths[:50]:
+            fetch(port, path)
+
+        stop = threading.Event()
+        latencies, errors, exports, peak_rss = [], [0], [], [0]
+        lock = threading.Lock()
+
+        def exporter():
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    fetch(port, '/export/', timeout=300)
+                except OSError:
+                    continue
+                with lock:
+                    exports.append(time.perf_counter() - started)
+
+        def reader(seed):
+            rng = random.Random(seed)
+            local, failed = [], 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    status, _ = fetch(port, rng.choice(paths))
+                except OSError:
+                    status = None
+                if status == 200:
+                    local.append(time.perf_counter() - started)
+                else:
+                    failed += 1
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+        def sampler():
+            while not stop.is_set():
+                peak_rss[0] = max(peak_rss[0], tree_rss(process.pid))
+                time.sleep(0.2)
+
+        threads = [threading.Thread(target=exporter) for _ in range(args.exports)]
+        threads += [threading.Thread(target=reader, args=(seed,)) for seed in range(args.concurrency)]
+        threads.append(threading.Thread(target=sampler))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    latencies.sort()
+    rps = len(latencies) / elapsed
+    rss_mb = peak_rss[0] / 2 ** 20
+    return {
+        'mode': mode,
+        'workers': args.workers,
+        'concurrency': args.concurrency,
+        'exports': args.exports,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(rps, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else None,
+        'export_s': round(statistics.median(exports), 2) if exports else None,
+        'rss_mb': round(rss_mb, 1),
+        'rps_per_100mb': round(rps / rss_mb * 100, 1) if rss_mb else None,
+    }
+
+
+def read_paths(count):
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+    from django.db import connections
+
+    from inventory.models import Item
+
+    pks = list(Item.objects.order_by('?').values_list('pk', flat=True)[:count])
+    connections.close_all()
+    if not pks:
+        raise SystemExit('В базе нет вещей — сначала заполните её')
+    # Девять карточек на одну страницу списка
+    return [f'/item/{pk}/' for pk in pks] + ['/'] * max(1, len(pks) // 9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=16, help='Клиентов, читающих страницы')
+    parser.add_argument('--exports', type=int, default=2, help='Клиентов, качающих /export/')
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--paths', type=int, default=500, help='Сколько разных вещей читать')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    parser.add_argument('--json', help='Куда сохранить результаты')
+    args = parser.parse_args()
+
+    paths = read_paths(args.paths)
+    results = [run_mode(mode, args, paths) for mode in args.modes]
+
+    print(
+        f'{"режим":<6} {"запросов/с":>11} {"ошибок":>7} {"p50, мс":>9} {"p95, мс":>9} '
+        f'{"p99, мс":>9} {"экспорт, с":>11} {"RSS, МБ":>9} {"rps/100 МБ":>11}'
+    )
+    for result in results:
+        print(
+            f'{result["mode"]:<6} {result["rps"]:>11} {result["errors"]:>7} {result["p50_ms"]:>9} '
+            f'{result["p95_ms"]:>9} {result["p99_ms"]:>9} {result["export_s"]:>11} '
+            f'{result["rss_mb"]:>9} {result["rps_per_100mb"]:>11}'
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
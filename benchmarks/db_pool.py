@@ -0,0 +1,117 @@
+"""Новое соединение на каждый запрос против пула соединений (DB_POOL).
+
+Нужен PostgreSQL с применёнными миграциями:
+
+    DATABASE_URL=postgres://postgres@localhost:5432/inventory python benchmarks/db_pool.py
+
+Каждый режим запускается в отдельном процессе, потому что настройки
+читаются при старте Django. Один «запрос» повторяет жизненный цикл Django:
+request_started, SELECT вещи по pk, request_finished — на нём соединение
+закрывается (DB_POOL=off) или возвращается в пул (DB_POOL=worker).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+MODES = ('off', 'worker')
+
+
+def run_mode(requests, threads):
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+    from django.core.signals import request_finished, request_started
+    from django.db import connections
+
+    from config.db.pool import pool_stats
+    from inventory.models import Item
+
+    pk = Item.objects.values_list('pk', flat=True).first() or 0
+    connections.close_all()
+    latencies = []
+    lock = threading.Lock()
+
+    def client(count):
+        local = []
+        for _ in range(count):
+            started = time.perf_counter()
+            request_started.send(sender=None)
+            list(Item.objects.filter(pk=pk).values_list('name', 'updated_at'))
+            request_finished.send(sender=None)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+        connections.close_all()
+
+    per_thread = requests // threads
+    workers = [threading.Thread(target=client, args=(per_thread,)) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'mode': os.environ.get('DB_POOL', 'worker'),
+        'requests': len(latencies),
+        'threads': threads,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        'pool': pool_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    parser.add_argument('--json', help='Куда сохранить результаты')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args.requests, args.threads)))
+        return
+
+    if not os.environ.get('DATABASE_URL', '').startswith('postgres'):
+        parser.error('Нужен DATABASE_URL на PostgreSQL')
+
+    results = []
+    for mode in args.modes:
+        output = subprocess.run(
+            [sys.executable, __file__, '--run', mode, '--requests', str(args.requests), '--threads', str(args.threads)],
+            env={**os.environ, 'DB_POOL': mode, 'QUERY_BUDGET': 'false', 'DEBUG': 'False'},
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f'{"режим":<8} {"запросов/с":>11} {"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9}')
+    for result in results:
+        print(
+            f'{result["mode"]:<8} {result["rps"]:>11} {result["p50_ms"]:>9} '
+            f'{result["p95_ms"]:>9} {result["p99_ms"]:>9}'
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
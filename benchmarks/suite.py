@@ -0,0 +1,283 @@
+"""Замеры основных страниц и API на синтетической базе 1k / 100k / 1M вещей.
+
+    python benchmarks/suite.py --json bench/$(git rev-parse --short HEAD).json
+    python benchmarks/suite.py --compare bench/old.json bench/new.json
+
+Для каждого размера — своя база: по умолчанию файл SQLite в --data-dir, с
+--database-url — PostgreSQL ({size} в адресе заменяется размером, базы
+создаются сами). База заполняется manage.py seed_inventory с одним и тем же
+--seed и переиспользуется, пока в ней столько же вещей, — так сравниваются
+коммиты, а не случайные данные. Первое заполнение 1M вещей — несколько минут.
+
+Запросы идут через django.test.Client в отдельном процессе на каждый размер:
+без сети и сервера, только Django и база. Число и время SQL берутся из
+заголовка Server-Timing (config/metrics.py); у потоковой выгрузки он
+отдаётся до первого байта, поэтому её SQL там не виден. Результаты — JSON с
+сортированными ключами: их можно сравнивать diff-ом или --compare, который
+завершается с кодом 1, если медиана какого-то сценария выросла больше
+--threshold процентов.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+SIZES = (1000, 100_000, 1_000_000)
+SEARCH_WORDS = ('палатка', 'кабель', 'charger', 'drill', 'термос', 'лампа', 'tent', 'ножницы')
+SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) SQL"')
+
+
+def percentile(values, share):
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def scenarios(rng, pks, category_ids):
+    """Имя -> (клиент, метод, функция номера повтора -> (путь, данные), холодный кэш)"""
+    words = list(SEARCH_WORDS)
+    rng.shuffle(words)
+    return {
+        'list': ('anonymous', 'get', lambda i: ('/', None), True),
+        'list_cached': ('anonymous', 'get', lambda i: ('/', None), False),
+        'list_category': ('anonymous', 'get', lambda i: (f'/?category={category_ids[i % len(category_ids)]}', None), True),
+        'search': ('anonymous', 'get', lambda i: (f'/?q={words[i % len(words)]}', None), True),
+        'api_search': ('anonymous', 'get', lambda i: (f'/api/v1/search?q={words[i % len(words)]}', None), True),
+        'detail': ('anonymous', 'get', lambda i: (f'/item/{pks[i % len(pks)]}/', None), True),
+        'api_detail': ('anonymous', 'get', lambda i: (f'/api/v1/{pks[i % len(pks)]}', None), True),
+        'stats': ('anonymous', 'get', lambda i: ('/api/v1/stats', None), True),
+        'create': ('staff', 'post', lambda i: ('/api/v1/', {
+            'name': f'Бенчмарк {i}', 'category_id': category_ids[i % len(category_ids)], 'price': 100 + i,
+        }), False),
+        'admin_changelist': ('staff', 'get', lambda i: ('/admin/inventory/item/', None), True),
+        'export': ('anonymous', 'get', lambda i: ('/export/', None), False),
+    }
+
+
+def measure(client, method, request, repeat, cold):
+    from inventory.cache import tiered_cache
+
+    latencies, queries, db_ms, sizes, errors = [], [], [], [], 0
+    for index in range(repeat):
+        path, data = request(index)
+        if cold:
+            tiered_cache.clear()
+        started = time.perf_counter()
+        if method == 'post':
+            response = client.post(path, data=json.dumps(data), content_type='application/json')
+        else:
+            response = client.get(path)
+        size = sum(len(chunk) for chunk in response) if response.streaming else len(response.content)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors += 1
+        sizes.append(size)
+        timing = SERVER_TIMING.search(response.get('Server-Timing', ''))
+        if timing:
+            db_ms.append(float(timing.group(1)))
+            queries.append(int(timing.group(2)))
+    latencies.sort()
+    return {
+        'requests': repeat,
+        'errors': errors,
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+        'queries': max(queries) if queries else None,
+        'db_ms': round(statistics.median(db_ms), 2) if db_ms else None,
+        'bytes': round(statistics.median(sizes)),
+    }
+
+
+def run_size(size, args):
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from django.db import connection
+    from django.db.models import Max, Min
+    from django.test import Client
+
+    from categories.models import Category
+    from inventory import bulk
+    from inventory.models import Item
+
+    call_command('migrate', verbosity=0)
+    if Item.objects.count() != size or args.reseed:
+        # Прогресс заполнения — в stderr: stdout занят результатом
+        call_command('seed_inventory', items=size, seed=args.seed, photos=args.photos, clear=True,
+                     stdout=sys.stderr)
+
+    rng = random.Random(args.seed)
+    bounds = Item.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    # Случайные id из диапазона, а не ORDER BY random() по миллиону строк
+    candidates = rng.sample(range(bounds['low'], bounds['high'] + 1),
+                            min(args.repeat * 2, bounds['high'] - bounds['low'] + 1))
+    pks = sorted(Item.objects.filter(pk__in=candidates).values_list('pk', flat=True))[:args.repeat]
+    rng.shuffle(pks)
+    category_ids = sorted(Category.objects.values_list('pk', flat=True))
+
+    staff, _ = get_user_model().objects.get_or_create(
+        username='benchmark', defaults={'is_staff': True, 'is_superuser': True},
+    )
+    clients = {'anonymous': Client(HTTP_HOST='localhost'), 'staff': Client(HTTP_HOST='localhost')}
+    clients['staff'].force_login(staff)
+
+    results = {}
+    last_pk = bounds['high']
+    for name, (client, method, request, cold) in scenarios(rng, pks, category_ids).items():
+        if args.scenarios and name not in args.scenarios:
+            continue
+        repeat = args.export_repeat if name == 'export' else args.repeat
+        # Прогрев: шаблоны, соединение, импорт модулей
+        measure(clients[client], method, request, min(repeat, 2), cold)
+        results[name] = measure(clients[client], method, request, repeat, cold)
+        print(f'{size}: {name} {results[name]["p50_ms"]} мс', file=sys.stderr)
+    # Созданные вещи убираем, иначе следующий запуск решит, что база не того размера
+    created = list(Item.objects.filter(pk__gt=last_pk).values_list('pk', flat=True))
+    if created:
+        bulk.delete_items(created)
+    return {'items': size, 'database': connection.vendor, 'scenarios': results}
+
+
+def database_url(args, size):
+    if args.database_url:
+        return args.database_url.replace('{size}', str(size))
+    Path(args.data_dir).mkdir(parents=True, exist_ok=True)
+    return f'sqlite:///{Path(args.data_dir).resolve() / f"suite-{size}.sqlite3"}'
+
+
+def ensure_postgres_database(url):
+    """CREATE DATABASE, если базы из адреса ещё нет"""
+    import psycopg2
+
+    parts = urlsplit(url)
+    name = parts.path.lstrip('/')
+    connection = psycopg2.connect(urlunsplit(parts._replace(path='/postgres')))
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_database WHERE datname = %s', [name])
+            if cursor.fetchone() is None:
+                cursor.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        connection.close()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path, threshold):
+    old, new = (json.loads(Path(path).read_text()) for path in (old_path, new_path))
+    print(f'{"размер":>8} {"сценарий":<18} {"p50 было":>9} {"p50 стало":>10} {"изменение":>10} {"SQL":>9}')
+    regressions = 0
+    for size, result in new['results'].items():
+        before = old['results'].get(size, {}).get('scenarios', {})
+        for name, after in result['scenarios'].items():
+            if name not in before:
+                continue
+            was, now = before[name]['p50_ms'], after['p50_ms']
+            change = (now - was) / was * 100 if was else 0
+            flag = ''
+            if change > threshold:
+                flag = ' ←'
+                regressions += 1
+            print(
+                f'{size:>8} {name:<18} {was:>9} {now:>10} {change:>+9.1f}% '
+                f'{str(before[name]["queries"]) + "→" + str(after["queries"]):>9}{flag}'
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES))
+    parser.add_argument('--database-url', help='PostgreSQL, например postgres://postgres@localhost/bench_{size}')
+    parser.add_argument('--data-dir', default=Path(tempfile.gettempdir()) / 'inventory-benchmarks',
+                        help='Где хранить базы SQLite')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--photos', type=float, default=0.1, help='Доля вещей с фото')
+    parser.add_argument('--reseed', action='store_true', help='Заполнить базы заново')
+    parser.add_argument('--repeat', type=int, default=30, help='Запросов на сценарий')
+    parser.add_argument('--export-repeat', type=int, default=3, help='Полных выгрузок')
+    parser.add_argument('--scenarios', nargs='+', help='Только эти сценарии')
+    parser.add_argument('--json', help='Куда сохранить результаты')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Сравнить два файла результатов')
+    parser.add_argument('--threshold', type=float, default=10, help='Рост медианы, который считается регрессией, %%')
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    if args.run:
+        print(json.dumps(run_size(args.run, args)))
+        return
+
+    results = {}
+    media = Path(args.data_dir) / 'media'
+    for size in args.sizes:
+        url = database_url(args, size)
+        if url.startswith('postgres'):
+            ensure_postgres_database(url)
+        command = [sys.executable, __file__, '--run', str(size), '--seed', str(args.seed),
+                   '--photos', str(args.photos), '--repeat', str(args.repeat),
+                   '--export-repeat', str(args.export_repeat)]
+        if args.reseed:
+            command.append('--reseed')
+        if args.scenarios:
+            command += ['--scenarios', *args.scenarios]
+        output = subprocess.run(
+            command,
+            env={
+                **os.environ, 'DATABASE_URL': url, 'QUERY_BUDGET': 'false', 'DEBUG': 'False',
+                'SERVER_TIMING': 'true', 'MEDIA_ROOT': str(media),
+                'METRICS_DIR': str(Path(args.data_dir) / 'metrics'),
+            },
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        results[str(size)] = json.loads(output.strip().splitlines()[-1])
+
+    report = {
+        'revision': git_revision(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': f'{platform.machine()}, {os.cpu_count()} CPU',
+        'seed': args.seed,
+        'results': results,
+    }
+
+    print(f'{"размер":>8} {"сценарий":<18} {"p50, мс":>9} {"p95, мс":>9} {"SQL":>5} {"БД, мс":>8} {"ошибок":>7}')
+    for size, result in results.items():
+        for name, row in result['scenarios'].items():
+            print(
+                f'{size:>8} {name:<18} {row["p50_ms"]:>9} {row["p95_ms"]:>9} {str(row["queries"]):>5} '
+                f'{str(row["db_ms"]):>8} {row["errors"]:>7}'
+            )
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+"""Версионированный API: /api/v1/, документация — /api/v1/docs"""
+from ninja import NinjaAPI
+
+from inventory.api import router as inventory_router
+from inventory.renderers import ORJSONRenderer
+
+api = NinjaAPI(
+    title='Домашний инвентарь API',
+    version='1',
+    urls_namespace='api-v1',
+    renderer=ORJSONRenderer(),
+)
+api.add_router('', inventory_router)
@@ -0,0 +1,37 @@
+"""PostgreSQL-бэкенд Django с пулом соединений (DB_POOL=worker).
+
+Django с CONN_MAX_AGE=0 «подключается» в начале запроса и «закрывает»
+соединение в конце; здесь подключение берёт готовое соединение из пула
+процесса, а закрытие возвращает его туда. Настройки — в ключе POOL
+словаря DATABASES, см. config/db/pool.py.
+"""
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from django.utils.asyncio import async_unsafe
+
+from config.db.creation import DatabaseCreation
+from config.db.pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    _pool = None
+
+    def get_new_connection(self, conn_params):
+        def connect():
+            return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+        self._pool = get_pool(conn_params, self.settings_dict.get('POOL'), connect)
+        connection = self._pool.checkout()
+        # У нового соединения это делает родительский метод, у взятого из пула — мы
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        return connection
+
+    @async_unsafe
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self._pool.checkin(self.connection)
@@ -0,0 +1,10 @@
+from django.db.backends.postgresql import creation
+
+from config.db.pool import close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # DROP DATABASE не пройдёт, пока в пуле висят соединения к ней
+        close_pools(dbname=test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,186 @@
+"""Пул соединений PostgreSQL внутри процесса.
+
+Пул ограничен SIZE соединениями; если все заняты, checkout ждёт до TIMEOUT
+секунд. Соединения, простоявшие без дела дольше MAX_IDLE или прожившие
+дольше MAX_LIFETIME, закрываются. Перед выдачей соединение, простоявшее
+дольше PING_AFTER, проверяется запросом SELECT 1 — так оборванные прокси
+сессии не доходят до приложения.
+"""
+import os
+import threading
+import time
+from collections import Counter
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+
+DEFAULTS = {
+    'SIZE': 4,
+    'TIMEOUT': 10,
+    'MAX_IDLE': 300,
+    'MAX_LIFETIME': 1800,
+    'PING_AFTER': 5,
+}
+
+
+class PoolExhausted(psycopg2.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, size, timeout, max_idle, max_lifetime, ping_after):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        self._idle = []        # (соединение, когда создано, когда вернули) — стек, свежие сверху
+        self._created = {}     # id(соединения) -> когда создано
+        self._total = 0        # открыто всего: в пуле и на руках
+        self.pid = os.getpid()
+        self.counters = Counter()
+
+    def checkout(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            entry = None
+            with self._cond:
+                while self._idle and entry is None:
+                    conn, created, released = self._idle.pop()
+                    now = time.monotonic()
+                    if now - released > self.max_idle or now - created > self.max_lifetime:
+                        self._discard(conn)
+                        self.counters['recycled'] += 1
+                    else:
+                        entry = conn, released
+                if entry is None:
+                    if self._total >= self.size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.counters['timeouts'] += 1
+                            raise PoolExhausted(
+                                f'Все {self.size} соединений пула заняты дольше {self.timeout} с'
+                            )
+                        self._cond.wait(remaining)
+                        continue
+                    self._total += 1
+
+            if entry is not None:
+                conn, released = entry
+                if self._healthy(conn, released):
+                    self.counters['reused'] += 1
+                    return conn
+                with self._cond:
+                    self._discard(conn)
+                self.counters['broken'] += 1
+                continue
+
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                    self._cond.notify()
+                raise
+            self._created[id(conn)] = time.monotonic()
+            self.counters['connected'] += 1
+            return conn
+
+    def checkin(self, conn):
+        """Вернуть соединение; незавершённая транзакция откатывается"""
+        if not conn.closed and conn.info.transaction_status not in (TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN):
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        with self._cond:
+            if (
+                conn.closed
+                or os.getpid() != self.pid
+                or conn.info.transaction_status != TRANSACTION_STATUS_IDLE
+            ):
+                self._discard(conn)
+            else:
+                self._idle.append((conn, self._created.get(id(conn), 0), time.monotonic()))
+            self._cond.notify()
+
+    def _healthy(self, conn, released):
+        if conn.closed:
+            return False
+        if time.monotonic() - released < self.ping_after:
+            return True
+        self.counters['pings'] += 1
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _discard(self, conn):
+        # Вызывается под self._cond
+        self._total -= 1
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def close_idle(self):
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._total,
+                'idle': len(self._idle),
+                **self.counters,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_key(conn_params):
+    return tuple(sorted((name, str(value)) for name, value in conn_params.items()))
+
+
+def get_pool(conn_params, options, connect):
+    """Пул для этих параметров подключения; после fork создаётся заново"""
+    key = _pool_key(conn_params)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            settings = {**DEFAULTS, **(options or {})}
+            pool = _pools[key] = ConnectionPool(
+                connect,
+                size=int(settings['SIZE']),
+                timeout=float(settings['TIMEOUT']),
+                max_idle=float(settings['MAX_IDLE']),
+                max_lifetime=float(settings['MAX_LIFETIME']),
+                ping_after=float(settings['PING_AFTER']),
+            )
+        return pool
+
+
+def close_pools(dbname=None):
+    """Закрыть свободные соединения всех пулов (или только к базе dbname)"""
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if dbname is None or ('dbname', dbname) in key]
+    for pool in pools:
+        pool.close_idle()
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {dict(key).get('dbname', '?'): pool.stats() for key, pool in pools}
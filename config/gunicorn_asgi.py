@@ -0,0 +1,32 @@
+"""Профиль запуска под ASGI: gunicorn управляет процессами, uvicorn их обслуживает.
+
+    gunicorn -c config/gunicorn_asgi.py config.asgi:application
+
+Для разработки без gunicorn хватит одного uvicorn:
+
+    uvicorn config.asgi:application --reload
+
+Асинхронные представления (список, карточка, поиск, чтение API) ждут БД и
+кэш, не занимая воркер, поэтому одного-двух процессов на ядро достаточно.
+Синхронный ORM под ASGI работает в отдельном потоке на каждый запрос, так что
+CONN_MAX_AGE здесь не помогает — соединения держит пул DB_POOL=worker.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+
+# Длинные выгрузки отдаются потоком, воркер при этом не блокируется
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Перезапуск воркеров ограничивает рост памяти от фрагментации
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
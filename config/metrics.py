@@ -0,0 +1,348 @@
+"""Метрики производительности: Server-Timing на каждый ответ и /metrics для Prometheus.
+
+ServerTimingMiddleware (config/middleware.py) меряет для каждого запроса
+полное время, число и время SQL-запросов, время рендера шаблонов и
+попадания в кэш (inventory.cache) и складывает их в гистограммы по
+представлениям.
+
+Гистограммы живут в памяти процесса; фоновый поток раз в
+METRICS_FLUSH_INTERVAL секунд сбрасывает их в METRICS_DIR/<pid>-<метка
+запуска>.json — атомарной заменой файла (метка нужна, потому что pid в
+контейнере переиспользуются), так что запрос и цикл событий ASGI на диск
+не ходят. Без METRICS_DIR файлы не пишутся, а /metrics показывает только
+свой процесс — так идут тесты (config/test_runner.py). /metrics
+суммирует файлы всех воркеров gunicorn на машине; файлы завершившихся
+процессов (их перезапускает max_requests) вливаются в archive.json, чтобы
+счётчики не убывали, а каталог не рос.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends import django as django_backend
+from django.utils.crypto import constant_time_compare
+
+from config.db.pool import pool_stats
+
+logger = logging.getLogger('config.metrics')
+
+# Верхние границы корзин, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ARCHIVE = 'archive.json'
+PROCESS_FILE = re.compile(r'(\d+)-\d+\.json$')
+
+HELP = {
+    'http_request_duration_seconds': ('histogram', 'Полное время обработки запроса'),
+    'http_request_db_seconds': ('histogram', 'Время SQL-запросов за один HTTP-запрос'),
+    'http_responses_total': ('counter', 'Ответы по представлениям и классам статусов'),
+    'db_queries_total': ('counter', 'SQL-запросы'),
+    'template_render_seconds_total': ('counter', 'Время рендера шаблонов'),
+    'cache_requests_total': ('counter', 'Обращения к двухуровневому кэшу по результату'),
+    'db_pool_connections': ('gauge', 'Соединения пулов PostgreSQL живых воркеров'),
+}
+
+# Сбор по текущему запросу: его видят обёртка шаблонов и SQL в потоках sync_to_async
+current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.templates = 0.0
+        # Вложенные рендеры (виджеты форм, render_to_string в тегах) уже внутри внешнего
+        self.rendering = 0
+        self.cache = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        """execute_wrapper для соединений: считает SQL-запросы и их время"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self, total):
+        hits = self.cache['local_hits'] + self.cache['shared_hits']
+        parts = [
+            f'app;dur={total * 1000:.1f}',
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} SQL"',
+        ]
+        if self.templates:
+            parts.append(f'tpl;dur={self.templates * 1000:.1f}')
+        if hits or self.cache['misses']:
+            parts.append(f'cache;desc="{hits} hit, {self.cache["misses"]} miss"')
+        return ', '.join(parts)
+
+
+def _series(name, **labels):
+    if not labels:
+        return name
+    # Значения меток — имена представлений и методы, экранировать нечего, кроме кавычек
+    body = ','.join(f'{key}="{str(value).replace(chr(34), "")}"' for key, value in sorted(labels.items()))
+    return f'{name}{{{body}}}'
+
+
+class Registry:
+    """Счётчики и гистограммы процесса; после fork начинаются с нуля"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Потоки не переживают fork — у каждого процесса свой поток сброса
+        self.flusher_pid = None
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.filename = f'{self.pid}-{time.time_ns()}.json'
+        self.counters = Counter()
+        # серия -> [счёт по корзинам..., +Inf] , сумма
+        self.histograms = {}
+
+    def _check_fork(self):
+        if self.pid != os.getpid():
+            self._reset()
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._check_fork()
+            self.counters[_series(name, **labels)] += amount
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            self._check_fork()
+            series = _series(name, **labels)
+            entry = self.histograms.get(series)
+            if entry is None:
+                entry = self.histograms[series] = [[0] * (len(BUCKETS) + 1), 0.0]
+            index = next((i for i, bound in enumerate(BUCKETS) if value <= bound), len(BUCKETS))
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                'counters': dict(self.counters),
+                'histograms': {series: [list(counts), total] for series, (counts, total) in self.histograms.items()},
+            }
+
+    def flush(self):
+        """Пишет снимок в файл процесса в METRICS_DIR"""
+        if not settings.METRICS_DIR:
+            return
+        snapshot = self.snapshot()
+        if not snapshot['counters'] and not snapshot['histograms']:
+            return
+        snapshot['gauges'] = _pool_gauges()
+        _write_json(Path(settings.METRICS_DIR) / self.filename, snapshot)
+
+    def start_flusher(self):
+        """Запускает в текущем процессе поток, который сбрасывает метрики по таймеру"""
+        pid = os.getpid()
+        if self.flusher_pid == pid:
+            return
+        with self._lock:
+            if self.flusher_pid == pid:
+                return
+            self.flusher_pid = pid
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось сбросить метрики в %s', settings.METRICS_DIR)
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def _pool_gauges():
+    return {
+        _series('db_pool_connections', database=database, state=state): stats[state]
+        for database, stats in pool_stats().items()
+        for state in ('open', 'idle')
+    }
+
+
+def _write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _read_json(path):
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(total, snapshot, gauges=True):
+    for series, value in snapshot.get('counters', {}).items():
+        total['counters'][series] = total['counters'].get(series, 0) + value
+    for series, (counts, value) in snapshot.get('histograms', {}).items():
+        entry = total['histograms'].setdefault(series, [[0] * len(counts), 0.0])
+        entry[0] = [a + b for a, b in zip(entry[0], counts)]
+        entry[1] += value
+    if gauges:
+        for series, value in snapshot.get('gauges', {}).items():
+            total['gauges'][series] = total['gauges'].get(series, 0) + value
+
+
+def collect():
+    """Сумма метрик всех процессов: живые — из их файлов, завершившиеся — из архива"""
+    if not settings.METRICS_DIR:
+        total = registry.snapshot()
+        total['gauges'] = _pool_gauges()
+        return total
+    registry.flush()
+    directory = Path(settings.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    total = {'counters': {}, 'histograms': {}, 'gauges': {}}
+    with open(directory / '.lock', 'w') as lock:
+        # Два одновременных сбора не должны влить файл мёртвого воркера в архив дважды
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = _read_json(directory / ARCHIVE) or {'counters': {}, 'histograms': {}, 'gauges': {}}
+        archived = False
+        for path in directory.glob('*.json'):
+            match = PROCESS_FILE.match(path.name)
+            if match is None:
+                continue
+            snapshot = _read_json(path)
+            if snapshot is None:
+                continue
+            if _alive(int(match.group(1))):
+                _merge(total, snapshot)
+            else:
+                # Показания пулов умершего процесса уже неверны, счётчики — навсегда
+                _merge(archive, snapshot, gauges=False)
+                path.unlink()
+                archived = True
+        if archived:
+            _write_json(directory / ARCHIVE, archive)
+    _merge(total, archive, gauges=False)
+    return total
+
+
+def _split(series):
+    match = re.match(r'([^{]+)(?:\{(.*)\})?$', series)
+    return match.group(1), match.group(2) or ''
+
+
+def render_prometheus(metrics):
+    """Текстовый формат Prometheus 0.0.4"""
+    by_name = {}
+    for kind in ('counters', 'gauges'):
+        for series, value in metrics[kind].items():
+            name, labels = _split(series)
+            by_name.setdefault(name, []).append(f'{series} {value}')
+    for series, (counts, value) in metrics['histograms'].items():
+        name, labels = _split(series)
+        prefix = f'{labels},' if labels else ''
+        lines = by_name.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip([*BUCKETS, '+Inf'], counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {value}')
+        lines.append(f'{name}_count{suffix} {cumulative}')
+
+    output = []
+    for name in sorted(by_name):
+        kind, description = HELP.get(name, ('untyped', ''))
+        output.append(f'# HELP {name} {description}')
+        output.append(f'# TYPE {name} {kind}')
+        output.extend(sorted(by_name[name]))
+    return '\n'.join(output) + '\n'
+
+
+def record(request, response, timings, total):
+    """Итоги запроса — в гистограммы и счётчики; медленные запросы — в лог"""
+    match = getattr(request, 'resolver_match', None)
+    # Метка — имя маршрута, а не путь: иначе по серии на каждый id
+    view = match.view_name if match else 'other'
+    status = f'{response.status_code // 100}xx'
+    registry.observe('http_request_duration_seconds', total, view=view, method=request.method)
+    registry.observe('http_request_db_seconds', timings.db, view=view)
+    registry.inc('http_responses_total', view=view, status=status)
+    if timings.queries:
+        registry.inc('db_queries_total', timings.queries, view=view)
+    if timings.templates:
+        registry.inc('template_render_seconds_total', timings.templates, view=view)
+    for result, count in timings.cache.items():
+        registry.inc('cache_requests_total', count, result=result)
+    registry.start_flusher()
+
+    if total * 1000 >= settings.SLOW_REQUEST_MS:
+        logger.warning(
+            'Медленный запрос %s %s: %.0f мс, SQL %d за %.0f мс, шаблоны %.0f мс',
+            request.method, request.path, total * 1000, timings.queries, timings.db * 1000, timings.templates * 1000,
+        )
+
+
+_original_render = django_backend.Template.render
+
+
+def _timed_render(self, context=None, request=None):
+    timings = current.get()
+    if timings is None or timings.rendering:
+        return _original_render(self, context, request)
+    timings.rendering += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        timings.templates += time.perf_counter() - started
+        timings.rendering -= 1
+
+
+def instrument_templates():
+    """Время рендера шаблонов: render()/render_to_string входят через шаблон бэкенда;
+    {% include %} рендерится мимо него, а вложенные вызовы (виджеты форм) не считаются дважды"""
+    django_backend.Template.render = _timed_render
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus: с METRICS_TOKEN — по Bearer-токену, без него — только персоналу"""
+    token = settings.METRICS_TOKEN
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden('Нужен токен метрик')
+    elif not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden('Только для персонала')
+    return HttpResponse(render_prometheus(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,111 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from config import metrics
+from inventory.cache import request_counters
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, который не переводит цепочку middleware в синхронный режим.
+
+    WhiteNoise 6 умеет только синхронный вызов, и под ASGI Django из-за него
+    выполнял бы асинхронные представления через async_to_sync в потоке.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Открытие файла — блокирующая операция
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class ServerTimingMiddleware:
+    """Server-Timing на каждый ответ и гистограммы для /metrics (см. config/metrics.py).
+
+    Стоит первым: время включает остальные middleware. SQL считается
+    execute_wrapper'ом на соединениях потока, где работает ORM: под ASGI это
+    поток sync_to_async, поэтому обёртки ставятся там же. Время потоковых
+    ответов — до первого байта.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics.instrument_templates()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = metrics.RequestTimings()
+        tokens = self.bind(timings)
+        wrappers = self.wrap(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.unwrap(wrappers)
+            self.unbind(tokens)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = metrics.RequestTimings()
+        # Контекст копируется в потоки sync_to_async — шаблоны и кэш пишут туда же
+        tokens = self.bind(timings)
+        wrappers = await sync_to_async(self.wrap)(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self.unwrap)(wrappers)
+            self.unbind(tokens)
+        return self.finish(request, response, timings)
+
+    @staticmethod
+    def bind(timings):
+        return metrics.current.set(timings), request_counters.set(timings.cache)
+
+    @staticmethod
+    def unbind(tokens):
+        metrics.current.reset(tokens[0])
+        request_counters.reset(tokens[1])
+
+    @staticmethod
+    def wrap(timings):
+        wrappers = [connections[alias].execute_wrapper(timings.execute) for alias in connections]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        return wrappers
+
+    @staticmethod
+    def unwrap(wrappers):
+        for wrapper in reversed(wrappers):
+            wrapper.__exit__(None, None, None)
+
+    @staticmethod
+    def finish(request, response, timings):
+        total = time.perf_counter() - timings.started
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = timings.server_timing(total)
+        metrics.record(request, response, timings, total)
+        return response
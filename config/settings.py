@@ -19,6 +19,9 @@ allowed_hosts_env = os.environ.get('ALLOWED_HOSTS', '')
 if allowed_hosts_env:
     ALLOWED_HOSTS.extend(host.strip() for host in allowed_hosts_env.split(',') if host.strip())
 
+# Публичный адрес сайта — зашивается в QR-коды вещей
+SITE_URL = os.environ.get('SITE_URL', 'http://127.0.0.1:8000')
+
 CSRF_TRUSTED_ORIGINS = [
     'https://*.railway.app',
     'https://homeinventory-production-8d91.up.railway.app'
@@ -34,6 +37,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",  # поиск: tsvector и триграммы
     
     # Твои приложения
     "inventory.apps.InventoryConfig",
@@ -44,8 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "config.middleware.ServerTimingMiddleware",  # Первым: меряет всю обработку
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # Сразу после Security
+    "config.middleware.AsyncWhiteNoiseMiddleware",  # Сразу после Security
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -65,11 +70,21 @@ if DEBUG and not IS_RAILWAY:
     except ImportError:
         pass
 
+# Предупреждения о превышении бюджета SQL-запросов и N+1 (см. inventory/middleware.py)
+QUERY_BUDGET_REPEAT_LIMIT = 3
+if DEBUG or os.environ.get('QUERY_BUDGET', '').lower() == 'true':
+    MIDDLEWARE.append("inventory.middleware.QueryBudgetMiddleware")
+
 ROOT_URLCONF = "config.urls"
 WSGI_APPLICATION = "config.wsgi.application"
 
 # 6. Database (Исправлено для устранения 499)
 DATABASE_URL = os.environ.get('DATABASE_URL')
+# Пул соединений PostgreSQL:
+#   worker — свой пул в каждом процессе (config/db), по умолчанию;
+#   shared — общий внешний пул PgBouncer в режиме transaction (postgres/pgbouncer.ini);
+#   off    — новое соединение на каждый запрос.
+DB_POOL = os.environ.get('DB_POOL', 'worker').lower()
 if DATABASE_URL:
     DATABASES = {
         'default': dj_database_url.config(
@@ -79,6 +94,22 @@ if DATABASE_URL:
             ssl_require=False        # Railway проксирует SSL сам
         )
     }
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+        if DB_POOL == 'worker':
+            # Соединение возвращается в пул в конце запроса, а не закрывается
+            DATABASES['default']['ENGINE'] = 'config.db'
+            DATABASES['default']['POOL'] = {
+                'SIZE': int(os.environ.get('DB_POOL_SIZE', 4)),
+                'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                'MAX_IDLE': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+                'MAX_LIFETIME': float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+                'PING_AFTER': float(os.environ.get('DB_POOL_PING_AFTER', 5)),
+            }
+        elif DB_POOL == 'shared':
+            # До PgBouncer на той же машине держим соединение, а серверные
+            # курсоры (.iterator()) в режиме transaction не работают
+            DATABASES['default']['CONN_MAX_AGE'] = 60
+            DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
 else:
     DATABASES = {
         'default': {
@@ -87,6 +118,17 @@ else:
         }
     }
 
+# Нечёткий поиск по триграммам (нужно расширение pg_trgm, см. postgres/init.sql);
+# если расширения в базе нет, поиск обходится без него
+SEARCH_TRIGRAM = os.environ.get('SEARCH_TRIGRAM', 'True').lower() == 'true'
+
+# Сколько карточек на одной странице списка вещей
+ITEMS_PAGE_SIZE = int(os.environ.get('ITEMS_PAGE_SIZE', 24))
+
+# Подсказки поиска: как часто (сек) перестраивать индекс в памяти процесса,
+# чтобы подхватить записи других воркеров и массовых импортов
+SUGGEST_INDEX_TTL = int(os.environ.get('SUGGEST_INDEX_TTL', 600))
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -110,7 +152,48 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', BASE_DIR / 'media'))
+
+# QR-коды рендерятся по запросу и кэшируются на диске по хэшу содержимого
+QR_CACHE_DIR = Path(os.environ.get('QR_CACHE_DIR', BASE_DIR / 'cache' / 'qr'))
+QR_CACHE_MAX_FILES = int(os.environ.get('QR_CACHE_MAX_FILES', 20000))
+QR_CACHE_MAX_AGE = 60 * 60 * 24 * 30
+
+# Превью фото для srcset (см. inventory/thumbnails.py); строятся в фоновом пуле потоков,
+# THUMBNAIL_WORKERS=0 — прямо при сохранении
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+
+# Очередь фоновых задач на таблице БД (inventory/jobs.py, manage.py run_workers)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+# Пауза перед первым повтором упавшей задачи, дальше удваивается
+JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 10))
+# Задача, которая выполняется дольше, считается брошенной и возвращается в очередь
+JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 600))
+
+# Сохранять QR-код файлом в Item.qr_code для новых вещей — задачей в очереди
+QR_CODE_FILES = os.environ.get('QR_CODE_FILES', 'False').lower() == 'true'
+
+# Листы наклеек с QR-кодами в PDF (inventory/labels.py, manage.py print_labels):
+# сетка «колонки x строки» на A4, LABEL_FONT — TTF с кириллицей (пусто — найти DejaVu Sans)
+LABEL_GRID = os.environ.get('LABEL_GRID', '3x8')
+LABEL_DPI = int(os.environ.get('LABEL_DPI', 300))
+LABEL_FONT = os.environ.get('LABEL_FONT', '')
+LABEL_WORKERS = int(os.environ.get('LABEL_WORKERS', 2))
+
+# Метрики (config/metrics.py): заголовок Server-Timing и /metrics для Prometheus.
+# Гистограммы воркеров сходятся через файлы в METRICS_DIR — каталог общий для всех
+# процессов на машине; METRICS_DIR = None — файлов нет, /metrics видит только свой
+# процесс. Без METRICS_TOKEN /metrics открыт только персоналу.
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'True').lower() == 'true'
+METRICS_DIR = Path(os.environ.get('METRICS_DIR', BASE_DIR / 'cache' / 'metrics'))
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Запросы дольше этого пишутся в лог config.metrics
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 1000))
+# Тесты идут без METRICS_DIR, чтобы не писать метрики в каталог проекта
+TEST_RUNNER = 'config.test_runner.TestRunner'
 
 # 9. Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -134,12 +217,28 @@ TIME_ZONE = 'Europe/Moscow'
 USE_I18N = True
 USE_TZ = True
 
-# 11. Кэш (DummyCache для избежания ошибок подключения)
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+# 11. Кэш: общий уровень — SQLite-файл на машине или Redis (нужен пакет redis),
+# перед ним LRU в памяти процесса (inventory/cache.py)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'inventory.cache.SQLiteCache',
+            'LOCATION': os.environ.get('CACHE_PATH', BASE_DIR / 'cache' / 'shared.sqlite3'),
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+CACHE_TIMEOUT = int(os.environ.get('CACHE_TIMEOUT', 60 * 60))
+CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', 2000))
+# Через сколько секунд процесс видит инвалидацию, сделанную соседним воркером
+CACHE_VERSION_TTL = float(os.environ.get('CACHE_VERSION_TTL', 2))
 
 # 12. Security (Production)
 if not DEBUG:
@@ -155,8 +254,11 @@ if not DEBUG:
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(process)d %(name)s: %(message)s'},
+    },
     'handlers': {
-        'console': {'class': 'logging.StreamHandler'},
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
     },
     'root': {
         'handlers': ['console'],
@@ -167,7 +269,8 @@ LOGGING = {
 # 14. Подавление системных проверок
 SILENCED_SYSTEM_CHECKS = [
     "security.W004", "security.W008", "security.W012", "security.W016",
-    "django_ratelimit.E003", "django_ratelimit.W001"
+    # SQLiteCache общий для процессов и с атомарным incr, но ratelimit знает только memcached/django-redis
+    "django_ratelimit.W001",
 ]
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
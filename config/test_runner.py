@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """Тесты не пишут файлы метрик в каталог проекта: METRICS_DIR задают только тесты метрик"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Не восстанавливаем: сброс при выходе (atexit) идёт уже после teardown
+        settings.METRICS_DIR = None
@@ -11,31 +11,20 @@ from django.conf.urls.static import static
 from django.http import JsonResponse
 from django.views.generic import RedirectView
 
-# Временная заглушка для API
-def api_documentation(request):
-    """Документация API (временно отключено)"""
-    return JsonResponse({
-        'status': 'success',
-        'message': 'Домашний инвентарь API',
-        'version': '1.0.0',
-        'description': 'API временно отключено для настройки Railway',
-        'endpoints': {
-            'home': '/',
-            'scanner': '/scanner/',
-            'export': '/export/',
-            'item_detail': '/item/{id}/',
-            'search': '/search/?q=query',
-            'admin': f'/{settings.ADMIN_URL}/'
-        }
-    })
+from config.api import api
+from config.metrics import metrics_view
 
 def admin_search(request):
     """Поиск для админки"""
     return JsonResponse({'results': []})
 
 urlpatterns = [
-    # API заглушка
-    path('api/', api_documentation, name='api-root'),
+    # API
+    path('api/', RedirectView.as_view(url='/api/v1/docs', permanent=False), name='api-root'),
+    path('api/v1/', api.urls),
+
+    # Метрики для Prometheus
+    path('metrics', metrics_view, name='metrics'),
     
     # Админка
     path('admin/search/', admin_search, name='admin_search'),
@@ -1,51 +1,100 @@
 # inventory/admin.py
-from django.contrib import admin
-from django.contrib.admin import display
+import tempfile
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import display, helpers
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.shortcuts import redirect, render
+from django.utils import timezone
 from django.utils.html import format_html
-from django.http import HttpResponse
 from unfold.admin import ModelAdmin  # ВАЖНО: используем ModelAdmin от Unfold
-from inventory.models import Item
+from unfold.decorators import action
+from inventory.exporting import is_asgi, streaming_export
+from inventory.importing import detect_format, import_items
+from inventory.labels import GRIDS, layout_from_settings, streaming_labels
+from inventory.models import Item, Job, Stocktake
+from inventory.search import apply_search
 from categories.models import Category
 from locations.models import Location
 
 
-# Экспорт CSV как действие
+# Экспорт как действия — потоковый, общий модуль с сайтом
 def export_to_csv(modeladmin, request, queryset):
-    import csv
-    response = HttpResponse(content_type='text/csv; charset=utf-8-sig')
-    response['Content-Disposition'] = 'attachment; filename="inventory_export.csv"'
+    return streaming_export(queryset, 'csv', filename='inventory_export', asynchronous=is_asgi(request))
 
-    writer = csv.writer(response, delimiter=';')
-    writer.writerow(['Название', 'Категория', 'Место', 'Цена', 'Дата'])
 
-    for item in queryset:
-        writer.writerow([
-            item.name,
-            item.category.name if item.category else '-',
-            item.location.name if item.location else '-',
-            item.price or 0,
-            item.purchase_date or '-'
-        ])
+export_to_csv.short_description = '📥 Экспортировать в CSV'
 
-    return response
 
+def export_to_ndjson(modeladmin, request, queryset):
+    return streaming_export(queryset, 'ndjson', filename='inventory_export', asynchronous=is_asgi(request))
+
+
+export_to_ndjson.short_description = '📥 Экспортировать в NDJSON'
+
+
+class PrintLabelsForm(forms.Form):
+    grid = forms.ChoiceField(label='Сетка на листе A4 (колонки x строки)')
+    skip = forms.IntegerField(label='Уже использовано наклеек на первом листе', min_value=0, initial=0)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['grid'].choices = [(grid, grid) for grid in sorted({*GRIDS, settings.LABEL_GRID})]
+        self.fields['grid'].initial = settings.LABEL_GRID
 
-export_to_csv.short_description = '📥 Экспортировать в CSV'
+
+def print_labels(modeladmin, request, queryset):
+    """Наклейки с QR-кодами в PDF: сначала форма с сеткой, затем поток листов"""
+    form = PrintLabelsForm(request.POST if 'apply' in request.POST else None)
+    if form.is_valid():
+        return streaming_labels(
+            queryset.order_by('pk'),
+            layout_from_settings(form.cleaned_data['grid']),
+            skip=form.cleaned_data['skip'],
+            filename=f'labels-{timezone.now():%Y%m%d-%H%M%S}',
+            asynchronous=is_asgi(request),
+        )
+    select_across = request.POST.get('select_across') == '1'
+    return render(request, 'admin/inventory/item/print_labels.html', {
+        **modeladmin.admin_site.each_context(request),
+        'title': 'Печать наклеек',
+        'form': form,
+        'count': queryset.count(),
+        'select_across': select_across,
+        # При «выбрать все» вещи заново отберут фильтры из адреса страницы
+        'selected': [] if select_across else request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+    })
+
+
+print_labels.short_description = '🏷️ Напечатать наклейки с QR-кодами'
+
+
+class ImportItemsForm(forms.Form):
+    file = forms.FileField(label='Файл CSV или NDJSON')
 
 
 # Кастомная админка для Item
 @admin.register(Item)
 class ItemAdmin(ModelAdmin):  # Наследуется от unfold.admin.ModelAdmin
-    list_display = ['name', 'category', 'location', 'price_preview', 'qr_preview', 'created_at']
+    list_display = ['photo_preview', 'name', 'category', 'location', 'price_preview', 'qr_preview', 'created_at']
+    list_select_related = ['category', 'location']
     list_filter = ['category', 'location', 'created_at']
     search_fields = ['name', 'description']
-    readonly_fields = ['qr_preview_large']
-    actions = [export_to_csv]
+    readonly_fields = ['photo_preview_large', 'qr_preview_large']
+    actions = [export_to_csv, export_to_ndjson, print_labels]
+    actions_list = ['import_items']
 
     def has_delete_permission(self, request, obj=None):
         """Разрешить удаление"""
         return True
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск через тот же индекс, что и на сайте"""
+        return apply_search(queryset, search_term), False
+
     def get_actions(self, request):
         """Кастомизация действий"""
         actions = super().get_actions(request)
@@ -53,15 +102,67 @@ class ItemAdmin(ModelAdmin):  # Наследуется от unfold.admin.ModelAd
             actions['delete_selected'][0].short_description = '🗑️ Удалить выбранные вещи'
         return actions
 
-    @display(description='QR')
-    def qr_preview(self, obj):
-        if obj.qr_code:
+    @action(description='📤 Импорт из файла', url_path='import-items', permissions=['add'])
+    def import_items(self, request):
+        """Загрузка CSV/NDJSON через тот же конвейер, что и manage.py import_items"""
+        form = ImportItemsForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            with tempfile.TemporaryFile('w+', newline='', encoding='utf-8') as report:
+                stats = import_items(upload.file, fmt=detect_format(upload.name), report=report)
+                if stats.errors:
+                    report.seek(0)
+                    report_name = default_storage.save(
+                        f'imports/errors-{timezone.now():%Y%m%d-%H%M%S}.csv',
+                        ContentFile(report.read().encode('utf-8')),
+                    )
+                    messages.warning(request, format_html(
+                        'Строк с ошибками: {}. <a href="{}">Скачать отчёт</a>',
+                        stats.errors,
+                        default_storage.url(report_name),
+                    ))
+            messages.success(
+                request,
+                f'Импортировано {stats.imported} из {stats.rows} строк '
+                f'за {stats.elapsed:.1f} с ({stats.rate:.0f} строк/с)',
+            )
+            return redirect('admin:inventory_item_changelist')
+
+        return render(request, 'admin/inventory/item/import_items.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Импорт вещей',
+            'form': form,
+        })
+
+    @staticmethod
+    def _photo(obj, sizes, style):
+        # Превью через srcset, пока их нет — оригинал; всё с отложенной загрузкой
+        sources = obj.photo_sources
+        if sources:
             return format_html(
-                '<img src="{}" style="width: 40px; height: 40px;" />',
-                obj.qr_code.url
+                '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+                '<img src="{}" srcset="{}" sizes="{}" loading="lazy" decoding="async" style="{}" /></picture>',
+                sources['webp'], sizes, sources['src'], sources['jpeg'], sizes, style,
             )
+        if obj.photo:
+            return format_html('<img src="{}" loading="lazy" decoding="async" style="{}" />', obj.photo.url, style)
         return '-'
 
+    @display(description='Фото')
+    def photo_preview(self, obj):
+        return self._photo(obj, '40px', 'width: 40px; height: 40px; object-fit: cover;')
+
+    @display(description='Фото')
+    def photo_preview_large(self, obj):
+        return self._photo(obj, '300px', 'max-width: 300px;')
+
+    @display(description='QR')
+    def qr_preview(self, obj):
+        return format_html(
+            '<img src="{}" loading="lazy" style="width: 40px; height: 40px;" />',
+            obj.qr_url
+        )
+
     @display(description='Цена')
     def price_preview(self, obj):
         if obj.price:
@@ -69,18 +170,46 @@ class ItemAdmin(ModelAdmin):  # Наследуется от unfold.admin.ModelAd
         return '-'
 
     def qr_preview_large(self, obj):
-        if obj.qr_code:
+        if obj.pk:
             return format_html(
                 '<img src="{}" style="max-width: 300px;" /><br>'
-                '<a href="{}" download class="btn">Скачать QR</a>',
-                obj.qr_code.url,
-                obj.qr_code.url
+                '<a href="{}" download class="btn">Скачать QR</a> '
+                '<a href="{}" download class="btn">SVG</a>',
+                obj.qr_url,
+                obj.qr_url,
+                obj.get_qr_url('svg')
             )
-        return 'QR-код не сгенерирован'
+        return 'QR-код появится после сохранения'
 
     qr_preview_large.short_description = 'QR-код'
 
 
+@admin.register(Job)
+class JobAdmin(ModelAdmin):
+    list_display = ['id', 'task', 'status', 'priority', 'attempts', 'worker', 'created_at', 'finished_at']
+    list_filter = ['status', 'task']
+    readonly_fields = [field.name for field in Job._meta.fields]
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='🔁 Поставить в очередь заново')
+    def retry_jobs(self, request, queryset):
+        count = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(), error='', finished_at=None,
+        )
+        messages.success(request, f'В очередь поставлено задач: {count}')
+
+
+@admin.register(Stocktake)
+class StocktakeAdmin(ModelAdmin):
+    list_display = ['id', 'location', 'status', 'note', 'started_at', 'closed_at']
+    list_filter = ['status']
+    list_select_related = ['location']
+    readonly_fields = ['status', 'started_at', 'closed_at', 'summary']
+
+
 # Регистрация остальных моделей
 @admin.register(Category)
 class CategoryAdmin(ModelAdmin):
@@ -92,7 +221,9 @@ class CategoryAdmin(ModelAdmin):
 
 @admin.register(Location)
 class LocationAdmin(ModelAdmin):
-    list_display = ['name']
+    list_display = ['name', 'parent']
+    list_select_related = ['parent']
+    search_fields = ['name']
 
     def has_delete_permission(self, request, obj=None):
         return True
\ No newline at end of file
@@ -1,10 +1,35 @@
-from ninja import Router, Schema
-from typing import List, Optional
-from django.shortcuts import get_object_or_404
-from django.db import models  # Правильный импорт
+import hashlib
 
-from inventory.models import Item
+from asgiref.sync import sync_to_async
+from ninja import Field, Router, Schema
+from ninja.errors import HttpError
+from ninja.security import django_auth_is_staff
+from datetime import date, datetime
+from typing import Any, List, Optional
+from django.http import Http404
+from django.db import transaction
+from django.urls import reverse
+
+from inventory import jobs, rollups
+from inventory.bulk import (
+    BULK_MAX_IDS, DELETED, EDITABLE_FIELDS, MOVED, UPDATED,
+    delete_items, missing_references, move_items, update_items,
+)
+from inventory.cache import tiered_cache
+from inventory.conditional import acollection_validators, anamespace_validators, not_modified, set_validators
+from inventory.middleware import query_budget
+from inventory.exporting import FORMATS
+from inventory.facets import afacets
+from inventory.models import Item, Job, Stocktake
+from inventory.renderers import dumps, json_response
+from inventory.search import apply_search
+from inventory.stocktake import (
+    RECONCILE_LIMIT, SCAN_MAX_CODES, StocktakeClosed, close, reconcile, record_scans, resolve_codes,
+)
+from inventory.suggest import suggest_index
+from inventory.tasks import EXPORT_TASK
 from categories.models import Category
+from locations import tree
 from locations.models import Location
 
 router = Router()
@@ -20,6 +45,7 @@ class ItemSchema(Schema):
     price: Optional[float] = None
     photo_url: Optional[str] = None
     qr_code_url: Optional[str] = None
+    updated_at: Optional[datetime] = None
 
 
 class ItemCreateSchema(Schema):
@@ -30,32 +56,159 @@ class ItemCreateSchema(Schema):
     price: Optional[float] = None
 
 
-# Поиск
-@router.get("/search", response=List[ItemSchema])
-def search_items(request, q: str = ""):
-    items = Item.objects.filter(
-        models.Q(name__icontains=q) | models.Q(description__icontains=q)
-    )[:20]
-
-    return [
-        {
-            "id": item.id,
-            "name": item.name,
-            "description": item.description,
-            "category": item.category.name if item.category else None,
-            "location": item.location.name if item.location else None,
-            "price": float(item.price) if item.price else None,
-            "photo_url": item.photo.url if item.photo else None,
-            "qr_code_url": item.qr_code.url if item.qr_code else None,
-        }
-        for item in items
-    ]
+class ItemBulkCreateSchema(Schema):
+    items: List[ItemCreateSchema]
 
 
-# Получить по ID
-@router.get("{item_id}", response=ItemSchema)
-def get_item(request, item_id: int):
-    item = get_object_or_404(Item, id=item_id)
+class ItemBulkCreateResultSchema(Schema):
+    created: int
+    ids: List[int]
+
+
+class ItemPatchSchema(Schema):
+    # Меняются только переданные поля; null — очистить поле (у описания — пустая строка).
+    # Длину названия и цену проверяет update_items: ошибка — в результате строки, а не 422
+    id: int
+    name: Optional[str] = None
+    description: Optional[str] = None
+    category_id: Optional[int] = None
+    location_id: Optional[int] = None
+    price: Optional[float] = None
+    purchase_date: Optional[date] = None
+
+
+class ItemBulkUpdateSchema(Schema):
+    items: List[ItemPatchSchema] = Field(..., max_length=BULK_MAX_IDS)
+
+
+class ItemMoveSchema(Schema):
+    ids: List[int] = Field(..., max_length=BULK_MAX_IDS)
+    location_id: Optional[int] = None
+
+
+class ItemIdsSchema(Schema):
+    ids: List[int] = Field(..., max_length=BULK_MAX_IDS)
+
+
+class BulkResultSchema(Schema):
+    id: int
+    status: str
+    error: Optional[str] = None
+
+
+class BulkResponseSchema(Schema):
+    # Сколько вещей изменено; статус каждой — в results, в порядке запроса
+    count: int
+    results: List[BulkResultSchema]
+
+
+class JobSchema(Schema):
+    id: int
+    task: str
+    status: str
+    priority: int
+    attempts: int
+    max_attempts: int
+    result: Optional[Any] = None
+    error: str = ""
+    created_at: datetime
+    run_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class LocationSchema(Schema):
+    id: int
+    name: str
+    parent_id: Optional[int] = None
+    # По всей ветке: само место и всё, что в нём
+    items: int
+    value: float
+
+
+class FacetSchema(Schema):
+    id: int
+    name: str
+    count: int
+
+
+class LocationFacetSchema(FacetSchema):
+    parent_id: Optional[int] = None
+
+
+class FacetsSchema(Schema):
+    # Вещей под поиском и обоими фильтрами
+    total: int
+    # С учётом фильтра по месту
+    categories: List[FacetSchema]
+    # С учётом фильтра по категории, по всей ветке
+    locations: List[LocationFacetSchema]
+
+
+class ScanCodesSchema(Schema):
+    # Содержимое QR-кодов (адреса страниц вещей) или id
+    codes: List[str] = Field(..., max_length=SCAN_MAX_CODES)
+
+
+class ItemRefSchema(Schema):
+    id: int
+    name: str
+    location_id: Optional[int] = None
+    location: Optional[str] = None
+
+
+class ScanItemSchema(ItemRefSchema):
+    code: str
+
+
+class ScanResolveSchema(Schema):
+    items: List[ScanItemSchema]
+    # Коды, по которым вещь не нашлась
+    unknown: List[str]
+
+
+class StocktakeCreateSchema(Schema):
+    location_id: int
+    note: str = ""
+
+
+class StocktakeSchema(Schema):
+    id: int
+    location_id: int
+    status: str
+    note: str = ""
+    started_at: datetime
+    closed_at: Optional[datetime] = None
+    summary: Optional[Any] = None
+
+
+class ReconcileSchema(Schema):
+    # Вещей, которые числятся в месте (с вложенными)
+    expected: int
+    scanned: int
+    found: int
+    missing_count: int
+    misplaced_count: int
+    missing: List[ItemRefSchema]
+    # Найдены здесь, а числятся в другом месте
+    misplaced: List[ItemRefSchema]
+
+
+class StocktakeCloseSchema(Schema):
+    move_misplaced: bool = False
+
+
+class ExportJobSchema(Schema):
+    format: str = "csv"
+    gzip: bool = True
+    q: str = ""
+
+
+# Сколько строк уходит в один INSERT при массовом создании
+BULK_CREATE_BATCH_SIZE = 1000
+
+
+def _serialize_item(item):
     return {
         "id": item.id,
         "name": item.name,
@@ -64,45 +217,301 @@ def get_item(request, item_id: int):
         "location": item.location.name if item.location else None,
         "price": float(item.price) if item.price else None,
         "photo_url": item.photo.url if item.photo else None,
-        "qr_code_url": item.qr_code.url if item.qr_code else None,
+        "qr_code_url": item.qr_url,
+        "updated_at": item.updated_at,
     }
 
 
-# Создать вещь
-@router.post("/", response=ItemSchema)
-def create_item(request, data: ItemCreateSchema):
-    category = Category.objects.filter(id=data.category_id).first() if data.category_id else None
-    location = Location.objects.filter(id=data.location_id).first() if data.location_id else None
+def _price(value):
+    return float(value) if value else None
+
+
+def _photo_url(name):
+    return Item._meta.get_field("photo").storage.url(name) if name else None
+
+
+def _qr_url(pk):
+    return reverse('inventory:item-qr', kwargs={'pk': pk})
 
-    item = Item.objects.create(
+
+# Чтение идёт через values(): поле ответа -> (колонка, преобразование значения).
+# Категория и место приходят JOIN-ом, и только если их спросили.
+ITEM_FIELDS = {
+    "id": ("id", None),
+    "name": ("name", None),
+    "description": ("description", None),
+    "category": ("category__name", None),
+    "location": ("location__name", None),
+    "price": ("price", _price),
+    "photo_url": ("photo", _photo_url),
+    "qr_code_url": ("id", _qr_url),
+    "updated_at": ("updated_at", None),
+}
+
+
+def parse_fields(fields):
+    """?fields=name,price -> кортеж полей в порядке ITEM_FIELDS; id отдаётся всегда"""
+    if not fields:
+        return tuple(ITEM_FIELDS)
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - ITEM_FIELDS.keys()
+    if unknown:
+        raise HttpError(400, f'Неизвестные поля: {", ".join(sorted(unknown))}')
+    requested.add("id")
+    return tuple(name for name in ITEM_FIELDS if name in requested)
+
+
+def project_items(queryset, fields, *extra):
+    columns = {ITEM_FIELDS[name][0] for name in fields}.union(extra)
+    return queryset.values(*sorted(columns))
+
+
+def item_row(row, fields):
+    result = {}
+    for name in fields:
+        column, convert = ITEM_FIELDS[name]
+        value = row[column]
+        result[name] = convert(value) if convert is not None else value
+    return result
+
+
+def _resolve_refs(rows):
+    """Один запрос на категории и один на места для всей пачки"""
+    category_ids = {row.category_id for row in rows if row.category_id}
+    location_ids = {row.location_id for row in rows if row.location_id}
+    categories = Category.objects.in_bulk(category_ids) if category_ids else {}
+    locations = Location.objects.in_bulk(location_ids) if location_ids else {}
+    return categories, locations
+
+
+def _build_item(data, categories, locations):
+    # Несуществующие id превращаются в None, как и раньше при .first()
+    return Item(
         name=data.name,
         description=data.description,
-        category=category,
-        location=location,
+        category=categories.get(data.category_id),
+        location=locations.get(data.location_id),
         price=data.price,
     )
 
-    item.generate_qr_code()
-    item.save(update_fields=['qr_code'])
+
+# Поиск
+@router.get("/search", response=List[ItemSchema])
+@query_budget(2)
+async def search_items(request, q: str = "", category: Optional[int] = None, location: Optional[int] = None,
+                       fields: Optional[str] = None):
+    fields = parse_fields(fields)
+    etag, last_modified = await acollection_validators()
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+
+    async def search():
+        # apply_search один раз за процесс проверяет схему БД — синхронно
+        queryset = await sync_to_async(apply_search)(Item.objects.all(), q)
+        if category is not None:
+            queryset = queryset.filter(category_id=category)
+        if location is not None:
+            queryset = queryset.filter(tree.subtree_q(location))
+        return dumps([item_row(row, fields) async for row in project_items(queryset[:20], fields)])
+
+    # Любое изменение вещей сбрасывает все закэшированные выдачи
+    key = f'api-search:{hashlib.md5(q.encode()).hexdigest()}:{category}:{location}:{",".join(fields)}'
+    content = await tiered_cache.aget_or_set(key, search, namespaces=['items', 'refs'])
+    return set_validators(json_response(content), etag, last_modified)
+
+
+# Счётчики по категориям и местам для поиска и фильтров — один групповой запрос
+@router.get("/facets", response=FacetsSchema)
+@query_budget(3)
+async def item_facets(request, q: str = "", category: Optional[int] = None, location: Optional[int] = None):
+    etag, last_modified = await acollection_validators()
+    unchanged = not_modified(request, etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+    facets = await afacets(q, category, location)
+    return set_validators(json_response(dumps(facets)), etag, last_modified)
+
+
+# Получить по ID
+@router.get("/{int:item_id}", response=ItemSchema)
+@query_budget(1)
+async def get_item(request, item_id: int, fields: Optional[str] = None):
+    fields = parse_fields(fields)
+
+    async def load():
+        row = await project_items(Item.objects.filter(id=item_id), fields, "updated_at").afirst()
+        if row is None:
+            raise Http404('Вещь не найдена')
+        return {"content": dumps(item_row(row, fields)), "updated_at": row["updated_at"]}
+
+    namespaces = [f'item:{item_id}', 'refs']
+    page = await tiered_cache.aget_or_set(f'api-item:{item_id}:{",".join(fields)}', load, namespaces=namespaces)
+    etag, _ = await anamespace_validators(namespaces)
+    unchanged = not_modified(request, etag, page["updated_at"])
+    if unchanged is not None:
+        return unchanged
+    return set_validators(json_response(page["content"]), etag, page["updated_at"])
+
+
+# Создать вещь: один INSERT, QR-код рендерится по запросу. Запись — только для персонала
+@router.post("/", response=ItemSchema, auth=django_auth_is_staff)
+@query_budget(6)
+def create_item(request, data: ItemCreateSchema):
+    categories, locations = _resolve_refs([data])
+    item = _build_item(data, categories, locations)
+    item.save()
+    return _serialize_item(item)
+
+
+# Массовое создание: все строки одной транзакцией через bulk_create
+@router.post("/items/bulk", response=ItemBulkCreateResultSchema, auth=django_auth_is_staff)
+def bulk_create_items(request, data: ItemBulkCreateSchema):
+    categories, locations = _resolve_refs(data.items)
+    items = [_build_item(row, categories, locations) for row in data.items]
+
+    with transaction.atomic():
+        created = Item.objects.bulk_create(items, batch_size=BULK_CREATE_BATCH_SIZE)
+        rollups.apply_deltas(rollups.item_deltas(item.rollup_state() for item in created))
+    # bulk_create не шлёт post_save — индекс подсказок перестроится сам
+    suggest_index.invalidate()
+    tiered_cache.bump('items')
 
     return {
-        "id": item.id,
-        "name": item.name,
-        "description": item.description,
-        "category": item.category.name if item.category else None,
-        "location": item.location.name if item.location else None,
-        "price": float(item.price) if item.price else None,
-        "photo_url": None,
-        "qr_code_url": item.qr_code.url,
+        "created": len(created),
+        "ids": [item.pk for item in created],
     }
 
 
-# Статистика
-@router.get("/stats")
-def get_stats(request):
+def _bulk_response(results, status):
     return {
-        "total_items": Item.objects.count(),
-        "total_value": Item.objects.aggregate(total=models.Sum('price'))['total'] or 0,
-        "categories_count": Category.objects.count(),
-        "locations_count": Location.objects.count(),
-    }
\ No newline at end of file
+        "count": sum(1 for result in results if result["status"] == status),
+        "results": results,
+    }
+
+
+# Массовая правка: каждая строка меняет только переданные поля
+@router.patch("/items/bulk", response=BulkResponseSchema, auth=django_auth_is_staff)
+def bulk_update_items(request, data: ItemBulkUpdateSchema):
+    changes = {}
+    for row in data.items:
+        # Повтор id — поля складываются, более поздние значения главнее
+        changes.setdefault(row.id, {}).update(
+            (name, getattr(row, name)) for name in row.model_fields_set & set(EDITABLE_FIELDS)
+        )
+    return _bulk_response(update_items(changes), UPDATED)
+
+
+# Перенести вещи в одно место (location_id: null — «без места»)
+@router.post("/items/move", response=BulkResponseSchema, auth=django_auth_is_staff)
+def move_items_to_location(request, data: ItemMoveSchema):
+    if missing_references(location_ids=[data.location_id])[Location]:
+        raise HttpError(404, f'Нет места {data.location_id}')
+    return _bulk_response(move_items(data.ids, data.location_id), MOVED)
+
+
+@router.delete("/items/bulk", response=BulkResponseSchema, auth=django_auth_is_staff)
+def bulk_delete_items(request, data: ItemIdsSchema):
+    return _bulk_response(delete_items(data.ids), DELETED)
+
+
+# Дерево мест с итогами по веткам — из сводок, без подсчёта вещей
+@router.get("/locations", response=List[LocationSchema])
+@query_budget(3)
+def list_locations(request):
+    def build():
+        totals = rollups.location_tree_totals()
+        return dumps([
+            {
+                "id": pk,
+                "name": name,
+                "parent_id": parent_id,
+                "items": totals[pk][0],
+                "value": float(totals[pk][1]),
+            }
+            for pk, name, parent_id in Location.objects.order_by('name').values_list('pk', 'name', 'parent_id')
+        ])
+
+    return json_response(tiered_cache.get_or_set('api-locations', build, namespaces=['items', 'refs']))
+
+
+# Статистика: читается из сводок, а не считается по таблицам
+@router.get("/stats")
+@query_budget(1)
+async def get_stats(request):
+    return await rollups.atotals()
+
+
+# Фоновые задачи: статус по id и последние задачи
+@router.get("/jobs/{int:job_id}", response=JobSchema, auth=django_auth_is_staff)
+def get_job(request, job_id: int):
+    job = Job.objects.filter(pk=job_id).first()
+    if job is None:
+        raise Http404('Задача не найдена')
+    return job
+
+
+@router.get("/jobs", response=List[JobSchema], auth=django_auth_is_staff)
+def list_jobs(request, status: Optional[str] = None, task: Optional[str] = None, limit: int = 50):
+    queryset = Job.objects.all()
+    if status:
+        queryset = queryset.filter(status=status)
+    if task:
+        queryset = queryset.filter(task=task)
+    return queryset[:min(max(limit, 1), 200)]
+
+
+# Сканер: пачка кодов -> короткие записи вещей одним запросом
+@router.post("/scan/resolve", response=ScanResolveSchema)
+@query_budget(1)
+def scan_resolve(request, data: ScanCodesSchema):
+    return resolve_codes(data.codes)
+
+
+# Инвентаризация места: сканы пачками, сверка — разностями множеств в БД
+def _get_stocktake(stocktake_id):
+    stocktake = Stocktake.objects.filter(pk=stocktake_id).first()
+    if stocktake is None:
+        raise Http404('Инвентаризация не найдена')
+    return stocktake
+
+
+@router.post("/stocktakes", response={201: StocktakeSchema}, auth=django_auth_is_staff)
+def create_stocktake(request, data: StocktakeCreateSchema):
+    if not Location.objects.filter(pk=data.location_id).exists():
+        raise HttpError(400, f'Нет места {data.location_id}')
+    return 201, Stocktake.objects.create(location_id=data.location_id, note=data.note)
+
+
+@router.get("/stocktakes/{int:stocktake_id}", response=StocktakeSchema, auth=django_auth_is_staff)
+def get_stocktake(request, stocktake_id: int):
+    return _get_stocktake(stocktake_id)
+
+
+@router.post("/stocktakes/{int:stocktake_id}/scans", response=ScanResolveSchema, auth=django_auth_is_staff)
+def stocktake_scans(request, stocktake_id: int, data: ScanCodesSchema):
+    try:
+        return record_scans(_get_stocktake(stocktake_id), data.codes)
+    except StocktakeClosed as e:
+        raise HttpError(409, str(e))
+
+
+@router.get("/stocktakes/{int:stocktake_id}/reconcile", response=ReconcileSchema, auth=django_auth_is_staff)
+def stocktake_reconcile(request, stocktake_id: int, limit: int = RECONCILE_LIMIT):
+    return reconcile(_get_stocktake(stocktake_id), limit=min(max(limit, 0), RECONCILE_LIMIT))
+
+
+@router.post("/stocktakes/{int:stocktake_id}/close", response=StocktakeSchema, auth=django_auth_is_staff)
+def close_stocktake(request, stocktake_id: int, data: StocktakeCloseSchema):
+    try:
+        return close(_get_stocktake(stocktake_id), move_misplaced=data.move_misplaced)
+    except StocktakeClosed as e:
+        raise HttpError(409, str(e))
+
+
+# Выгрузка в файл в фоне: статус и адрес файла — в GET /jobs/{id}
+@router.post("/exports", response={202: JobSchema}, auth=django_auth_is_staff)
+def create_export(request, data: ExportJobSchema):
+    if data.format not in FORMATS:
+        raise HttpError(400, 'Неизвестный формат выгрузки')
+    return 202, jobs.enqueue(EXPORT_TASK, {"fmt": data.format, "compress": data.gzip, "q": data.q})
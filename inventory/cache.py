@@ -0,0 +1,364 @@
+"""Двухуровневый кэш: LRU в памяти процесса перед общим бэкендом.
+
+Общий уровень — django-кэш 'default': SQLiteCache (файл на диске, общий для
+всех воркеров на машине) или Redis, если задан REDIS_URL. Ключи
+версионируются по пространствам имён: сигналы моделей увеличивают версию, и
+старые записи просто перестают читаться — искать и удалять их не нужно.
+
+Версии пространств тоже кэшируются в процессе, но только на
+CACHE_VERSION_TTL секунд: так изменения из соседних воркеров видны с
+задержкой не больше этого времени, а собственные — сразу.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+MISSING = object()
+
+# Counter попаданий и промахов внутри одного HTTP-запроса; задаёт middleware метрик
+request_counters = ContextVar('tiered_cache_request_counters', default=None)
+
+
+def _versioned_key(name, namespaces, versions):
+    return ':'.join([name, *(f'{namespace}={versions[namespace]}' for namespace in namespaces)])
+
+
+class SQLiteCache(BaseCache):
+    """Общий для процессов кэш в одном файле SQLite (WAL).
+
+    Целые числа хранятся как есть, поэтому incr атомарен (один UPDATE) и
+    годится для django_ratelimit. Остальные значения — pickle.
+    """
+
+    # Чистим устаревшие записи раз в столько вызовов set/add
+    CULL_EVERY = 200
+    MAX_PARAMS = 900
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = Path(location)
+        self._local = threading.local()
+        self._writes = 0
+
+    def _db(self):
+        # Своё соединение на поток и на процесс (после fork старое не годится)
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    @staticmethod
+    def _dump(value):
+        return value if type(value) is int else pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(raw):
+        return raw if isinstance(raw, int) else pickle.loads(raw)
+
+    def _expires(self, timeout):
+        # None — бессрочно; 0 и отрицательные — уже истекло
+        return self.get_backend_timeout(timeout)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._db().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else self._load(row[0])
+
+    def get_many(self, keys, version=None):
+        # У SQLite нет ограничений memcached на ключи — проверка тут лишняя
+        made = {self.make_key(key, version=version): key for key in keys}
+        made_keys, now, result = list(made), time.time(), {}
+        # Кусками: у старых сборок SQLite не больше 999 параметров на запрос
+        for start in range(0, len(made_keys), self.MAX_PARAMS):
+            chunk = made_keys[start:start + self.MAX_PARAMS]
+            rows = self._db().execute(
+                f'SELECT key, value FROM cache WHERE key IN ({", ".join("?" * len(chunk))}) '
+                'AND (expires IS NULL OR expires > ?)',
+                (*chunk, now),
+            )
+            result.update((made[key], self._load(raw)) for key, raw in rows)
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._db().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, self._dump(value), self._expires(timeout)),
+        )
+        self._maybe_cull()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        rows = [
+            (self.make_key(key, version=version), self._dump(value), expires)
+            for key, value in data.items()
+        ]
+        db = self._db()
+        # Одна транзакция на все ключи, а не по одной на каждый
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', rows)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        self._maybe_cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        # Вставляем или перезаписываем только истёкшую запись — одной командой
+        cursor = self._db().execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, self._dump(value), self._expires(timeout), time.time()),
+        )
+        self._maybe_cull()
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._db().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self._expires(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        made = self.make_and_validate_key(key, version=version)
+        row = self._db().execute(
+            'UPDATE cache SET value = value + ? '
+            "WHERE key = ? AND (expires IS NULL OR expires > ?) AND typeof(value) = 'integer' "
+            'RETURNING value',
+            (delta, made, time.time()),
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        return row[0]
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._db().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def has_key(self, key, version=None):
+        return self.get(key, MISSING, version=version) is not MISSING
+
+    def clear(self):
+        self._db().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живёт весь процесс: закрывать его на каждый запрос дорого
+        pass
+
+    def _maybe_cull(self):
+        self._writes += 1
+        if self._writes % self.CULL_EVERY:
+            return
+        db = self._db()
+        db.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            # Как и у встроенных бэкендов: выбрасываем 1/CULL_FREQUENCY, раньше всех истекающие
+            db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,),
+            )
+
+
+class TieredCache:
+    """LRU в памяти процесса поверх общего кэша с версиями по пространствам имён"""
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # ключ -> (истекает, значение)
+        self._versions = {}             # пространство -> (истекает, (версия, изменено))
+        self.counters = Counter()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    # --- версии ---
+
+    @staticmethod
+    def _version_key(namespace):
+        return f'ns:{namespace}'
+
+    @staticmethod
+    def _changed_key(namespace):
+        return f'ns-at:{namespace}'
+
+    def namespace_state(self, namespaces):
+        """Пространство -> (версия, время последнего изменения)"""
+        now = time.monotonic()
+        result, missing = {}, []
+        with self._lock:
+            for namespace in namespaces:
+                cached = self._versions.get(namespace)
+                if cached and cached[0] > now:
+                    result[namespace] = cached[1]
+                else:
+                    missing.append(namespace)
+        if missing:
+            keys = [self._version_key(namespace) for namespace in missing]
+            keys += [self._changed_key(namespace) for namespace in missing]
+            found = self.shared.get_many(keys)
+            for namespace in missing:
+                version = found.get(self._version_key(namespace))
+                if version is None:
+                    # Версия от времени: после потери ключа старые записи не оживут
+                    self.shared.add(self._version_key(namespace), time.time_ns() // 1000, timeout=None)
+                    version = self.shared.get(self._version_key(namespace))
+                changed_at = found.get(self._changed_key(namespace))
+                if changed_at is None:
+                    changed_at = time.time()
+                    self.shared.add(self._changed_key(namespace), changed_at, timeout=None)
+                result[namespace] = (version, changed_at)
+            expires = now + settings.CACHE_VERSION_TTL
+            with self._lock:
+                self._versions.update((namespace, (expires, result[namespace])) for namespace in missing)
+        return result
+
+    def versions(self, namespaces):
+        return {namespace: state[0] for namespace, state in self.namespace_state(namespaces).items()}
+
+    def bump(self, *namespaces):
+        """Сделать все записи этих пространств устаревшими.
+
+        Два обращения к общему кэшу при любом числе пространств: массовые
+        изменения сбрасывают тысячи item:<pk> разом. Новая версия — не меньше
+        текущего времени в микросекундах: без incr два параллельных сброса
+        совпадут, только если прочитали одну версию в одну микросекунду.
+        """
+        if not namespaces:
+            return
+        changed_at, now = time.time(), time.time_ns() // 1000
+        keys = [self._version_key(namespace) for namespace in namespaces]
+        current = self.shared.get_many(keys)
+        values = {key: max(current.get(key, 0) + 1, now) for key in keys}
+        values.update((self._changed_key(namespace), changed_at) for namespace in namespaces)
+        self.shared.set_many(values, timeout=None)
+        with self._lock:
+            for namespace in namespaces:
+                self._versions.pop(namespace, None)
+        self._count('bumps', len(namespaces))
+
+    def _count(self, name, amount=1):
+        self.counters[name] += amount
+        # Счётчики текущего запроса — для Server-Timing (config/metrics.py)
+        current = request_counters.get()
+        if current is not None:
+            current[name] += amount
+
+    def make_key(self, name, namespaces=()):
+        return _versioned_key(name, namespaces, self.versions(namespaces))
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count('local_hits')
+                return entry[1]
+        return MISSING
+
+    def _local_set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.CACHE_LOCAL_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, name, build, namespaces=(), timeout=None):
+        """Значение из памяти, из общего кэша или build() — по порядку"""
+        timeout = settings.CACHE_TIMEOUT if timeout is None else timeout
+        key = self.make_key(name, namespaces)
+        value = self._local_get(key)
+        if value is not MISSING:
+            return value
+
+        value = self.shared.get(key, MISSING)
+        if value is MISSING:
+            self._count('misses')
+            value = build()
+            self.shared.set(key, value, timeout)
+        else:
+            self._count('shared_hits')
+        self._local_set(key, value, timeout)
+        return value
+
+    # --- то же для асинхронных представлений ---
+
+    async def anamespace_state(self, namespaces):
+        # Если все версии уже есть в памяти — без похода в поток
+        now = time.monotonic()
+        with self._lock:
+            cached = [self._versions.get(namespace) for namespace in namespaces]
+        if all(entry and entry[0] > now for entry in cached):
+            return {namespace: entry[1] for namespace, entry in zip(namespaces, cached)}
+        return await sync_to_async(self.namespace_state)(namespaces)
+
+    async def aget_or_set(self, name, build, namespaces=(), timeout=None):
+        """Как get_or_set, но build — корутина; общий кэш опрашивается в потоке"""
+        timeout = settings.CACHE_TIMEOUT if timeout is None else timeout
+        state = await self.anamespace_state(namespaces)
+        key = _versioned_key(name, namespaces, {namespace: state[namespace][0] for namespace in namespaces})
+        value = self._local_get(key)
+        if value is not MISSING:
+            return value
+
+        value = await self.shared.aget(key, MISSING)
+        if value is MISSING:
+            self._count('misses')
+            value = await build()
+            await self.shared.aset(key, value, timeout)
+        else:
+            self._count('shared_hits')
+        self._local_set(key, value, timeout)
+        return value
+
+    def clear(self):
+        """Очистить оба уровня (для тестов и после восстановления из бэкапа)"""
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self.counters.clear()
+        self.shared.clear()
+
+    def stats(self):
+        hits = self.counters['local_hits'] + self.counters['shared_hits']
+        lookups = hits + self.counters['misses']
+        return {
+            **{name: self.counters[name] for name in ('local_hits', 'shared_hits', 'misses', 'bumps')},
+            'hit_ratio': round(hits / lookups, 3) if lookups else None,
+            'local_entries': len(self._entries),
+            'backend': type(self.shared).__name__,
+        }
+
+
+tiered_cache = TieredCache()
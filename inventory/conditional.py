@@ -0,0 +1,65 @@
+"""Условные GET: ETag и Last-Modified, ответ 304 без рендеринга.
+
+Для одной вещи Last-Modified — её updated_at. Для списков валидатор дешёвый:
+версии пространств кэша 'items' и 'refs' (см. inventory/cache.py), которые
+растут при любом изменении вещей, категорий и мест. Поэтому 304 отдаётся до
+единого запроса к БД.
+"""
+import hashlib
+from datetime import datetime
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from inventory.cache import tiered_cache
+
+COLLECTION_NAMESPACES = ('items', 'refs')
+
+
+def _validators(namespaces, state):
+    versions = ';'.join(f'{namespace}={state[namespace][0]}' for namespace in namespaces)
+    etag = quote_etag(hashlib.md5(versions.encode()).hexdigest()[:20])
+    return etag, max(changed_at for _, changed_at in state.values())
+
+
+def namespace_validators(namespaces):
+    """(ETag, Last-Modified) по версиям пространств кэша"""
+    return _validators(namespaces, tiered_cache.namespace_state(namespaces))
+
+
+async def anamespace_validators(namespaces):
+    return _validators(namespaces, await tiered_cache.anamespace_state(namespaces))
+
+
+def collection_validators():
+    return namespace_validators(COLLECTION_NAMESPACES)
+
+
+async def acollection_validators():
+    return await anamespace_validators(COLLECTION_NAMESPACES)
+
+
+def _timestamp(last_modified):
+    if last_modified is None:
+        return None
+    if isinstance(last_modified, datetime):
+        last_modified = last_modified.timestamp()
+    return int(last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    timestamp = _timestamp(last_modified)
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # Хранить можно, но перед показом — перепроверить
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """Готовый ответ 304 (или 412), если клиенту хватит своей копии, иначе None"""
+    response = get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
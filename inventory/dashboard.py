@@ -1,5 +1,4 @@
 from django.contrib.admin.sites import AdminSite
-from django.db.models import Count, Sum
 from django.shortcuts import redirect, render
 from django.urls import path
 from django.http import HttpRequest
@@ -18,18 +17,20 @@ class CustomAdminSite(AdminSite):
         return custom_urls + urls
 
     def dashboard_view(self, request: HttpRequest):
-        from inventory.models import Item
+        from inventory import rollups
+        from inventory.models import InventoryRollup, Item
         from categories.models import Category
         from locations.models import Location
 
-        stats = {
-            'total_items': Item.objects.count(),
-            'total_value': Item.objects.aggregate(total=Sum('price'))['total'] or 0,
-            'locations_count': Location.objects.count(),
-            'categories_count': Category.objects.count(),
-            'recent_items': Item.objects.order_by('-created_at')[:5],
+        # Итоги берутся из заранее посчитанных сводок, а не из COUNT/SUM по таблице вещей
+        context = {
+            **self.each_context(request),
+            'stats': rollups.totals(),
+            'top_categories': rollups.top_rollups(InventoryRollup.CATEGORY, Category),
+            'top_locations': rollups.top_rollups(InventoryRollup.LOCATION, Location),
+            'recent_items': Item.objects.order_by('-created_at', '-id')[:5],
         }
-        return render(request, 'admin/dashboard.html', stats)
+        return render(request, 'admin/dashboard.html', context)
 
 
 admin_site = CustomAdminSite(name='custom_admin')
\ No newline at end of file
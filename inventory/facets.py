@@ -0,0 +1,115 @@
+"""Фасеты списка вещей: сколько вещей в каждой категории и каждом месте при
+текущем поиске и фильтрах.
+
+Все счётчики дают один запрос GROUP BY (category_id, location_id) по вещам,
+подходящим под поиск: категории считаются с учётом фильтра по месту, места —
+с учётом фильтра по категории (свой фильтр фасет не сужает — иначе соседние
+значки всегда показывали бы ноль). Счётчик места включает всё, что лежит
+внутри него; дерево мест берётся из закэшированного справочника, без запросов.
+
+Результат кэшируется по отпечатку фильтров и сбрасывается вместе с вещами и
+справочниками.
+"""
+import hashlib
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.db.models import Count
+
+from categories.models import Category
+from inventory.cache import tiered_cache
+from inventory.models import Item
+from inventory.search import apply_search, normalize_query
+from locations.models import Location
+
+
+async def areferences():
+    """Категории и места для фильтров — из кэша, сбрасывается при их изменении"""
+    async def build():
+        return {
+            'categories': [row async for row in Category.objects.values('id', 'name')],
+            'locations': [row async for row in Location.objects.order_by('name').values('id', 'name', 'parent_id')],
+        }
+
+    # :2 — в записи есть parent_id мест, старые записи общего кэша не подходят
+    return await tiered_cache.aget_or_set('sidebar:2', build, namespaces=['refs'])
+
+
+def parse_id(value):
+    """id из GET-параметра; мусор — как отсутствие фильтра"""
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def fingerprint(q='', category=None, location=None):
+    key = orjson.dumps([normalize_query(q).lower(), category, location])
+    return hashlib.md5(key).hexdigest()
+
+
+def _subtree(locations, pk):
+    """pk и все вложенные в него места по списку {'id', 'parent_id'}"""
+    children = {}
+    for row in locations:
+        children.setdefault(row['parent_id'], []).append(row['id'])
+    found, stack = set(), [pk]
+    while stack:
+        node = stack.pop()
+        if node not in found:
+            found.add(node)
+            stack.extend(children.get(node, ()))
+    return found
+
+
+def count_facets(pairs, references, category=None, location=None):
+    """Счётчики из строк (category_id, location_id, количество) группового запроса"""
+    locations = references['locations']
+    parents = {row['id']: row['parent_id'] for row in locations}
+    in_location = _subtree(locations, location) if location is not None else None
+
+    total = 0
+    by_category = {}
+    by_location = {}
+    for category_id, location_id, count in pairs:
+        location_matches = in_location is None or location_id in in_location
+        category_matches = category is None or category_id == category
+        if location_matches and category_matches:
+            total += count
+        if location_matches and category_id is not None:
+            by_category[category_id] = by_category.get(category_id, 0) + count
+        if category_matches:
+            # Вещь в коробке считается и в стеллаже, и в гараже
+            node, hops = location_id, 0
+            while node is not None and hops <= len(parents):
+                by_location[node] = by_location.get(node, 0) + count
+                node, hops = parents.get(node), hops + 1
+
+    return {
+        'total': total,
+        'categories': [
+            {'id': row['id'], 'name': row['name'], 'count': by_category.get(row['id'], 0)}
+            for row in references['categories']
+        ],
+        'locations': [
+            {'id': row['id'], 'name': row['name'], 'parent_id': row['parent_id'], 'count': by_location.get(row['id'], 0)}
+            for row in locations
+        ],
+    }
+
+
+async def afacets(q='', category=None, location=None):
+    """Фасеты для поиска q и фильтров; не больше одного запроса к вещам (и двух к справочникам)"""
+    references = await areferences()
+
+    async def build():
+        items = Item.objects.all()
+        if normalize_query(q):
+            # apply_search один раз за процесс проверяет схему БД — синхронно
+            items = await sync_to_async(apply_search)(items, q)
+        grouped = items.order_by().values_list('category_id', 'location_id').annotate(count=Count('pk'))
+        return count_facets([row async for row in grouped], references, category, location)
+
+    return await tiered_cache.aget_or_set(
+        f'facets:{fingerprint(q, category, location)}', build, namespaces=['items', 'refs'],
+    )
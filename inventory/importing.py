@@ -0,0 +1,324 @@
+"""Потоковый импорт вещей из CSV/NDJSON.
+
+Файл читается построчно, строки проверяются и копятся пачками. Категории и
+места ищутся по имени в словаре в памяти, недостающие создаются одним
+bulk_create на пачку. На PostgreSQL пачка уходит через COPY, на остальных
+базах — через bulk_create.
+"""
+import csv
+import io
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from categories.models import Category
+from inventory import rollups
+from inventory.cache import tiered_cache
+from inventory.models import InventoryRollup, Item
+from inventory.suggest import suggest_index
+from locations.models import Location
+
+DEFAULT_BATCH_SIZE = 5000
+# Строк в одном INSERT у bulk_create (не на PostgreSQL)
+BULK_CREATE_BATCH_SIZE = 1000
+
+# Заголовки нашей же выгрузки и их английские варианты
+COLUMN_ALIASES = {
+    'название': 'name',
+    'name': 'name',
+    'описание': 'description',
+    'description': 'description',
+    'категория': 'category',
+    'category': 'category',
+    'место': 'location',
+    'location': 'location',
+    'цена': 'price',
+    'price': 'price',
+    'дата покупки': 'purchase_date',
+    'дата': 'purchase_date',
+    'purchase_date': 'purchase_date',
+}
+
+# Так выгрузка обозначает пустые значения
+EMPTY_VALUES = ('', '-', '—')
+
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y')
+
+COPY_COLUMNS = (
+    'name', 'description', 'category_id', 'location_id',
+    'price', 'purchase_date', 'qr_code', 'photo_thumbs', 'created_at', 'updated_at',
+)
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.errors = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0
+
+
+def detect_format(filename):
+    return 'ndjson' if filename.lower().endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def iter_records(stream, fmt):
+    """Генератор (номер строки, словарь) по бинарному потоку"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'ndjson':
+            yield from _iter_ndjson(text)
+        else:
+            yield from _iter_csv(text)
+    finally:
+        text.detach()
+
+
+def _iter_csv(text):
+    header_line = text.readline()
+    if not header_line:
+        return
+    delimiter = ';' if header_line.count(';') >= header_line.count(',') else ','
+    header = next(csv.reader([header_line], delimiter=delimiter))
+    keys = [COLUMN_ALIASES.get(column.strip().lower()) for column in header]
+
+    reader = csv.reader(text, delimiter=delimiter)
+    for values in reader:
+        if not any(values):
+            continue
+        # +1 за строку заголовка, которую мы прочитали сами
+        yield reader.line_num + 1, {
+            key: value for key, value in zip(keys, values) if key
+        }
+
+
+def _iter_ndjson(text):
+    for line_no, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            raw = json.loads(line)
+        except ValueError:
+            yield line_no, {'__error__': 'Некорректный JSON'}
+            continue
+        if not isinstance(raw, dict):
+            yield line_no, {'__error__': 'Ожидался JSON-объект'}
+            continue
+        yield line_no, {
+            COLUMN_ALIASES[key.lower()]: value
+            for key, value in raw.items()
+            if isinstance(key, str) and key.lower() in COLUMN_ALIASES
+        }
+
+
+def _text(raw, key, max_length=None):
+    value = raw.get(key)
+    value = '' if value is None else str(value).strip()
+    if value in EMPTY_VALUES:
+        return ''
+    if max_length and len(value) > max_length:
+        raise ImportRowError(f'{key}: длиннее {max_length} символов')
+    return value
+
+
+def clean_row(raw):
+    """Проверяет строку и приводит её к полям Item; бросает ImportRowError"""
+    if '__error__' in raw:
+        raise ImportRowError(raw['__error__'])
+
+    name = _text(raw, 'name', Item._meta.get_field('name').max_length)
+    if not name:
+        raise ImportRowError('name: обязательное поле')
+
+    price = _text(raw, 'price').replace(' ', '').replace(',', '.')
+    if price:
+        try:
+            price = Decimal(price).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ImportRowError(f'price: не число ({price})')
+        if price.adjusted() >= 8:
+            raise ImportRowError('price: слишком большое значение')
+    else:
+        price = None
+
+    purchase_date = _text(raw, 'purchase_date')
+    if purchase_date:
+        for date_format in DATE_FORMATS:
+            try:
+                purchase_date = datetime.strptime(purchase_date, date_format).date()
+                break
+            except ValueError:
+                continue
+        if not isinstance(purchase_date, date):
+            raise ImportRowError(f'purchase_date: неизвестный формат ({purchase_date})')
+    else:
+        purchase_date = None
+
+    return {
+        'name': name,
+        'description': _text(raw, 'description'),
+        'category': _text(raw, 'category', Category._meta.get_field('name').max_length),
+        'location': _text(raw, 'location', Location._meta.get_field('name').max_length),
+        'price': price,
+        'purchase_date': purchase_date,
+    }
+
+
+class NameResolver:
+    """Имя -> id для категорий или мест, недостающие создаются пачкой"""
+
+    def __init__(self, model, rollup_scope):
+        self.model = model
+        self.rollup_scope = rollup_scope
+        self.ids = {}
+        # При дублях имён побеждает самая старая запись
+        for pk, name in model.objects.order_by('-pk').values_list('pk', 'name').iterator():
+            self.ids[name] = pk
+
+    def resolve(self, names):
+        missing = sorted({name for name in names if name and name not in self.ids})
+        if not missing:
+            return
+        created = self.model.objects.bulk_create([self.model(name=name) for name in missing])
+        rollups.apply_deltas(rollups.count_deltas(self.rollup_scope, len(created)))
+        if all(obj.pk for obj in created):
+            self.ids.update((obj.name, obj.pk) for obj in created)
+        else:
+            # База не вернула pk из bulk_create — дочитываем
+            self.ids.update(
+                (name, pk)
+                for pk, name in self.model.objects.filter(name__in=missing).values_list('pk', 'name')
+            )
+
+    def get(self, name):
+        return self.ids.get(name) if name else None
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def copy_rows(connection, rows, model=Item, columns=COPY_COLUMNS):
+    """COPY ... FROM STDIN пачки кортежей в порядке columns (только PostgreSQL)"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    sql = 'COPY {} ({}) FROM STDIN'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, buffer)
+
+
+def insert_rows(rows, columns=COPY_COLUMNS, using='default'):
+    """Вставляет кортежи в порядке columns: COPY на PostgreSQL, bulk_create на остальных.
+
+    Сигналов нет ни там, ни там — сводки и кэш обновляет вызывающий.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        copy_rows(connection, rows, columns=columns)
+        return
+    Item.objects.using(using).bulk_create(
+        [Item(**dict(zip(columns, row))) for row in rows],
+        batch_size=BULK_CREATE_BATCH_SIZE,
+    )
+
+
+def write_batch(batch, categories, locations, using='default'):
+    """Сохраняет пачку очищенных строк одной транзакцией"""
+    with transaction.atomic(using=using):
+        categories.resolve(row['category'] for row in batch)
+        locations.resolve(row['location'] for row in batch)
+        now = timezone.now()
+        rows = [
+            (
+                row['name'],
+                row['description'],
+                categories.get(row['category']),
+                locations.get(row['location']),
+                row['price'],
+                row['purchase_date'],
+                '',
+                '',
+                now,
+                now,
+            )
+            for row in batch
+        ]
+        insert_rows(rows, using=using)
+        # COPY и bulk_create сигналов не шлют — сводки обновляем в той же транзакции
+        rollups.apply_deltas(rollups.item_deltas(row[2:5] for row in rows), using=using)
+
+
+def import_items(stream, fmt='csv', batch_size=DEFAULT_BATCH_SIZE, report=None, progress=None):
+    """Импортирует вещи из потока.
+
+    report — текстовый файл, куда пишутся ошибки построчно (csv);
+    progress — функция, которую зовут после каждой пачки со статистикой.
+    """
+    stats = ImportStats()
+    categories = NameResolver(Category, InventoryRollup.CATEGORIES)
+    locations = NameResolver(Location, InventoryRollup.LOCATIONS)
+    report_writer = None
+    if report is not None:
+        report_writer = csv.writer(report)
+        report_writer.writerow(['line', 'error', 'row'])
+
+    batch = []
+    for line_no, raw in iter_records(stream, fmt):
+        stats.rows += 1
+        try:
+            batch.append(clean_row(raw))
+        except ImportRowError as exc:
+            stats.errors += 1
+            if report_writer:
+                report_writer.writerow([line_no, str(exc), json.dumps(raw, ensure_ascii=False, default=str)])
+            continue
+
+        if len(batch) >= batch_size:
+            write_batch(batch, categories, locations)
+            stats.imported += len(batch)
+            batch = []
+            if progress:
+                progress(stats)
+
+    if batch:
+        write_batch(batch, categories, locations)
+        stats.imported += len(batch)
+        if progress:
+            progress(stats)
+
+    if stats.imported:
+        # COPY и bulk_create не шлют post_save
+        suggest_index.invalidate()
+        tiered_cache.bump('items', 'refs')
+    return stats
@@ -0,0 +1,177 @@
+"""Очередь фоновых задач на таблице БД — без Redis и брокеров.
+
+Задача — строка Job: имя зарегистрированной функции и её аргументы в JSON.
+Ставится в той же транзакции, что и данные, поэтому воркер не увидит её
+раньше коммита, а при откате её просто не будет.
+
+Воркеры (manage.py run_workers) забирают задачи так:
+- в PostgreSQL — SELECT ... FOR UPDATE SKIP LOCKED: каждый берёт первую
+  свободную строку и не ждёт чужих блокировок;
+- в SQLite (и везде без SKIP LOCKED) — условным UPDATE ... WHERE
+  status = 'queued': запись в SQLite идёт под блокировкой всей базы, и
+  строку получает тот, у кого UPDATE изменил одну строку.
+
+Упавшая задача повторяется с экспоненциальной паузой, пока не кончатся
+попытки. Задачи воркера, который умер на середине, через JOB_TIMEOUT
+возвращаются в очередь.
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from inventory.models import Job
+
+logger = logging.getLogger('inventory.jobs')
+
+# Имя задачи -> (функция, попыток по умолчанию, приоритет по умолчанию)
+TASKS = {}
+
+# Сколько раз SQLite-воркер пробует забрать задачу, если её увели из-под носа
+CLAIM_RETRIES = 5
+
+
+def task(name, max_attempts=3, priority=0):
+    """Регистрирует функцию как задачу: аргументы — только JSON-совместимые"""
+    def decorator(func):
+        TASKS[name] = (func, max_attempts, priority)
+        func.task_name = name
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, priority=None, max_attempts=None, delay=0, using='default'):
+    """Ставит задачу в очередь и возвращает Job"""
+    if name not in TASKS:
+        raise KeyError(f'Неизвестная задача {name}')
+    _, default_attempts, default_priority = TASKS[name]
+    return Job.objects.using(using).create(
+        task=name,
+        payload=payload or {},
+        priority=default_priority if priority is None else priority,
+        max_attempts=default_attempts if max_attempts is None else max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def worker_name(index=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+def _queued(using):
+    return (
+        Job.objects.using(using)
+        .filter(status=Job.QUEUED, run_at__lte=timezone.now())
+        .order_by('-priority', 'run_at', 'id')
+    )
+
+
+def claim(worker, using='default'):
+    """Забирает следующую задачу (status -> running) или возвращает None"""
+    now = timezone.now()
+    if connections[using].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=using):
+            job = _queued(using).select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.status = Job.RUNNING
+            job.attempts += 1
+            job.worker = worker
+            job.started_at = now
+            job.save(update_fields=['status', 'attempts', 'worker', 'started_at'])
+            return job
+
+    for _ in range(CLAIM_RETRIES):
+        pk = _queued(using).values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        taken = Job.objects.using(using).filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, attempts=F('attempts') + 1, worker=worker, started_at=now,
+        )
+        if taken:
+            return Job.objects.using(using).get(pk=pk)
+    return None
+
+
+def retry_delay(attempts):
+    """Пауза перед повтором: JOB_RETRY_DELAY, 2×, 4×… секунд"""
+    return settings.JOB_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def _finish(job, using, **fields):
+    # Пишем только если задача всё ещё наша — её могли вернуть в очередь как зависшую
+    fields.setdefault('finished_at', timezone.now())
+    return Job.objects.using(using).filter(pk=job.pk, status=Job.RUNNING, worker=job.worker).update(**fields)
+
+
+def _fail(job, error, using):
+    if job.attempts < job.max_attempts:
+        return _finish(
+            job, using,
+            status=Job.QUEUED, error=error, finished_at=None,
+            run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+        )
+    return _finish(job, using, status=Job.FAILED, error=error)
+
+
+def run(job, using='default'):
+    """Выполняет забранную задачу и записывает итог"""
+    entry = TASKS.get(job.task)
+    if entry is None:
+        # Повтор не поможет — код задачи не загружен или удалён
+        return _finish(job, using, status=Job.FAILED, error=f'Неизвестная задача {job.task}')
+    try:
+        result = entry[0](**job.payload)
+    except Exception:
+        logger.exception('Задача %s упала (попытка %s из %s)', job, job.attempts, job.max_attempts)
+        return _fail(job, traceback.format_exc(), using)
+    return _finish(job, using, status=Job.DONE, result=result, error='')
+
+
+def requeue_stale(using='default'):
+    """Возвращает в очередь задачи воркеров, которые пропали дольше JOB_TIMEOUT назад"""
+    deadline = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+    stale = Job.objects.using(using).filter(status=Job.RUNNING, started_at__lt=deadline)
+    error = f'Воркер не ответил за {settings.JOB_TIMEOUT} с'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, error=error, finished_at=timezone.now(),
+    )
+    requeued = stale.update(status=Job.QUEUED, error=error, run_at=timezone.now())
+    return requeued + failed
+
+
+def work(worker, stop=None, burst=False, poll_interval=None, using='default'):
+    """Цикл воркера: берёт задачи, пока не выставлен stop.
+
+    burst=True — выйти, как только очередь опустеет. Возвращает число задач.
+    """
+    poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+    processed = 0
+    checked_stale = 0
+    while not (stop is not None and stop.is_set()):
+        # Как между запросами: закрыть сломанные и слишком старые соединения
+        # (внутри транзакции, как в тестах, соединение трогать нельзя)
+        if not connections[using].in_atomic_block:
+            close_old_connections()
+        if time.monotonic() - checked_stale > settings.JOB_TIMEOUT / 2:
+            requeue_stale(using)
+            checked_stale = time.monotonic()
+        job = claim(worker, using)
+        if job is None:
+            if burst:
+                break
+            if stop is not None:
+                stop.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+        run(job, using)
+        processed += 1
+    return processed
@@ -0,0 +1,307 @@
+"""Листы наклеек A4 с QR-кодами и названиями вещей в PDF.
+
+Каждый лист — одна картинка 1 бит/пиксель (QR и текст рисует Pillow),
+сжатая zlib: кириллица в названиях не требует встраивать шрифт в PDF.
+Листы рендерятся в пуле процессов, не дальше чем на несколько листов
+вперёд, и PDF пишется потоком: объекты листов уходят клиенту сразу, в
+конце — дерево страниц и таблица смещений. В памяти не больше окна
+листов, сколько бы ни было наклеек.
+
+Рендер листа (render_page) не трогает Django — его можно вызывать в
+дочерних процессах. Пул запускает их через forkserver, а не fork: веб-воркер
+многопоточный (пул соединений, поток метрик, потоки sync_to_async), и копия
+процесса от fork может унаследовать чужую захваченную блокировку.
+"""
+import multiprocessing
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import qrcode
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from PIL import Image, ImageDraw, ImageFont
+
+from inventory.exporting import async_chunks
+from inventory.qr import build_qr_payload
+
+# A4 в миллиметрах и в пунктах PDF
+PAGE_MM = (210, 297)
+MM_PER_INCH = 25.4
+POINTS_PER_INCH = 72
+
+# Типовые листы самоклеящихся этикеток: колонки x строки
+GRIDS = ('2x4', '2x7', '3x7', '3x8', '4x10')
+
+# Шрифты с кириллицей, если LABEL_FONT не задан
+FONT_CANDIDATES = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',
+    '/Library/Fonts/Arial Unicode.ttf',
+)
+
+
+class LabelLayout:
+    """Сетка наклеек на листе A4; размеры — в миллиметрах"""
+
+    def __init__(self, columns=3, rows=8, margin=10, gap=2, dpi=300, font=''):
+        if columns < 1 or rows < 1:
+            raise ValueError('В сетке должна быть хотя бы одна наклейка')
+        self.columns = columns
+        self.rows = rows
+        self.margin = margin
+        self.gap = gap
+        self.dpi = dpi
+        self.font = font
+        if min(self.cell_px) < 1:
+            raise ValueError('Наклейки не помещаются на лист: уменьшите сетку, поля или зазор')
+
+    @classmethod
+    def parse(cls, grid, **kwargs):
+        """'3x8' -> 3 колонки, 8 строк"""
+        try:
+            columns, rows = (int(part) for part in grid.lower().replace('х', 'x').split('x'))
+        except ValueError:
+            raise ValueError(f'Сетка задаётся как «колонки x строки», например 3x8, а не {grid!r}') from None
+        return cls(columns, rows, **kwargs)
+
+    @property
+    def per_page(self):
+        return self.columns * self.rows
+
+    def px(self, mm):
+        return round(mm * self.dpi / MM_PER_INCH)
+
+    @property
+    def page_px(self):
+        return self.px(PAGE_MM[0]), self.px(PAGE_MM[1])
+
+    @property
+    def page_pt(self):
+        return tuple(mm * POINTS_PER_INCH / MM_PER_INCH for mm in PAGE_MM)
+
+    @property
+    def cell_px(self):
+        width, height = self.page_px
+        margin, gap = self.px(self.margin), self.px(self.gap)
+        return (
+            (width - 2 * margin - (self.columns - 1) * gap) // self.columns,
+            (height - 2 * margin - (self.rows - 1) * gap) // self.rows,
+        )
+
+    def cell_origin(self, index):
+        cell_w, cell_h = self.cell_px
+        margin, gap = self.px(self.margin), self.px(self.gap)
+        row, column = divmod(index, self.columns)
+        return margin + column * (cell_w + gap), margin + row * (cell_h + gap)
+
+
+def find_font(configured=''):
+    """Путь к шрифту для подписей: настройка или первый найденный из FONT_CANDIDATES"""
+    if configured:
+        return configured
+    return next((path for path in FONT_CANDIDATES if Path(path).exists()), '')
+
+
+@lru_cache(maxsize=8)
+def _font(path, size):
+    if path:
+        return ImageFont.truetype(path, size)
+    # Встроенный шрифт Pillow без кириллицы — лучше, чем ничего
+    return ImageFont.load_default(size)
+
+
+def _qr_image(payload, size):
+    """QR-код не больше size x size пикселей: модули целого размера, без сглаживания"""
+    # Фиксированная маска: подбор лучшей из восьми — большая часть времени рендера,
+    # а читается код с любой
+    code = qrcode.QRCode(border=2, error_correction=qrcode.constants.ERROR_CORRECT_M, mask_pattern=0)
+    code.add_data(payload)
+    code.make(fit=True)
+    matrix = code.get_matrix()
+    modules = len(matrix)
+    small = Image.frombytes('L', (modules, modules), bytes(0 if dark else 255 for row in matrix for dark in row))
+    scale = max(size // modules, 1)
+    return small.resize((modules * scale, modules * scale), Image.NEAREST).convert('1', dither=Image.Dither.NONE)
+
+
+def _wrap(text, font, width, max_lines):
+    """Слова по строкам шириной не больше width; лишнее обрезается многоточием"""
+    lines, current = [], ''
+    for word in text.split():
+        candidate = f'{current} {word}'.strip()
+        if font.getlength(candidate) <= width or not current:
+            current = candidate
+        else:
+            lines.append(current)
+            current = word
+    if current:
+        lines.append(current)
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] += '…'
+    for index, line in enumerate(lines):
+        while font.getlength(line) > width and len(line) > 1:
+            line = line[:-2] + '…'
+        lines[index] = line
+    return lines
+
+
+def _draw_label(page, draw, layout, origin, pk, name, payload):
+    cell_w, cell_h = layout.cell_px
+    pad = max(layout.px(1.5), 1)
+    x, y = origin
+    # Широкая наклейка: QR слева, текст справа; узкая — текст под QR
+    horizontal = cell_w >= cell_h * 1.3
+    qr_size = (cell_h if horizontal else min(cell_w, cell_h * 2 // 3)) - 2 * pad
+    if qr_size > 0:
+        qr = _qr_image(payload, qr_size)
+        page.paste(qr, (x + pad, y + pad) if horizontal else (x + (cell_w - qr.width) // 2, y + pad))
+    if horizontal:
+        text_x, text_y = x + cell_h, y + pad
+        text_w, text_h = cell_w - cell_h - pad, cell_h - 2 * pad
+    else:
+        text_x, text_y = x + pad, y + qr_size + 2 * pad
+        text_w, text_h = cell_w - 2 * pad, cell_h - qr_size - 3 * pad
+    if text_w <= 0 or text_h <= 0:
+        return
+
+    size = max(min(text_h // 4, layout.px(4)), 6)
+    font = _font(layout.font, size)
+    line_h = round(size * 1.2)
+    lines = _wrap(name, font, text_w, max(text_h // line_h - 1, 1))
+    for line in lines:
+        draw.text((text_x, text_y), line, font=font, fill=0)
+        text_y += line_h
+    small = _font(layout.font, max(size * 3 // 4, 6))
+    draw.text((text_x, text_y), f'#{pk}', font=small, fill=0)
+
+
+def render_page(layout, labels, skip=0):
+    """Лист с наклейками labels — [(pk, название, содержимое QR)]; skip — пропустить ячеек в начале.
+
+    Возвращает (ширина, высота, сжатые zlib строки картинки 1 бит/пиксель).
+    """
+    page = Image.new('1', layout.page_px, 1)
+    draw = ImageDraw.Draw(page)
+    for index, (pk, name, payload) in enumerate(labels, start=skip):
+        _draw_label(page, draw, layout, layout.cell_origin(index), pk, name, payload)
+    return page.width, page.height, zlib.compress(page.tobytes(), 6)
+
+
+def render_page_job(job):
+    """Обёртка для пула процессов: (layout, labels, skip) -> render_page(...)"""
+    return render_page(*job)
+
+
+def render_pages(jobs, workers=1):
+    """Листы по порядку; с workers > 1 — в пуле, не больше 2×workers листов вперёд"""
+    if workers <= 1:
+        yield from map(render_page_job, jobs)
+        return
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+    pending = deque()
+    try:
+        for job in jobs:
+            pending.append(pool.submit(render_page_job, job))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Клиент оборвал загрузку — недорисованные листы не нужны
+        pool.shutdown(cancel_futures=True)
+
+
+def page_jobs(labels, layout, skip=0):
+    """Делит поток наклеек на листы; skip — занятые ячейки первого листа"""
+    skip = skip % layout.per_page
+    batch = []
+    for label in labels:
+        batch.append(label)
+        if len(batch) + skip >= layout.per_page:
+            yield layout, batch, skip
+            batch, skip = [], 0
+    if batch:
+        yield layout, batch, skip
+
+
+def pdf_stream(pages, page_size):
+    """PDF потоком из листов render_page; page_size — размер листа в пунктах.
+
+    Номера объектов известны заранее (1 — каталог, 2 — дерево страниц,
+    дальше по три на лист), поэтому дерево страниц пишется последним.
+    """
+    offsets = {}
+    position = 0
+
+    def emit(data):
+        nonlocal position
+        position += len(data)
+        return data
+
+    def obj(number, body, stream=None):
+        offsets[number] = position
+        data = f'{number} 0 obj\n'.encode() + body
+        if stream is not None:
+            data += b'\nstream\n' + stream + b'\nendstream'
+        return emit(data + b'\nendobj\n')
+
+    width_pt, height_pt = (f'{value:.2f}' for value in page_size)
+    yield emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    kids = []
+    for index, (width, height, data) in enumerate(pages):
+        image, content, page = 3 + index * 3, 4 + index * 3, 5 + index * 3
+        yield obj(image, (
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+            f'/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode /Length {len(data)} >>'
+        ).encode(), data)
+        draw = f'q {width_pt} 0 0 {height_pt} 0 0 cm /Im0 Do Q'.encode()
+        yield obj(content, f'<< /Length {len(draw)} >>'.encode(), draw)
+        yield obj(page, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt} {height_pt}] '
+            f'/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>'
+        ).encode())
+        kids.append(f'{page} 0 R')
+    yield obj(2, f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'.encode())
+
+    xref = position
+    size = len(offsets) + 1
+    table = [f'xref\n0 {size}\n', '0000000000 65535 f \n']
+    table += [f'{offsets[number]:010d} 00000 n \n' for number in range(1, size)]
+    table.append(f'trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n')
+    yield emit(''.join(table).encode())
+
+
+def label_pdf(labels, layout, workers=1, skip=0):
+    """Куски PDF с наклейками для потока labels — [(pk, название, содержимое QR)]"""
+    pages = render_pages(page_jobs(labels, layout, skip), workers)
+    return pdf_stream(pages, layout.page_pt)
+
+
+def layout_from_settings(grid=None, **kwargs):
+    """Сетка по умолчанию из настроек LABEL_*; grid и kwargs её переопределяют"""
+    kwargs.setdefault('dpi', settings.LABEL_DPI)
+    kwargs.setdefault('font', find_font(settings.LABEL_FONT))
+    return LabelLayout.parse(grid or settings.LABEL_GRID, **kwargs)
+
+
+def item_labels(queryset):
+    """Наклейки вещей по порядку queryset — поток, без списка в памяти"""
+    for pk, name in queryset.values_list('pk', 'name').iterator(chunk_size=2000):
+        yield pk, name, build_qr_payload(pk)
+
+
+def streaming_labels(queryset, layout, workers=None, skip=0, filename='labels', asynchronous=False):
+    """StreamingHttpResponse с PDF наклеек; asynchronous=True — под ASGI"""
+    workers = settings.LABEL_WORKERS if workers is None else workers
+    chunks = label_pdf(item_labels(queryset), layout, workers, skip)
+    if asynchronous:
+        chunks = async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.pdf"'
+    return response
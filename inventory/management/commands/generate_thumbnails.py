@@ -0,0 +1,86 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from inventory.cache import tiered_cache
+from inventory.models import Item
+from inventory.thumbnails import delete_thumbnails, render_thumbnails_job, save_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Строит превью фото вещей (для srcset) в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', nargs='+', type=int, help='Только эти id')
+        parser.add_argument('--all', action='store_true', help='Перестроить и уже готовые превью')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        # Оригиналы читаются в память пачкой — пачка небольшая
+        parser.add_argument('--batch-size', type=int, default=32)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size и --workers должны быть больше нуля')
+
+        items = Item.objects.exclude(Q(photo='') | Q(photo__isnull=True)).order_by('pk')
+        if options['ids']:
+            items = items.filter(pk__in=options['ids'])
+        if not options['all']:
+            items = items.exclude(photo_thumbs=F('photo'))
+
+        storage = Item._meta.get_field('photo').storage
+        total = items.count()
+        done = failed = 0
+        last_pk = 0
+        started = time.monotonic()
+
+        pool = ProcessPoolExecutor(max_workers=options['workers']) if options['workers'] > 1 else None
+        try:
+            while True:
+                batch = list(items.filter(pk__gt=last_pk).values_list('pk', 'photo', 'photo_thumbs')[:options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+
+                jobs, previous = [], {}
+                for pk, name, thumbs_for in batch:
+                    try:
+                        with storage.open(name) as f:
+                            jobs.append((pk, name, f.read(), settings.THUMBNAIL_WIDTHS))
+                    except FileNotFoundError:
+                        self.stderr.write(f'id={pk}: нет файла {name}')
+                        failed += 1
+                        continue
+                    previous[pk] = thumbs_for
+
+                rendered = pool.map(render_thumbnails_job, jobs) if pool else map(render_thumbnails_job, jobs)
+                ready = []
+                for pk, name, thumbnails in rendered:
+                    if thumbnails is None:
+                        self.stderr.write(f'id={pk}: не удалось прочитать картинку {name}')
+                        failed += 1
+                        continue
+                    save_thumbnails(storage, name, thumbnails)
+                    # Фото могли сменить во время работы — тогда его превью построит фоновая задача
+                    if Item.objects.filter(pk=pk, photo=name).update(photo_thumbs=name):
+                        if previous[pk] and previous[pk] != name:
+                            delete_thumbnails(storage, previous[pk])
+                        ready.append(pk)
+
+                tiered_cache.bump('items', *(f'item:{pk}' for pk in ready))
+                done += len(ready)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{done + failed}/{total} (id≤{last_pk}), {done / elapsed if elapsed else 0:.1f} фото/с'
+                )
+        finally:
+            if pool:
+                pool.shutdown()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: превью для {done} фото за {elapsed:.1f} с, ошибок: {failed}'
+        ))
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.importing import DEFAULT_BATCH_SIZE, detect_format, import_items
+
+
+class Command(BaseCommand):
+    help = 'Импортирует вещи из CSV или NDJSON (потоково, пачками)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .csv, .ndjson или .jsonl')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='По умолчанию — по расширению')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            '--report',
+            help='Куда записать ошибки (по умолчанию <файл>.errors.csv)',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл не найден: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+
+        fmt = options['format'] or detect_format(path.name)
+        report_path = Path(options['report'] or f'{path}.errors.csv')
+
+        def progress(stats):
+            self.stdout.write(
+                f'{stats.rows} строк, {stats.imported} импортировано, '
+                f'{stats.errors} ошибок, {stats.rate:.0f} строк/с'
+            )
+
+        with path.open('rb') as stream, report_path.open('w', newline='', encoding='utf-8') as report:
+            stats = import_items(
+                stream,
+                fmt=fmt,
+                batch_size=options['batch_size'],
+                report=report,
+                progress=progress,
+            )
+
+        if stats.errors:
+            self.stdout.write(self.style.WARNING(f'Ошибки записаны в {report_path}'))
+        else:
+            report_path.unlink()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {stats.imported} из {stats.rows} строк за {stats.elapsed:.1f} с '
+            f'({stats.rate:.0f} строк/с)'
+        ))
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from inventory.backup import default_filename, write_backup
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет категории, места, вещи и их файлы в один архив tar (потоково)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Файл архива; «-» — в stdout. По умолчанию inventory-<дата>.tar')
+        parser.add_argument('--no-media', action='store_true', help='Только данные, без фото и QR-кодов')
+        parser.add_argument(
+            '--gzip', action='store_true',
+            help='Сжать весь архив; манифест сжат всегда, а фото сжаты сами по себе',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or default_filename(options['gzip'])
+        # При записи в stdout прогресс уходит в stderr, чтобы не испортить архив
+        log = self.stderr if path == '-' else self.stdout
+
+        def progress(stats):
+            log.write(
+                f'{sum(stats.rows.values())} записей, {stats.files} файлов, '
+                f'{stats.bytes / 2 ** 20:.0f} МБ, {stats.elapsed:.1f} с'
+            )
+
+        if path == '-':
+            stats = write_backup(sys.stdout.buffer, not options['no_media'], options['gzip'], progress)
+            sys.stdout.buffer.flush()
+        else:
+            with open(path, 'wb') as f:
+                stats = write_backup(f, not options['no_media'], options['gzip'], progress)
+
+        if stats.missing_files:
+            log.write(self.style.WARNING(f'Файлов не нашлось в хранилище: {stats.missing_files}'))
+        log.write(self.style.SUCCESS(
+            f'Готово: {path if path != "-" else "stdout"} — вещей {stats.rows["item"]}, '
+            f'категорий {stats.rows["category"]}, мест {stats.rows["location"]}, '
+            f'файлов {stats.files} ({stats.bytes / 2 ** 20:.0f} МБ) за {stats.elapsed:.1f} с'
+        ))
@@ -0,0 +1,59 @@
+import sys
+import tarfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.backup import DEFAULT_BATCH_SIZE, BackupError, restore_backup
+
+
+class Command(BaseCommand):
+    help = 'Восстанавливает архив inventory_backup: данные пачками, файлы — в хранилище'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Архив .tar или .tar.gz; «-» — из stdin')
+        parser.add_argument(
+            '--remap-ids', action='store_true',
+            help='Выдать записям новые id, даже если база пуста (в непустую базу — всегда)',
+        )
+        parser.add_argument('--no-media', action='store_true', help='Не восстанавливать файлы')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        path = options['path']
+        if path != '-' and not Path(path).exists():
+            raise CommandError(f'Файл не найден: {path}')
+
+        def progress(stats):
+            self.stdout.write(
+                f'{sum(stats.rows.values())} записей, {stats.files} файлов, '
+                f'{stats.bytes / 2 ** 20:.0f} МБ, {stats.elapsed:.1f} с'
+            )
+
+        kwargs = {
+            'remap_ids': True if options['remap_ids'] else None,
+            'include_media': not options['no_media'],
+            'batch_size': options['batch_size'],
+            'progress': progress,
+        }
+        try:
+            if path == '-':
+                stats = restore_backup(sys.stdin.buffer, **kwargs)
+            else:
+                with open(path, 'rb') as f:
+                    stats = restore_backup(f, **kwargs)
+        except (BackupError, tarfile.TarError) as exc:
+            raise CommandError(f'Не удалось восстановить архив: {exc}')
+
+        if stats.remapped:
+            self.stdout.write(self.style.WARNING(
+                'Записи получили новые id: QR-коды старой инсталляции ведут на другие адреса'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: вещей {stats.rows["item"]}, категорий {stats.rows["category"]}, '
+            f'мест {stats.rows["location"]}, файлов {stats.files} '
+            f'({stats.bytes / 2 ** 20:.0f} МБ) за {stats.elapsed:.1f} с'
+        ))
+        self.stdout.write('Превью фото: manage.py generate_thumbnails')
@@ -0,0 +1,73 @@
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.labels import item_labels, label_pdf, layout_from_settings
+from inventory.models import Item
+from locations import tree
+
+
+class Command(BaseCommand):
+    help = 'Печатает наклейки с QR-кодами вещей на листы A4 в PDF (потоково, в пуле процессов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='labels.pdf', help='Файл PDF; «-» — в stdout')
+        parser.add_argument('--grid', default=settings.LABEL_GRID, help='Сетка «колонки x строки», например 3x8')
+        parser.add_argument('--margin', type=float, default=10, help='Поля листа, мм')
+        parser.add_argument('--gap', type=float, default=2, help='Зазор между наклейками, мм')
+        parser.add_argument('--dpi', type=int, default=settings.LABEL_DPI)
+        parser.add_argument('--skip', type=int, default=0, help='Сколько наклеек первого листа уже использовано')
+        parser.add_argument('--workers', type=int, default=settings.LABEL_WORKERS)
+        parser.add_argument('--ids', nargs='+', type=int, help='Только эти id')
+        parser.add_argument('--category', type=int, help='id категории')
+        parser.add_argument('--location', type=int, help='id места (вместе с вложенными)')
+        parser.add_argument('--after-id', type=int, default=0, help='Только вещи с id больше указанного')
+
+    def handle(self, *args, **options):
+        try:
+            layout = layout_from_settings(options['grid'], margin=options['margin'], gap=options['gap'],
+                                          dpi=options['dpi'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['skip'] < 0 or options['workers'] < 1:
+            raise CommandError('--skip не может быть отрицательным, --workers должно быть больше нуля')
+        if not layout.font:
+            self.stderr.write(self.style.WARNING('Шрифт с кириллицей не найден — задайте LABEL_FONT'))
+
+        items = Item.objects.filter(pk__gt=options['after_id']).order_by('pk')
+        if options['ids']:
+            items = items.filter(pk__in=options['ids'])
+        if options['category']:
+            items = items.filter(category_id=options['category'])
+        if options['location']:
+            items = items.filter(tree.subtree_q(options['location']))
+
+        path = options['path']
+        # При записи в stdout прогресс уходит в stderr, чтобы не испортить PDF
+        log = self.stderr if path == '-' else self.stdout
+        total = items.count()
+        if not total:
+            raise CommandError('Нет вещей для наклеек')
+        pages = -(-(total + options['skip'] % layout.per_page) // layout.per_page)
+        log.write(f'{total} наклеек на {pages} листах {layout.columns}x{layout.rows}')
+
+        started = time.monotonic()
+        size = 0
+        out = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        try:
+            for chunk in label_pdf(item_labels(items), layout, options['workers'], options['skip']):
+                out.write(chunk)
+                size += len(chunk)
+        finally:
+            if path == '-':
+                out.flush()
+            else:
+                out.close()
+
+        elapsed = time.monotonic() - started
+        log.write(self.style.SUCCESS(
+            f'Готово: {path if path != "-" else "stdout"} — {pages} листов, {size / 2 ** 20:.1f} МБ '
+            f'за {elapsed:.1f} с ({pages / elapsed if elapsed else 0:.1f} листов/с)'
+        ))
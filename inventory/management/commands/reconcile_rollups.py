@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from inventory.rollups import diff_rollups, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сводки дашборда с таблицами и перестраивает их с нуля'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Только показать расхождения, ничего не менять')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        drift = diff_rollups(using=using)
+        for (scope, key), (current, expected) in sorted(drift.items()):
+            self.stdout.write(
+                f'{scope}:{key} — в сводке {current[0]} шт. / {current[1]}, '
+                f'по таблицам {expected[0]} шт. / {expected[1]}'
+            )
+
+        if options['check']:
+            self.stdout.write(f'Расхождений: {len(drift)}')
+            return
+
+        rows = rebuild_rollups(using=using)
+        self.stdout.write(self.style.SUCCESS(f'Сводки перестроены: {rows} строк, исправлено расхождений: {len(drift)}'))
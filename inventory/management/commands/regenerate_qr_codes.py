@@ -0,0 +1,102 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import Item
+from inventory.qr import build_qr_payload, qr_filename, render_qr_job
+
+
+class Command(BaseCommand):
+    help = 'Перегенерирует QR-коды вещей (все или по фильтру) в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', nargs='+', type=int, help='Только эти id')
+        parser.add_argument('--category', type=int, help='id категории')
+        parser.add_argument('--location', type=int, help='id места хранения')
+        parser.add_argument('--missing', action='store_true', help='Только вещи без QR-кода')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл с последним обработанным id: при повторном запуске работа продолжится с него',
+        )
+        parser.add_argument('--after-id', type=int, default=0, help='Начать с id больше указанного')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size и --workers должны быть больше нуля')
+
+        items = Item.objects.order_by('pk')
+        if options['ids']:
+            items = items.filter(pk__in=options['ids'])
+        if options['category']:
+            items = items.filter(category_id=options['category'])
+        if options['location']:
+            items = items.filter(location_id=options['location'])
+        if options['missing']:
+            items = items.filter(qr_code='')
+
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        last_pk = options['after_id']
+        if checkpoint and checkpoint.exists():
+            last_pk = max(last_pk, int(checkpoint.read_text().strip() or 0))
+            self.stdout.write(f'Продолжаем после id={last_pk}')
+
+        field = Item._meta.get_field('qr_code')
+        storage = field.storage
+        total = items.filter(pk__gt=last_pk).count()
+        done = 0
+        started = time.monotonic()
+
+        pool = ProcessPoolExecutor(max_workers=options['workers']) if options['workers'] > 1 else None
+        try:
+            while True:
+                batch = list(
+                    items.filter(pk__gt=last_pk).values_list('pk', 'qr_code')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+
+                old_names = dict(batch)
+                jobs = [(pk, build_qr_payload(pk)) for pk, _ in batch]
+                if pool:
+                    rendered = pool.map(render_qr_job, jobs, chunksize=max(1, len(jobs) // (options['workers'] * 4)))
+                else:
+                    rendered = map(render_qr_job, jobs)
+
+                updated = []
+                for pk, png in rendered:
+                    name = field.generate_filename(None, qr_filename(pk))
+                    old_name = old_names[pk]
+                    if old_name and old_name != name and storage.exists(old_name):
+                        storage.delete(old_name)
+                    if storage.exists(name):
+                        storage.delete(name)
+                    updated.append(Item(pk=pk, qr_code=storage.save(name, ContentFile(png))))
+
+                Item.objects.bulk_update(updated, ['qr_code'])
+
+                last_pk = batch[-1][0]
+                done += len(batch)
+                if checkpoint:
+                    checkpoint.write_text(str(last_pk))
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{done}/{total} (id≤{last_pk}), {done / elapsed if elapsed else 0:.0f} вещей/с'
+                )
+        finally:
+            if pool:
+                pool.shutdown()
+
+        if checkpoint and checkpoint.exists():
+            checkpoint.unlink()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {done} QR-кодов за {elapsed:.1f} с ({done / elapsed if elapsed else 0:.0f} вещей/с)'
+        ))
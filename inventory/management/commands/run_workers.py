@@ -0,0 +1,69 @@
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from inventory import jobs
+
+# fork: дочерним процессам не нужен повторный django.setup()
+_mp = multiprocessing.get_context('fork')
+
+
+def _child(index, stop, options):
+    # Ctrl+C получает вся группа процессов — останавливает только родитель через stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    jobs.work(jobs.worker_name(index), stop, burst=options['burst'], poll_interval=options['poll_interval'])
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркеры очереди фоновых задач (inventory/jobs.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS, help='Число процессов')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Пауза между проверками пустой очереди, с')
+        parser.add_argument('--burst', action='store_true', help='Выйти, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers должно быть больше нуля')
+
+        stop = _mp.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+
+        if options['workers'] == 1:
+            done = jobs.work(jobs.worker_name(), stop, burst=options['burst'],
+                             poll_interval=options['poll_interval'])
+            self.stdout.write(self.style.SUCCESS(f'Воркер остановлен, выполнено задач: {done}'))
+            return
+
+        # Соединения родителя не должны достаться детям при fork
+        connections.close_all()
+        processes = {}
+
+        def start(index):
+            process = _mp.Process(target=_child, args=(index, stop, options), name=f'jobs-worker-{index}')
+            process.start()
+            processes[index] = process
+
+        for index in range(options['workers']):
+            start(index)
+        self.stdout.write(f'Запущено воркеров: {options["workers"]}')
+
+        while processes:
+            for index, process in list(processes.items()):
+                process.join(timeout=1)
+                if process.is_alive():
+                    continue
+                del processes[index]
+                # Упавший процесс (не по stop и не после --burst) заменяем новым
+                if process.exitcode != 0 and not stop.is_set() and not options['burst']:
+                    self.stderr.write(f'Воркер {index} завершился с кодом {process.exitcode}, перезапускаю')
+                    start(index)
+
+        self.stdout.write(self.style.SUCCESS('Воркеры остановлены'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.importing import DEFAULT_BATCH_SIZE
+from inventory.models import Item
+from inventory.seeding import CATEGORIES, clear_inventory, default_locations, generate_inventory
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическим инвентарём (для бенчмарков и разработки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, required=True, help='Сколько вещей добавить')
+        parser.add_argument('--seed', type=int, default=0, help='Одинаковый seed — одинаковая база')
+        parser.add_argument('--categories', type=int, default=len(CATEGORIES))
+        parser.add_argument('--locations', type=int, help='По умолчанию — одно место на 200 вещей')
+        parser.add_argument('--photos', type=float, default=0, help='Доля вещей с фото, от 0 до 1')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--clear', action='store_true', help='Сначала удалить вещи, места и категории')
+
+    def handle(self, *args, **options):
+        if options['items'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--items не может быть отрицательным, --batch-size должен быть больше нуля')
+        if not 0 <= options['photos'] <= 1:
+            raise CommandError('--photos — доля от 0 до 1')
+        if options['categories'] < 0 or (options['locations'] is not None and options['locations'] < 1):
+            raise CommandError('Нужна хотя бы одна локация, число категорий не может быть отрицательным')
+
+        if options['clear']:
+            clear_inventory()
+            self.stdout.write('Старый инвентарь удалён')
+        elif Item.objects.exists():
+            self.stdout.write(self.style.WARNING('В базе уже есть вещи — новые добавятся к ним (см. --clear)'))
+
+        locations = options['locations'] or default_locations(options['items'])
+        self.stdout.write(f'{options["items"]} вещей, {options["categories"]} категорий, {locations} мест')
+
+        def progress(stats):
+            self.stdout.write(f'{stats.imported} вещей, {stats.rate:.0f} вещей/с')
+
+        stats = generate_inventory(
+            options['items'],
+            seed=options['seed'],
+            categories=options['categories'],
+            locations=locations,
+            photos=options['photos'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {stats.imported} вещей за {stats.elapsed:.1f} с ({stats.rate:.0f} вещей/с)'
+        ))
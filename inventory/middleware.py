@@ -0,0 +1,107 @@
+import logging
+from collections import Counter
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('inventory.querybudget')
+
+
+def query_budget(max_queries):
+    """Объявляет, сколько SQL-запросов допустимо на один запрос к представлению.
+
+    Работает и для обычных view, и для операций django-ninja: бюджет
+    записывается в request, а проверяет его QueryBudgetMiddleware.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def wrapper(request, *args, **kwargs):
+                request.query_budget = max_queries
+                return await view_func(request, *args, **kwargs)
+        else:
+            @wraps(view_func)
+            def wrapper(request, *args, **kwargs):
+                request.query_budget = max_queries
+                return view_func(request, *args, **kwargs)
+
+        wrapper.query_budget = max_queries
+        return wrapper
+
+    return decorator
+
+
+class QueryBudgetMiddleware:
+    """Dev-middleware: предупреждает о превышении бюджета и повторах SQL (N+1).
+
+    Считает запросы ко всем базам за время обработки запроса. Запросы,
+    которые выполняются уже при отдаче StreamingHttpResponse, не учитываются.
+
+    Под ASGI асинхронный ORM выполняет запросы в потоке thread_sensitive,
+    поэтому счётчик подключается там же, через sync_to_async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        executed, wrappers = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(wrappers)
+        self.check(request, executed)
+        return response
+
+    async def __acall__(self, request):
+        executed, wrappers = await sync_to_async(self.start)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self.stop)(wrappers)
+        self.check(request, executed)
+        return response
+
+    @staticmethod
+    def start():
+        executed = []
+
+        def record(execute, sql, params, many, context):
+            executed.append(sql)
+            return execute(sql, params, many, context)
+
+        wrappers = [connections[alias].execute_wrapper(record) for alias in connections]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        return executed, wrappers
+
+    @staticmethod
+    def stop(wrappers):
+        for wrapper in reversed(wrappers):
+            wrapper.__exit__(None, None, None)
+
+    def check(self, request, executed):
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and len(executed) > budget:
+            logger.warning(
+                'Превышен бюджет запросов: %s %s — %d SQL при бюджете %d',
+                request.method, request.path, len(executed), budget,
+            )
+
+        limit = settings.QUERY_BUDGET_REPEAT_LIMIT
+        for sql, count in Counter(executed).most_common():
+            if count < limit:
+                break
+            logger.warning(
+                'Повторяющийся SQL (%d раз) на %s %s — вероятно, N+1: %s',
+                count, request.method, request.path, sql[:300],
+            )
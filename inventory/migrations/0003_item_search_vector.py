@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:32
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from inventory.search import install_search_index, uninstall_search_index
+
+
+def create_search_index(apps, schema_editor):
+    install_search_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    uninstall_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0002_alter_item_category_alter_item_location"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="item",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
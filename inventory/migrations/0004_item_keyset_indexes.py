@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0003_item_search_vector"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="item",
+            options={
+                "ordering": ["-created_at", "-id"],
+                "verbose_name": "Вещь",
+                "verbose_name_plural": "Вещи",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="item_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(
+                fields=["category", "-created_at", "-id"], name="item_category_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(
+                fields=["location", "-created_at", "-id"], name="item_location_created_idx"
+            ),
+        ),
+    ]
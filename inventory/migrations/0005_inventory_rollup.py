@@ -0,0 +1,71 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+from inventory.rollups import rebuild_rollups
+
+
+def fill_rollups(apps, schema_editor):
+    rebuild_rollups(using=schema_editor.connection.alias, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0004_item_keyset_indexes"),
+        ("categories", "0001_initial"),
+        ("locations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InventoryRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[
+                            ("total", "Все вещи"),
+                            ("category", "Вещи категории"),
+                            ("location", "Вещи места"),
+                            ("categories", "Число категорий"),
+                            ("locations", "Число мест"),
+                        ],
+                        max_length=16,
+                        verbose_name="Срез",
+                    ),
+                ),
+                ("key", models.PositiveIntegerField(default=0, verbose_name="Ключ")),
+                ("count", models.BigIntegerField(default=0, verbose_name="Количество")),
+                (
+                    "value",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=16,
+                        verbose_name="Стоимость",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Сводка",
+                "verbose_name_plural": "Сводки",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="inventoryrollup",
+            constraint=models.UniqueConstraint(
+                fields=("scope", "key"), name="rollup_scope_key_uniq"
+            ),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:05
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+from inventory.search import install_search_triggers
+
+
+def copy_created_at(apps, schema_editor):
+    Item = apps.get_model("inventory", "Item")
+    Item.objects.using(schema_editor.connection.alias).update(updated_at=F("created_at"))
+
+
+def restore_search_triggers(apps, schema_editor):
+    # SQLite пересоздаёт таблицу при добавлении NOT NULL поля и теряет триггеры
+    install_search_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0005_inventory_rollup"),
+    ]
+
+    operations = [
+        # При откате RemoveField снова пересоздаёт таблицу — триггеры вернёт эта операция
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name="item",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="Изменено",
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
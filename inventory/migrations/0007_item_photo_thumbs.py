@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+from inventory.search import install_search_triggers
+
+
+def restore_search_triggers(apps, schema_editor):
+    # SQLite пересоздаёт таблицу при добавлении поля с default и теряет триггеры
+    install_search_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0006_item_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name="item",
+            name="photo_thumbs",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=100,
+                verbose_name="Превью для",
+            ),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
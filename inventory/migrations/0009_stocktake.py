@@ -0,0 +1,121 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("locations", "0002_location_tree"),
+        ("inventory", "0008_job"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Stocktake",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("open", "Идёт"), ("closed", "Завершена")],
+                        default="open",
+                        max_length=10,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "note",
+                    models.CharField(
+                        blank=True, max_length=200, verbose_name="Заметка"
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Начата"),
+                ),
+                (
+                    "closed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Завершена"
+                    ),
+                ),
+                (
+                    "summary",
+                    models.JSONField(blank=True, null=True, verbose_name="Итог"),
+                ),
+                (
+                    "location",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stocktakes",
+                        to="locations.location",
+                        verbose_name="Место",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Инвентаризация",
+                "verbose_name_plural": "Инвентаризации",
+                "ordering": ["-started_at", "-id"],
+            },
+        ),
+        migrations.CreateModel(
+            name="StocktakeScan",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scanned_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Отсканирована"
+                    ),
+                ),
+                (
+                    "item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="inventory.item",
+                        verbose_name="Вещь",
+                    ),
+                ),
+                (
+                    "stocktake",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="scans",
+                        to="inventory.stocktake",
+                        verbose_name="Инвентаризация",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Скан",
+                "verbose_name_plural": "Сканы",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="stocktakescan",
+            constraint=models.UniqueConstraint(
+                fields=("stocktake", "item"), name="stocktake_scan_unique"
+            ),
+        ),
+    ]
@@ -1,8 +1,14 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.urls import reverse
-import qrcode
-from django.core.files import File
-from io import BytesIO
+from django.utils import timezone
+from django.core.files.base import ContentFile
+
+from inventory import thumbnails
+from inventory.qr import build_qr_payload, qr_filename, render_qr_png
+
+# Поля вещи, от которых зависят сводки (InventoryRollup)
+ROLLUP_FIELDS = ('category_id', 'location_id', 'price')
 
 
 class Item(models.Model):
@@ -15,13 +21,25 @@ class Item(models.Model):
     purchase_date = models.DateField('Дата покупки', null=True, blank=True)
     price = models.DecimalField('Цена', max_digits=10, decimal_places=2, null=True, blank=True)
     photo = models.ImageField('Фото', upload_to='items/', blank=True, null=True)
+    # Имя фото, для которого готовы превью (см. inventory/thumbnails.py)
+    photo_thumbs = models.CharField('Превью для', max_length=100, blank=True, editable=False)
     qr_code = models.ImageField('QR-код', upload_to='qrcodes/', blank=True)
     created_at = models.DateTimeField('Создано', auto_now_add=True)
+    # Для Last-Modified: телефоны перепроверяют страницу вещи, а не качают заново
+    updated_at = models.DateTimeField('Изменено', auto_now=True)
+    # Заполняется триггером в PostgreSQL, см. inventory/search.py
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Вещь'
         verbose_name_plural = 'Вещи'
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Курсорная пагинация списка: WHERE created_at <= X ORDER BY created_at DESC, id DESC
+            models.Index(fields=['-created_at', '-id'], name='item_created_id_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='item_category_created_idx'),
+            models.Index(fields=['location', '-created_at', '-id'], name='item_location_created_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -31,28 +49,178 @@ class Item(models.Model):
             return reverse('inventory:item-detail', kwargs={'pk': self.pk})
         return '/'
 
+    def get_qr_url(self, fmt='png'):
+        """Адрес QR-кода, который рендерится по запросу"""
+        name = 'inventory:item-qr' if fmt == 'png' else 'inventory:item-qr-svg'
+        return reverse(name, kwargs={'pk': self.pk})
+
+    @property
+    def qr_url(self):
+        return self.get_qr_url()
+
     def generate_qr_code(self):
-        """Генерирует QR-код и возвращает имя файла"""
+        """Сохраняет QR-код файлом в qr_code (для печати и старых ссылок)"""
         if not self.pk:
             return  # Не генерируем для новых объектов без ID
 
-        qr_data = f"http://127.0.0.1:8000{self.get_absolute_url()}"
-        qr_image = qrcode.make(qr_data)
+        png = render_qr_png(build_qr_payload(self.pk))
+        self.qr_code.save(qr_filename(self.pk), ContentFile(png), save=False)
+
+    @property
+    def photo_sources(self):
+        """srcset превью ({'webp', 'jpeg', 'src'}) или None, пока превью не готовы"""
+        if not self.photo or self.photo.name != self.photo_thumbs:
+            return None
+        return thumbnails.sources(self.photo.storage, self.photo.name)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженные значения, чтобы сигналы считали разницу для сводок
+        instance._rollup_state = instance.rollup_state()
+        return instance
+
+    def rollup_state(self, fallback=None):
+        """(category_id, location_id, price) для сводок.
+
+        Отложенные поля берутся из fallback; без него — None.
+        """
+        loaded = self.__dict__
+        if fallback is None:
+            if not all(name in loaded for name in ROLLUP_FIELDS):
+                return None
+            fallback = (None, None, None)
+        category_id, location_id, price = (
+            loaded.get(name, previous) for name, previous in zip(ROLLUP_FIELDS, fallback)
+        )
+        return category_id, location_id, self._meta.get_field('price').to_python(price)
+
 
-        buffer = BytesIO()
-        qr_image.save(buffer, format='PNG')
-        buffer.seek(0)
+class InventoryRollup(models.Model):
+    """Заранее посчитанные сводки по инвентарю.
 
-        filename = f'item_{self.pk}.png'
-        self.qr_code.save(filename, File(buffer), save=False)
+    Строки обновляются инкрементально (F-выражениями) при каждой записи вещей,
+    категорий и мест, см. inventory/rollups.py. Перестроить с нуля —
+    manage.py reconcile_rollups.
+    """
+    TOTAL = 'total'
+    CATEGORY = 'category'
+    LOCATION = 'location'
+    CATEGORIES = 'categories'
+    LOCATIONS = 'locations'
+    SCOPES = [
+        (TOTAL, 'Все вещи'),
+        (CATEGORY, 'Вещи категории'),
+        (LOCATION, 'Вещи места'),
+        (CATEGORIES, 'Число категорий'),
+        (LOCATIONS, 'Число мест'),
+    ]
 
-    def save(self, *args, **kwargs):
-        # Сохраняем один раз, чтобы получить pk
-        is_new = self.pk is None
-        super().save(*args, **kwargs)
+    scope = models.CharField('Срез', max_length=16, choices=SCOPES)
+    # id категории или места; 0 — «без категории/места» и итоговые строки
+    key = models.PositiveIntegerField('Ключ', default=0)
+    count = models.BigIntegerField('Количество', default=0)
+    value = models.DecimalField('Стоимость', max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Сводка'
+        verbose_name_plural = 'Сводки'
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='rollup_scope_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}:{self.key}'
+
+
+class Job(models.Model):
+    """Фоновая задача в очереди на таблице БД (см. inventory/jobs.py)"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    task = models.CharField('Задача', max_length=100)
+    payload = models.JSONField('Аргументы', default=dict, blank=True)
+    status = models.CharField('Статус', max_length=10, choices=STATUSES, default=QUEUED)
+    # Больше — раньше
+    priority = models.SmallIntegerField('Приоритет', default=0)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Попыток всего', default=3)
+    # Не брать раньше этого времени — так откладываются повторы после ошибки
+    run_at = models.DateTimeField('Не раньше', default=timezone.now)
+    worker = models.CharField('Воркер', max_length=100, blank=True)
+    result = models.JSONField('Результат', null=True, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    created_at = models.DateTimeField('Создано', auto_now_add=True)
+    started_at = models.DateTimeField('Начато', null=True, blank=True)
+    finished_at = models.DateTimeField('Завершено', null=True, blank=True)
 
-        # Генерируем QR только для новых объектов и если его нет
-        if is_new and not self.qr_code:
-            self.generate_qr_code()
-            # Сохраняем ТОЛЬКО поле qr_code
-            super().save(update_fields=['qr_code'])
\ No newline at end of file
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Выбор следующей задачи: только очередь, в порядке, в котором её берут воркеры
+            models.Index(
+                fields=['-priority', 'run_at', 'id'],
+                condition=models.Q(status='queued'),
+                name='job_queued_idx',
+            ),
+            models.Index(fields=['status', 'started_at'], name='job_status_started_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task}#{self.pk} ({self.status})'
+
+
+class Stocktake(models.Model):
+    """Инвентаризация места: какие вещи в нём отсканированы (см. inventory/stocktake.py)"""
+    OPEN = 'open'
+    CLOSED = 'closed'
+    STATUSES = [
+        (OPEN, 'Идёт'),
+        (CLOSED, 'Завершена'),
+    ]
+
+    # Сверяется всё место вместе с вложенными
+    location = models.ForeignKey('locations.Location', on_delete=models.CASCADE, related_name='stocktakes',
+                                 verbose_name='Место')
+    status = models.CharField('Статус', max_length=10, choices=STATUSES, default=OPEN)
+    note = models.CharField('Заметка', max_length=200, blank=True)
+    started_at = models.DateTimeField('Начата', auto_now_add=True)
+    closed_at = models.DateTimeField('Завершена', null=True, blank=True)
+    # Итог сверки на момент завершения: потом вещи могут переехать
+    summary = models.JSONField('Итог', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Инвентаризация'
+        verbose_name_plural = 'Инвентаризации'
+        ordering = ['-started_at', '-id']
+
+    def __str__(self):
+        return f'{self.location} — {self.started_at:%d.%m.%Y}'
+
+
+class StocktakeScan(models.Model):
+    """Вещь, найденная при инвентаризации; повторный скан той же вещи не добавляет строк"""
+    stocktake = models.ForeignKey(Stocktake, on_delete=models.CASCADE, related_name='scans',
+                                  verbose_name='Инвентаризация')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='+', verbose_name='Вещь')
+    scanned_at = models.DateTimeField('Отсканирована', default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Скан'
+        verbose_name_plural = 'Сканы'
+        constraints = [
+            models.UniqueConstraint(fields=['stocktake', 'item'], name='stocktake_scan_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.stocktake_id}: {self.item_id}'
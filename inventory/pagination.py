@@ -0,0 +1,105 @@
+"""Курсорная (keyset) пагинация списка вещей.
+
+Вместо OFFSET курсор хранит значения сортировки последней показанной
+строки, и следующая страница начинается строго после неё. Так глубокие
+страницы стоят столько же, сколько первая: БД сразу прыгает по индексу
+(-created_at, -id), а не пролистывает все предыдущие строки.
+"""
+import base64
+import json
+
+from django.utils.dateparse import parse_datetime
+
+from inventory.search import filter_after
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _after_created(queryset, values):
+    created_at, pk = values
+    # created_at <= X идёт в условие индекса, исключение — только для границы
+    return queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, pk__gte=pk)
+
+
+def _after_rank(queryset, values):
+    rank, pk = values
+    return filter_after(queryset, rank, pk)
+
+
+# Ключ сортировки -> (как достать значения из строки, как их разобрать, фильтр «после»)
+KEYSETS = {
+    'created': (
+        lambda item: (item.created_at.isoformat(), item.pk),
+        lambda values: (parse_datetime(values[0]), int(values[1])),
+        _after_created,
+    ),
+    'rank': (
+        lambda item: (item.rank, item.pk),
+        lambda values: (float(values[0]), int(values[1])),
+        _after_rank,
+    ),
+}
+
+
+def encode_cursor(keyset, item):
+    values = KEYSETS[keyset][0](item)
+    raw = json.dumps([keyset, *values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        keyset, *values = json.loads(raw)
+        values = KEYSETS[keyset][1](values)
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if any(value is None for value in values):
+        raise InvalidCursor(cursor)
+    return keyset, values
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _after_cursor(queryset, keyset, cursor):
+    if not cursor:
+        return queryset
+    cursor_keyset, values = decode_cursor(cursor)
+    if cursor_keyset != keyset:
+        raise InvalidCursor(cursor)
+    return KEYSETS[keyset][2](queryset, values)
+
+
+def _make_page(items, keyset, page_size):
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(keyset, items[-1])
+    return KeysetPage(items, next_cursor)
+
+
+def keyset_page(queryset, keyset, cursor=None, page_size=24):
+    """Одна страница queryset, отсортированного по ключу keyset.
+
+    queryset уже должен быть отсортирован: 'created' — по (-created_at, -pk),
+    'rank' — по (-rank, -pk), как это делает apply_search.
+    """
+    queryset = _after_cursor(queryset, keyset, cursor)
+    # Одна лишняя строка, чтобы узнать, есть ли следующая страница
+    return _make_page(list(queryset[:page_size + 1]), keyset, page_size)
+
+
+async def akeyset_page(queryset, keyset, cursor=None, page_size=24):
+    """То же через асинхронный ORM"""
+    queryset = _after_cursor(queryset, keyset, cursor)
+    return _make_page([item async for item in queryset[:page_size + 1]], keyset, page_size)
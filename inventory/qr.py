@@ -0,0 +1,143 @@
+"""QR-коды вещей: содержимое кода, рендер и дисковый кэш готовых картинок"""
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+import qrcode
+from django.conf import settings
+from django.urls import reverse
+from qrcode.image.svg import SvgPathImage
+
+# Меняется при смене способа рендера — старые записи кэша перестают совпадать
+RENDER_VERSION = 1
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# Сколько промахов кэша пропускаем между проверками его размера
+PRUNE_EVERY = 256
+_misses_since_prune = 0
+
+
+def build_qr_payload(pk):
+    """Адрес страницы вещи, который зашивается в QR-код"""
+    path = reverse('inventory:item-detail', kwargs={'pk': pk})
+    return f"{settings.SITE_URL.rstrip('/')}{path}"
+
+
+def render_qr_png(payload):
+    """Рендерит QR-код в PNG и возвращает байты.
+
+    Не трогает Django, поэтому её можно вызывать в дочерних процессах пула.
+    """
+    buffer = BytesIO()
+    qrcode.make(payload).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_qr_svg(payload):
+    buffer = BytesIO()
+    qrcode.make(payload, image_factory=SvgPathImage).save(buffer)
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    'png': render_qr_png,
+    'svg': render_qr_svg,
+}
+
+
+def render_qr_job(job):
+    """Обёртка для ProcessPoolExecutor.map: (pk, payload) -> (pk, png)"""
+    pk, payload = job
+    return pk, render_qr_png(payload)
+
+
+def qr_filename(pk):
+    return f'item_{pk}.png'
+
+
+def qr_digest(payload, fmt):
+    """Ключ кэша и ETag: зависит только от содержимого кода и формата"""
+    key = f'{RENDER_VERSION}:{fmt}:{payload}'.encode()
+    return hashlib.sha256(key).hexdigest()
+
+
+def get_qr_image(payload, fmt):
+    """Возвращает (байты, digest), рендеря картинку только при промахе кэша"""
+    digest = qr_digest(payload, fmt)
+    path = Path(settings.QR_CACHE_DIR) / digest[:2] / f'{digest}.{fmt}'
+
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        pass
+    else:
+        # Обновляем mtime — по нему вытесняются давно не запрошенные коды
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data, digest
+
+    data = RENDERERS[fmt](payload)
+    _write_atomic(path, data)
+    _maybe_prune()
+    return data, digest
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _maybe_prune():
+    global _misses_since_prune
+    _misses_since_prune += 1
+    if _misses_since_prune < PRUNE_EVERY:
+        return
+    _misses_since_prune = 0
+    prune_qr_cache()
+
+
+def prune_qr_cache(max_files=None):
+    """Удаляет самые старые по mtime файлы, пока кэш не влезет в лимит"""
+    max_files = settings.QR_CACHE_MAX_FILES if max_files is None else max_files
+    root = Path(settings.QR_CACHE_DIR)
+    if not root.exists():
+        return 0
+
+    entries = []
+    for path in root.glob('*/*.*'):
+        if path.suffix == '.tmp':
+            continue
+        try:
+            entries.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+
+    excess = len(entries) - max_files
+    if excess <= 0:
+        return 0
+
+    entries.sort()
+    removed = 0
+    for _, path in entries[:excess]:
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
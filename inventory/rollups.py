@@ -0,0 +1,221 @@
+"""Инкрементальные сводки по инвентарю для дашборда и /stats.
+
+Каждая запись вещей превращается в набор дельт (срез, ключ) -> (количество,
+стоимость), которые применяются одним UPDATE ... SET count = count + N на
+строку сводки. Дашборд и статистика читают только таблицу сводок, поэтому их
+стоимость не зависит от размера инвентаря.
+
+Массовые пути (bulk_create, COPY) не шлют сигналов и зовут apply_deltas сами.
+reconcile_rollups сверяет сводки с таблицами и перестраивает их с нуля.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+
+from inventory.models import InventoryRollup
+from locations import tree
+from locations.models import LocationClosure
+
+TOTALS = (InventoryRollup.TOTAL, InventoryRollup.CATEGORIES, InventoryRollup.LOCATIONS)
+
+ZERO = Decimal('0.00')
+
+
+def _new_deltas():
+    return defaultdict(lambda: [0, ZERO])
+
+
+def item_deltas(states, sign=1, deltas=None):
+    """Дельты для вещей; states — кортежи (category_id, location_id, price)"""
+    deltas = _new_deltas() if deltas is None else deltas
+    for category_id, location_id, price in states:
+        value = (price or ZERO) * sign
+        for key in (
+            (InventoryRollup.TOTAL, 0),
+            (InventoryRollup.CATEGORY, category_id or 0),
+            (InventoryRollup.LOCATION, location_id or 0),
+        ):
+            delta = deltas[key]
+            delta[0] += sign
+            delta[1] += value
+    return deltas
+
+
+def item_change_deltas(old, new):
+    """Дельты для изменения одной вещи; old/new — состояние или None"""
+    deltas = _new_deltas()
+    if old is not None:
+        item_deltas([old], sign=-1, deltas=deltas)
+    if new is not None:
+        item_deltas([new], deltas=deltas)
+    return deltas
+
+
+def count_deltas(scope, count):
+    deltas = _new_deltas()
+    deltas[(scope, 0)][0] += count
+    return deltas
+
+
+def apply_deltas(deltas, using='default'):
+    """Применяет дельты атомарно, по одному UPDATE на затронутую строку.
+
+    Строки обходятся в одном порядке, чтобы параллельные транзакции не
+    блокировали друг друга крест-накрест.
+    """
+    rollups = InventoryRollup.objects.using(using)
+    with transaction.atomic(using=using, savepoint=False):
+        for (scope, key), (count, value) in sorted(deltas.items()):
+            if not count and not value:
+                continue
+            changes = {'count': F('count') + count, 'value': F('value') + value}
+            if rollups.filter(scope=scope, key=key).update(**changes):
+                continue
+            try:
+                with transaction.atomic(using=using):
+                    rollups.create(scope=scope, key=key, count=count, value=value)
+            except IntegrityError:
+                # Строку только что создала параллельная транзакция
+                rollups.filter(scope=scope, key=key).update(**changes)
+
+
+def fold_into_unassigned(scope, key, using='default'):
+    """Переносит строку удалённой категории/места в «без категории/места».
+
+    Вещи при этом остаются: внешний ключ обнуляется через SET_NULL.
+    """
+    rollups = InventoryRollup.objects.using(using)
+    with transaction.atomic(using=using, savepoint=False):
+        row = rollups.select_for_update().filter(scope=scope, key=key).first()
+        if row is None:
+            return
+        row.delete()
+        deltas = _new_deltas()
+        deltas[(scope, 0)] = [row.count, row.value]
+        apply_deltas(deltas, using=using)
+
+
+def _totals_rows(using):
+    return (
+        InventoryRollup.objects.using(using)
+        .filter(scope__in=TOTALS, key=0)
+        .values_list('scope', 'count', 'value')
+    )
+
+
+def _totals(rows):
+    rows = {scope: (count, value) for scope, count, value in rows}
+    items, value = rows.get(InventoryRollup.TOTAL, (0, ZERO))
+    return {
+        'total_items': items,
+        'total_value': value,
+        'categories_count': rows.get(InventoryRollup.CATEGORIES, (0, ZERO))[0],
+        'locations_count': rows.get(InventoryRollup.LOCATIONS, (0, ZERO))[0],
+    }
+
+
+def totals(using='default'):
+    """Итоги для дашборда и /stats — один запрос по трём строкам"""
+    return _totals(_totals_rows(using))
+
+
+async def atotals(using='default'):
+    return _totals([row async for row in _totals_rows(using)])
+
+
+def expected_rollups(using='default', apps=global_apps):
+    """Сводки, посчитанные заново по таблицам: (срез, ключ) -> (количество, стоимость)"""
+    Item = apps.get_model('inventory', 'Item')
+    Category = apps.get_model('categories', 'Category')
+    Location = apps.get_model('locations', 'Location')
+
+    items = Item.objects.using(using).order_by()
+    expected = {}
+    total = items.aggregate(count=Count('pk'), value=Sum('price'))
+    expected[(InventoryRollup.TOTAL, 0)] = (total['count'], total['value'] or ZERO)
+    for scope, field in ((InventoryRollup.CATEGORY, 'category_id'), (InventoryRollup.LOCATION, 'location_id')):
+        for key, count, value in items.values_list(field).annotate(count=Count('pk'), value=Sum('price')):
+            expected[(scope, key or 0)] = (count, value or ZERO)
+    expected[(InventoryRollup.CATEGORIES, 0)] = (Category.objects.using(using).count(), ZERO)
+    expected[(InventoryRollup.LOCATIONS, 0)] = (Location.objects.using(using).count(), ZERO)
+    return expected
+
+
+def diff_rollups(using='default', apps=global_apps):
+    """Расхождения: (срез, ключ) -> (в сводке, по таблицам)"""
+    Rollup = apps.get_model('inventory', 'InventoryRollup')
+    current = {
+        (scope, key): (count, value)
+        for scope, key, count, value in Rollup.objects.using(using).values_list('scope', 'key', 'count', 'value')
+    }
+    expected = expected_rollups(using, apps)
+    empty = (0, ZERO)
+    return {
+        key: (current.get(key, empty), expected.get(key, empty))
+        for key in current.keys() | expected.keys()
+        if current.get(key, empty) != expected.get(key, empty)
+    }
+
+
+def rebuild_rollups(using='default', apps=global_apps):
+    """Перестраивает таблицу сводок с нуля одной транзакцией"""
+    Rollup = apps.get_model('inventory', 'InventoryRollup')
+    with transaction.atomic(using=using):
+        expected = expected_rollups(using, apps)
+        Rollup.objects.using(using).all().delete()
+        Rollup.objects.using(using).bulk_create([
+            Rollup(scope=scope, key=key, count=count, value=value)
+            for (scope, key), (count, value) in sorted(expected.items())
+        ])
+    return len(expected)
+
+
+def top_rollups(scope, model, limit=10, using='default'):
+    """Крупнейшие категории или места с названиями — один запрос.
+
+    У строки «без категории/места» (key=0) name будет None.
+    """
+    names = model.objects.using(using).filter(pk=OuterRef('key')).values('name')[:1]
+    return list(
+        InventoryRollup.objects.using(using)
+        .filter(scope=scope, count__gt=0)
+        .annotate(name=Subquery(names))
+        .order_by('-count', 'key')[:limit]
+    )
+
+
+def location_totals(pk, using='default'):
+    """(количество, стоимость) вещей в месте и во всех вложенных — одним запросом по сводкам"""
+    row = (
+        InventoryRollup.objects.using(using)
+        .filter(Q(key=pk) | Q(key__in=tree.descendants(pk, using)), scope=InventoryRollup.LOCATION)
+        .aggregate(count=Sum('count'), value=Sum('value'))
+    )
+    return row['count'] or 0, row['value'] or ZERO
+
+
+def location_tree_totals(using='default'):
+    """id места -> [количество, стоимость] по его ветке для всего дерева сразу.
+
+    Два запроса: сводки мест и пары замыканий; сложение — в памяти.
+    """
+    rows = (
+        InventoryRollup.objects.using(using)
+        .filter(scope=InventoryRollup.LOCATION)
+        .exclude(key=0)
+        .values_list('key', 'count', 'value')
+    )
+    direct = {key: (count, value) for key, count, value in rows}
+    totals = _new_deltas()
+    for key, (count, value) in direct.items():
+        totals[key][0] += count
+        totals[key][1] += value
+    pairs = LocationClosure.objects.using(using).values_list('ancestor_id', 'descendant_id')
+    for ancestor, descendant in pairs.iterator(chunk_size=5000):
+        count, value = direct.get(descendant, (0, ZERO))
+        totals[ancestor][0] += count
+        totals[ancestor][1] += value
+    return totals
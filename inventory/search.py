@@ -0,0 +1,283 @@
+"""Полнотекстовый поиск вещей с ранжированием.
+
+PostgreSQL: столбец search_vector (русская и английская морфология, его
+держит в актуальном состоянии триггер) с GIN-индексом, плюс нечёткое
+совпадение по триграммам названия, если включён SEARCH_TRIGRAM и в базе
+установлено расширение pg_trgm.
+SQLite: теневая таблица FTS5 inventory_item_fts, которую обновляют триггеры.
+Остальные базы — обычный icontains без ранжирования.
+
+Все представления ищут через apply_search, чтобы выдача была одинаковой.
+Результат всегда аннотирован полем rank (чем больше, тем релевантнее) и
+отсортирован по (-rank, -pk).
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+
+FTS_TABLE = 'inventory_item_fts'
+
+# Веса полей для bm25 в SQLite: название важнее описания
+FTS_WEIGHTS = (10.0, 1.0)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+_fts_available = {}
+_trigram_available = {}
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query):
+    """Обрезает пробелы и сводит «ё» к «е», как это делают триггеры индекса"""
+    return (query or '').strip().replace('ё', 'е').replace('Ё', 'Е')
+
+
+def apply_search(queryset, query):
+    """Фильтрует queryset по запросу и сортирует по релевантности"""
+    query = normalize_query(query)
+    if not query:
+        return queryset
+
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        return _search_postgres(queryset, query)
+    if connection.vendor == 'sqlite' and _sqlite_fts_available(connection):
+        return _search_sqlite(queryset, query)
+    return _search_icontains(queryset, query)
+
+
+def _search_postgres(queryset, query):
+    ts_query = (
+        SearchQuery(query, config='russian', search_type='websearch')
+        | SearchQuery(query, config='english', search_type='websearch')
+    )
+    condition = Q(search_vector=ts_query)
+    rank = SearchRank(F('search_vector'), ts_query)
+
+    if settings.SEARCH_TRIGRAM and _postgres_trigram_available(connections[queryset.db]):
+        # Опечатки: «зарятник» найдёт «зарядник» через name % query
+        condition |= Q(name__trigram_similar=query)
+        rank = rank + TrigramSimilarity('name', query)
+
+    # ts_rank возвращает real; приводим к double, чтобы значение без потерь
+    # проходило через курсор пагинации и сравнивалось на равенство
+    rank = Cast(rank, FloatField())
+    return queryset.filter(condition).annotate(rank=rank).order_by('-rank', '-pk')
+
+
+def fts_match_expression(query):
+    """Запрос пользователя -> выражение MATCH для FTS5.
+
+    Каждое слово берётся в кавычки (спецсимволы FTS5 не ломают запрос)
+    и ищется как префикс — это частично заменяет отсутствующую морфологию.
+    """
+    words = WORD_RE.findall(query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _bm25(table):
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    # bm25 тем меньше, чем лучше совпадение — меняем знак, чтобы rank рос
+    # с релевантностью, как в PostgreSQL
+    return f'-bm25({FTS_TABLE}, {weights})'
+
+
+def _search_sqlite(queryset, query):
+    match = fts_match_expression(query)
+    if not match:
+        return queryset.none()
+
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+        select={'rank': _bm25(table)},
+        order_by=['-rank', '-id'],
+    )
+
+
+def filter_after(queryset, rank, pk):
+    """Курсорная пагинация по выдаче apply_search: строки строго после (rank, pk)"""
+    connection = connections[queryset.db]
+    if connection.vendor == 'sqlite' and _sqlite_fts_available(connection):
+        # rank здесь — выражение extra(select), через ORM его не отфильтровать
+        table = queryset.model._meta.db_table
+        rank_sql = _bm25(table)
+        return queryset.extra(
+            where=[f'({rank_sql} < %s OR ({rank_sql} = %s AND {table}.id < %s))'],
+            params=[rank, rank, pk],
+        )
+    return queryset.filter(rank__lte=rank).exclude(rank=rank, pk__gte=pk)
+
+
+def _search_icontains(queryset, query):
+    # В SQLite LIKE сводит регистр только у ASCII: «кабель» не найдёт «Кабель»
+    return (
+        queryset.filter(Q(name__icontains=query) | Q(description__icontains=query))
+        .annotate(rank=Value(0.0, output_field=FloatField()))
+        .order_by('-rank', '-pk')
+    )
+
+
+def _sqlite_fts_available(connection):
+    if connection.alias not in _fts_available:
+        _fts_available[connection.alias] = _has_table(connection, FTS_TABLE)
+    return _fts_available[connection.alias]
+
+
+def _postgres_trigram_available(connection):
+    # Миграция не падает без pg_trgm — значит, и поиск не должен слать name % query
+    if connection.alias not in _trigram_available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available[connection.alias] = cursor.fetchone() is not None
+    return _trigram_available[connection.alias]
+
+
+# DDL индекса — вызывается из миграций
+
+POSTGRES_VECTOR = """
+    setweight(to_tsvector('russian', translate(coalesce({row}.name, ''), 'ёЁ', 'еЕ')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}.name, '')), 'A') ||
+    setweight(to_tsvector('russian', translate(coalesce({row}.description, ''), 'ёЁ', 'еЕ')), 'B') ||
+    setweight(to_tsvector('english', coalesce({row}.description, '')), 'B')
+"""
+
+POSTGRES_TRIGGERS = [
+    f"""
+    CREATE OR REPLACE FUNCTION inventory_item_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {POSTGRES_VECTOR.format(row='NEW')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    "DROP TRIGGER IF EXISTS inventory_item_search_vector ON inventory_item;",
+    """
+    CREATE TRIGGER inventory_item_search_vector
+    BEFORE INSERT OR UPDATE OF name, description ON inventory_item
+    FOR EACH ROW EXECUTE FUNCTION inventory_item_search_vector_update();
+    """,
+]
+
+POSTGRES_INDEX = [
+    f"UPDATE inventory_item SET search_vector = {POSTGRES_VECTOR.format(row='inventory_item')};",
+    "CREATE INDEX inventory_item_search_vector_gin ON inventory_item USING gin (search_vector);",
+]
+
+POSTGRES_TRIGRAM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+    "CREATE INDEX inventory_item_name_trgm ON inventory_item USING gin (name gin_trgm_ops);",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS inventory_item_name_trgm;",
+    "DROP INDEX IF EXISTS inventory_item_search_vector_gin;",
+    "DROP TRIGGER IF EXISTS inventory_item_search_vector ON inventory_item;",
+    "DROP FUNCTION IF EXISTS inventory_item_search_vector_update();",
+]
+
+SQLITE_NORMALIZED = "replace(replace(coalesce({row}.{field}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _sqlite_values(row):
+    return ', '.join(
+        SQLITE_NORMALIZED.format(row=row, field=field) for field in ('name', 'description')
+    )
+
+
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS inventory_item_fts_insert AFTER INSERT ON inventory_item BEGIN
+        INSERT INTO inventory_item_fts (rowid, name, description)
+        VALUES (new.id, {_sqlite_values('new')});
+    END;
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS inventory_item_fts_update AFTER UPDATE OF name, description ON inventory_item BEGIN
+        DELETE FROM inventory_item_fts WHERE rowid = old.id;
+        INSERT INTO inventory_item_fts (rowid, name, description)
+        VALUES (new.id, {_sqlite_values('new')});
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_item_fts_delete AFTER DELETE ON inventory_item BEGIN
+        DELETE FROM inventory_item_fts WHERE rowid = old.id;
+    END;
+    """,
+]
+
+SQLITE_TABLE = """
+    CREATE VIRTUAL TABLE inventory_item_fts USING fts5(
+        name, description, tokenize = 'unicode61 remove_diacritics 2'
+    );
+"""
+
+SQLITE_BACKFILL = f"""
+    INSERT INTO inventory_item_fts (rowid, name, description)
+    SELECT id, {_sqlite_values('inventory_item')} FROM inventory_item;
+"""
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS inventory_item_fts_insert;",
+    "DROP TRIGGER IF EXISTS inventory_item_fts_update;",
+    "DROP TRIGGER IF EXISTS inventory_item_fts_delete;",
+    "DROP TABLE IF EXISTS inventory_item_fts;",
+]
+
+
+def _execute(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql, params=None)
+
+
+def install_search_triggers(schema_editor):
+    """(Пере)создаёт триггеры индекса.
+
+    SQLite теряет триггеры, когда миграция пересоздаёт таблицу inventory_item,
+    поэтому такие миграции должны вызывать эту функцию ещё раз.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute(schema_editor, POSTGRES_TRIGGERS)
+    elif vendor == 'sqlite' and _has_table(schema_editor.connection, FTS_TABLE):
+        _execute(schema_editor, SQLITE_TRIGGERS)
+
+
+def install_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute(schema_editor, POSTGRES_TRIGGERS + POSTGRES_INDEX)
+        # pg_trgm может быть недоступен — тогда работаем без нечёткого поиска
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                _execute(schema_editor, POSTGRES_TRIGRAM)
+        except DatabaseError as exc:
+            logger.warning('pg_trgm недоступен, триграммный индекс не создан: %s', exc)
+    elif vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                _execute(schema_editor, [SQLITE_TABLE])
+        except DatabaseError as exc:
+            logger.warning('FTS5 недоступен, поиск будет через LIKE: %s', exc)
+            return
+        _execute(schema_editor, SQLITE_TRIGGERS + [SQLITE_BACKFILL])
+
+
+def uninstall_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute(schema_editor, POSTGRES_BACKWARD)
+    elif vendor == 'sqlite':
+        _execute(schema_editor, SQLITE_BACKWARD)
+
+
+def _has_table(connection, name):
+    return name in connection.introspection.table_names()
@@ -0,0 +1,236 @@
+"""Синтетический инвентарь для бенчмарков и разработки.
+
+Всё определяется seed: при одних и тех же параметрах получается одна и та
+же база (с точностью до id). Названия — русские и английские, как в
+настоящем доме; популярность категорий и мест убывает по Ципфу: на кухне
+и в гараже тысячи вещей, в дальней коробке — единицы. Места — дерево
+«дом → комната → шкаф → коробка». Вещи пишутся пачками мимо модели (COPY
+на PostgreSQL, executemany на остальных), сводки обновляются в той же
+транзакции, что и пачка.
+"""
+import io
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageDraw
+
+from categories.models import Category
+from inventory import rollups
+from inventory.cache import tiered_cache
+from inventory.importing import COPY_COLUMNS, DEFAULT_BATCH_SIZE, ImportStats, copy_rows
+from inventory.models import InventoryRollup, Item, Stocktake, StocktakeScan
+from inventory.suggest import suggest_index
+from locations import tree
+from locations.models import Location, LocationClosure
+
+SEED_COLUMNS = COPY_COLUMNS + ('photo',)
+
+# Даты считаются от фиксированного дня, а не от «сейчас» — иначе база каждый раз другая
+ANCHOR = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+HISTORY_DAYS = 3 * 365
+
+CATEGORIES = (
+    'Электроника', 'Инструменты', 'Кухня', 'Одежда', 'Документы', 'Книги', 'Спорт',
+    'Игрушки', 'Аптечка', 'Сад', 'Tools', 'Electronics', 'Camping', 'Hobby',
+)
+HOUSES = ('Квартира', 'Дача', 'Garage')
+ROOMS = ('Кухня', 'Спальня', 'Гостиная', 'Прихожая', 'Балкон', 'Кладовка', 'Детская', 'Office', 'Attic')
+STORAGE = ('Шкаф', 'Стеллаж', 'Комод', 'Полка', 'Shelf', 'Cabinet')
+BOXES = ('Коробка', 'Ящик', 'Контейнер', 'Box', 'Bin')
+
+RU_NOUNS = (
+    'Зарядник', 'Кабель', 'Удлинитель', 'Молоток', 'Отвёртка', 'Дрель', 'Рулетка', 'Фонарик',
+    'Наушники', 'Роутер', 'Клавиатура', 'Книга', 'Куртка', 'Свитер', 'Кастрюля', 'Сковорода',
+    'Термос', 'Плед', 'Рюкзак', 'Палатка', 'Паспорт', 'Гарантийный талон', 'Батарейки', 'Лампа',
+    'Ножницы', 'Перчатки', 'Секатор', 'Гантели', 'Конструктор', 'Пазл', 'Градусник', 'Пластырь',
+)
+EN_ADJECTIVES = ('Red', 'Old', 'Spare', 'Small', 'Large', 'Wireless', 'Folding', 'Vintage', 'Portable', 'Blue')
+EN_NOUNS = (
+    'Charger', 'Cable', 'Hammer', 'Screwdriver', 'Drill', 'Flashlight', 'Headphones', 'Router',
+    'Keyboard', 'Book', 'Jacket', 'Kettle', 'Blanket', 'Backpack', 'Tent', 'Lamp', 'Scissors',
+    'Gloves', 'Dumbbells', 'Puzzle', 'Thermometer', 'Camera', 'Tripod', 'Board game',
+)
+# Уточнения без рода — чтобы не согласовывать прилагательные
+QUALIFIERS = (
+    'Bosch', 'Makita', 'Xiaomi', 'Samsung', 'IKEA', 'Philips', 'USB-C', 'HDMI', '2 м', '5 м',
+    'XL', 'M', '№3', 'для дачи', 'в чехле', 'с зарядкой', 'из Икеи', 'запасной комплект',
+)
+DESCRIPTIONS = (
+    'Лежит в коробке, инструкция внутри',
+    'Куплено в подарок, чек в папке с документами',
+    'Нужно отнести в ремонт',
+    'Comes with the original box and manual',
+    'Берём с собой в поход',
+    'Seasonal — used in summer only',
+)
+
+# Фото — несколько картинок на всю базу: бенчмарку важны ссылки и превью, а не пиксели
+PHOTO_POOL = 12
+
+
+def zipf_weights(count, exponent=1.0):
+    """Накопленные веса для random.choices: i-й элемент в 1/i^exponent раз популярнее последнего"""
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def default_locations(items):
+    """Мест примерно по одному на двести вещей, но не меньше 10 и не больше 5000"""
+    return min(max(items // 200, 10), 5000)
+
+
+def item_name(rng):
+    if rng.random() < 0.7:
+        name = rng.choice(RU_NOUNS)
+    else:
+        name = f'{rng.choice(EN_ADJECTIVES)} {rng.choice(EN_NOUNS).lower()}'
+    if rng.random() < 0.6:
+        name = f'{name} {rng.choice(QUALIFIERS)}'
+    return name
+
+
+def create_categories(count, using='default'):
+    names = [CATEGORIES[i % len(CATEGORIES)] + (f' {i // len(CATEGORIES) + 1}' if i >= len(CATEGORIES) else '')
+             for i in range(count)]
+    created = Category.objects.using(using).bulk_create([Category(name=name) for name in names])
+    rollups.apply_deltas(rollups.count_deltas(InventoryRollup.CATEGORIES, len(created)), using=using)
+    return [category.pk for category in created]
+
+
+def create_locations(count, rng, using='default'):
+    """Дерево мест из count узлов; возвращает id в порядке создания (сначала верхние уровни)"""
+    houses = Location.objects.using(using).bulk_create([
+        Location(name=name) for name in HOUSES[:max(1, min(len(HOUSES), count // 10))]
+    ])
+    levels = [houses]
+    remaining = count - len(houses)
+    # Комнаты, шкафы, коробки: каждый уровень примерно в три раза шире предыдущего
+    for names, share in ((ROOMS, 0.1), (STORAGE, 0.3), (BOXES, 1.0)):
+        size = remaining if names is BOXES else min(remaining, max(len(levels[-1]), round(count * share)))
+        if size <= 0:
+            break
+        parents = levels[-1]
+        level = Location.objects.using(using).bulk_create([
+            Location(name=f'{rng.choice(names)} {i + 1}', parent=parents[i % len(parents)])
+            for i in range(size)
+        ])
+        levels.append(level)
+        remaining -= size
+    # bulk_create не шлёт сигналы — таблицу вложенности строим целиком
+    tree.rebuild(using)
+    pks = [location.pk for level in levels for location in level]
+    rollups.apply_deltas(rollups.count_deltas(InventoryRollup.LOCATIONS, len(pks)), using=using)
+    return pks
+
+
+def create_photos(seed):
+    """PHOTO_POOL картинок JPEG в хранилище фото вещей; возвращает их имена"""
+    storage = Item._meta.get_field('photo').storage
+    rng = random.Random(seed)
+    names = []
+    for index in range(PHOTO_POOL):
+        image = Image.new('RGB', (1200, 900), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(6):
+            x, y = rng.randrange(1000), rng.randrange(700)
+            draw.rectangle((x, y, x + rng.randrange(50, 400), y + rng.randrange(50, 300)),
+                           fill=tuple(rng.randrange(256) for _ in range(3)))
+        name = f'items/seed-{seed}-{index}.jpg'
+        if storage.exists(name):
+            names.append(name)
+            continue
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=80)
+        names.append(storage.save(name, ContentFile(buffer.getvalue())))
+    return names
+
+
+def item_rows(count, rng, category_ids, location_ids, photos=(), photo_share=0.0, offset=0, total=None):
+    """Кортежи в порядке SEED_COLUMNS; даты создания растут вместе с номером, как в живой базе"""
+    total = total or count
+    category_weights = zipf_weights(len(category_ids))
+    location_weights = zipf_weights(len(location_ids))
+    step = timedelta(days=HISTORY_DAYS) / max(total, 1)
+    start = ANCHOR - timedelta(days=HISTORY_DAYS)
+    for index in range(offset, offset + count):
+        created = start + step * index + timedelta(seconds=rng.randrange(60))
+        category = rng.choices(category_ids, cum_weights=category_weights)[0] if category_ids and rng.random() < 0.9 else None
+        location = rng.choices(location_ids, cum_weights=location_weights)[0] if location_ids and rng.random() < 0.95 else None
+        price = Decimal(rng.randrange(50, 500000)) / 100 if rng.random() < 0.7 else None
+        purchased = (created - timedelta(days=rng.randrange(1000))).date() if rng.random() < 0.6 else None
+        description = rng.choice(DESCRIPTIONS) if rng.random() < 0.5 else ''
+        photo = rng.choice(photos) if photos and rng.random() < photo_share else ''
+        yield (item_name(rng), description, category, location, price, purchased, '', '', created, created, photo)
+
+
+def insert_items(rows, using='default'):
+    """Кортежи в порядке SEED_COLUMNS: COPY на PostgreSQL, executemany на остальных.
+
+    Не bulk_create: тот выставил бы created_at/updated_at через auto_now_add,
+    а генератору нужны даты из истории — по ним строятся выборки бенчмарка.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        copy_rows(connection, rows, columns=SEED_COLUMNS)
+        return
+    fields = [Item._meta.get_field(column) for column in SEED_COLUMNS]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(Item._meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+            for row in rows
+        ])
+
+
+def clear_inventory(using='default'):
+    """Удаляет вещи, места, категории и инвентаризации — без сигналов, одной транзакцией"""
+    with transaction.atomic(using=using):
+        for model in (StocktakeScan, Stocktake, Item, LocationClosure, Location, Category):
+            model.objects.using(using).all()._raw_delete(using)
+        rollups.rebuild_rollups(using)
+    suggest_index.invalidate()
+    tiered_cache.bump('items', 'refs')
+
+
+def generate_inventory(items, seed=0, categories=len(CATEGORIES), locations=None, photos=0.0,
+                       batch_size=DEFAULT_BATCH_SIZE, progress=None, using='default'):
+    """Добавляет в базу items вещей с категориями и местами; photos — доля вещей с фото (0..1).
+
+    progress — функция, которую зовут после каждой пачки с ImportStats.
+    """
+    rng = random.Random(seed)
+    stats = ImportStats()
+    with transaction.atomic(using=using):
+        category_ids = create_categories(categories, using)
+        location_ids = create_locations(locations or default_locations(items), rng, using)
+    # Популярные места — не обязательно первые созданные
+    rng.shuffle(location_ids)
+    photo_names = create_photos(seed) if photos else ()
+
+    for offset in range(0, items, batch_size):
+        rows = list(item_rows(min(batch_size, items - offset), rng, category_ids, location_ids,
+                              photo_names, photos, offset=offset, total=items))
+        with transaction.atomic(using=using):
+            insert_items(rows, using=using)
+            rollups.apply_deltas(rollups.item_deltas(row[2:5] for row in rows), using=using)
+        stats.rows += len(rows)
+        stats.imported += len(rows)
+        if progress:
+            progress(stats)
+
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        # Свежая статистика планировщику — иначе первые замеры идут по планам для пустых таблиц
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE inventory_item, locations_location, locations_locationclosure, '
+                           'categories_category')
+    suggest_index.invalidate()
+    tiered_cache.bump('items', 'refs')
+    return stats
@@ -0,0 +1,126 @@
+"""Сигналы моделей: поддерживают производные структуры в актуальном состоянии"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from categories.models import Category
+from inventory import jobs, rollups, thumbnails
+from inventory.cache import tiered_cache
+from inventory.models import InventoryRollup, Item
+from inventory.suggest import suggest_index
+from inventory.tasks import QR_CODE_TASK
+from locations.models import Location
+
+SUGGEST_KINDS = {
+    Item: 'item',
+    Category: 'category',
+    Location: 'location',
+}
+
+# Справочник -> (срез с числом записей, срез вещей по ключу)
+ROLLUP_SCOPES = {
+    Category: (InventoryRollup.CATEGORIES, InventoryRollup.CATEGORY),
+    Location: (InventoryRollup.LOCATIONS, InventoryRollup.LOCATION),
+}
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Location)
+def update_suggest_index(sender, instance, **kwargs):
+    suggest_index.add(SUGGEST_KINDS[sender], instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Location)
+def remove_from_suggest_index(sender, instance, **kwargs):
+    suggest_index.remove(SUGGEST_KINDS[sender], instance.pk)
+
+
+@receiver(pre_save, sender=Item)
+@receiver(pre_delete, sender=Item)
+def remember_rollup_state(sender, instance, raw=False, using=None, **kwargs):
+    # Вещь загружена без нужных полей (или создана как Item(pk=...)) — дочитываем
+    if raw or instance.pk is None or getattr(instance, '_rollup_state', None) is not None:
+        return
+    instance._rollup_state = (
+        Item.objects.using(using)
+        .filter(pk=instance.pk)
+        .values_list('category_id', 'location_id', 'price')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Item)
+def update_item_rollups(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_rollup_state', None)
+    # save() отложенные поля не пишет — для них в базе остались прежние значения
+    new = instance.rollup_state(fallback=old)
+    if old != new:
+        rollups.apply_deltas(rollups.item_change_deltas(old, new), using=using)
+    instance._rollup_state = new
+
+
+@receiver(post_delete, sender=Item)
+def remove_item_rollups(sender, instance, using=None, **kwargs):
+    state = getattr(instance, '_rollup_state', None)
+    if state is not None:
+        rollups.apply_deltas(rollups.item_change_deltas(state, None), using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Location)
+def count_created_reference(sender, instance, created, raw=False, using=None, **kwargs):
+    if created and not raw:
+        rollups.apply_deltas(rollups.count_deltas(ROLLUP_SCOPES[sender][0], 1), using=using)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Location)
+def count_deleted_reference(sender, instance, using=None, **kwargs):
+    count_scope, items_scope = ROLLUP_SCOPES[sender]
+    rollups.apply_deltas(rollups.count_deltas(count_scope, -1), using=using)
+    # Вещи удалённой категории/места остались, но уже без неё (SET_NULL)
+    rollups.fold_into_unassigned(items_scope, instance.pk, using=using)
+
+
+def bump_cache(*namespaces, using=None):
+    """Инвалидирует кэш после коммита, чтобы никто не закэшировал старые данные заново"""
+    transaction.on_commit(lambda: tiered_cache.bump(*namespaces), using=using)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_item_cache(sender, instance, using=None, **kwargs):
+    bump_cache(f'item:{instance.pk}', 'items', using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Location)
+def invalidate_reference_cache(sender, instance, using=None, **kwargs):
+    # Названия категорий и мест видны и в сайдбаре, и на страницах вещей
+    bump_cache('refs', 'items', using=using)
+
+
+@receiver(post_save, sender=Item)
+def schedule_thumbnails(sender, instance, raw=False, using=None, **kwargs):
+    # Фото не загружалось (отложенное поле) — значит, и не менялось
+    if raw or {'photo', 'photo_thumbs'} & instance.get_deferred_fields():
+        return
+    if (instance.photo.name or '') != instance.photo_thumbs:
+        # Превью строятся в фоне и только после коммита — иначе пул не увидит фото
+        pk = instance.pk
+        transaction.on_commit(lambda: thumbnails.schedule(pk), using=using)
+
+
+@receiver(post_save, sender=Item)
+def schedule_qr_code(sender, instance, created, raw=False, using=None, **kwargs):
+    # Задача ставится в той же транзакции: откат сохранения уберёт и её
+    if created and not raw and settings.QR_CODE_FILES and not instance.qr_code:
+        jobs.enqueue(QR_CODE_TASK, {'item_id': instance.pk}, using=using)
@@ -0,0 +1,147 @@
+"""Сканирование пачкой и инвентаризация мест.
+
+Сканер копит коды и отправляет их сотнями: resolve_codes() превращает пачку
+в короткие записи вещей одним запросом. При инвентаризации найденные вещи
+пишутся одним INSERT на пачку (повторный скан той же вещи ничего не
+добавляет), а сверка «должно лежать / нашли» — это разности множеств в БД:
+NOT IN по подзапросу сканов и по поддереву мест, без запроса на вещь.
+"""
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from inventory.bulk import move_items
+from inventory.models import Item, Stocktake, StocktakeScan
+from locations import tree
+
+# Сколько кодов принимает один запрос
+SCAN_MAX_CODES = 1000
+# Сколько строк в одном INSERT сканов
+SCAN_BATCH_SIZE = 1000
+# Сколько недостающих и чужих вещей отдаётся списком при сверке
+RECONCILE_LIMIT = 500
+
+
+class StocktakeClosed(ValueError):
+    pass
+
+
+def parse_code(code):
+    """id вещи из содержимого QR-кода (адрес страницы вещи) или просто числа; иначе None"""
+    code = (code or '').strip()
+    if code.isdigit():
+        return int(code)
+    path = urlsplit(code).path
+    # SITE_URL может быть с префиксом пути: https://example.com/inventory
+    prefix = urlsplit(settings.SITE_URL).path.rstrip('/')
+    if prefix and path.startswith(prefix + '/'):
+        path = path[len(prefix):]
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    if match.view_name != 'inventory:item-detail':
+        return None
+    return match.kwargs['pk']
+
+
+def _records(queryset):
+    return {
+        pk: {'id': pk, 'name': name, 'location_id': location_id, 'location': location}
+        for pk, name, location_id, location in queryset.values_list('pk', 'name', 'location_id', 'location__name')
+    }
+
+
+def resolve_codes(codes, using='default'):
+    """Пачка кодов -> {'items': записи в порядке сканирования, 'unknown': нераспознанные коды}.
+
+    Один запрос на всю пачку; повторы кода схлопываются.
+    """
+    ids = {}
+    unknown = []
+    for code in dict.fromkeys(codes):
+        pk = parse_code(code)
+        if pk is None:
+            unknown.append(code)
+        else:
+            ids.setdefault(pk, code)
+    found = _records(Item.objects.using(using).filter(pk__in=list(ids))) if ids else {}
+    unknown += [code for pk, code in ids.items() if pk not in found]
+    return {
+        'items': [{'code': code, **found[pk]} for pk, code in ids.items() if pk in found],
+        'unknown': unknown,
+    }
+
+
+def record_scans(stocktake, codes, using='default'):
+    """Распознаёт коды и отмечает вещи найденными; возвращает то же, что resolve_codes()"""
+    if stocktake.status != Stocktake.OPEN:
+        raise StocktakeClosed('Инвентаризация уже завершена')
+    resolved = resolve_codes(codes, using)
+    now = timezone.now()
+    StocktakeScan.objects.using(using).bulk_create(
+        [StocktakeScan(stocktake=stocktake, item_id=row['id'], scanned_at=now) for row in resolved['items']],
+        batch_size=SCAN_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return resolved
+
+
+def _sets(stocktake, using):
+    """Условия «должна быть в месте» и «отсканирована» — подзапросы, без выборки id"""
+    expected = tree.subtree_q(stocktake.location_id, using=using)
+    scanned = Exists(StocktakeScan.objects.using(using).filter(stocktake_id=stocktake.pk, item_id=OuterRef('pk')))
+    return expected, scanned
+
+
+def reconcile(stocktake, limit=RECONCILE_LIMIT, using='default'):
+    """Сверка: сколько вещей ожидалось в месте, сколько нашли, чего нет и что лежит не там.
+
+    Три запроса при любом числе вещей: счётчики одним агрегатом и два списка
+    (не длиннее limit) — недостающие и найденные здесь, хотя числятся в другом месте.
+    """
+    expected, scanned = _sets(stocktake, using)
+    items = Item.objects.using(using)
+    counts = items.filter(expected | Q(scanned)).aggregate(
+        expected=Count('pk', filter=expected),
+        scanned=Count('pk', filter=Q(scanned)),
+        found=Count('pk', filter=expected & Q(scanned)),
+    )
+    missing = items.filter(expected).exclude(scanned).order_by('name', 'pk')[:limit]
+    misplaced = items.filter(scanned).exclude(expected).order_by('name', 'pk')[:limit]
+    return {
+        **counts,
+        'missing_count': counts['expected'] - counts['found'],
+        'misplaced_count': counts['scanned'] - counts['found'],
+        'missing': list(_records(missing).values()),
+        'misplaced': list(_records(misplaced).values()),
+    }
+
+
+def close(stocktake, move_misplaced=False, using='default'):
+    """Завершает инвентаризацию и сохраняет итог сверки.
+
+    move_misplaced=True — найденные здесь чужие вещи переносятся в место
+    инвентаризации одной пачкой (inventory.bulk.move_items).
+    """
+    with transaction.atomic(using=using):
+        stocktake = Stocktake.objects.using(using).select_for_update().get(pk=stocktake.pk)
+        if stocktake.status != Stocktake.OPEN:
+            raise StocktakeClosed('Инвентаризация уже завершена')
+        summary = reconcile(stocktake, limit=0, using=using)
+        for name in ('missing', 'misplaced'):
+            del summary[name]
+        summary['moved'] = 0
+        if move_misplaced and summary['misplaced_count']:
+            expected, scanned = _sets(stocktake, using)
+            ids = list(Item.objects.using(using).filter(scanned).exclude(expected).values_list('pk', flat=True))
+            summary['moved'] = len(move_items(ids, stocktake.location_id, using=using))
+        stocktake.status = Stocktake.CLOSED
+        stocktake.closed_at = timezone.now()
+        stocktake.summary = summary
+        stocktake.save(update_fields=['status', 'closed_at', 'summary'])
+    return stocktake
@@ -0,0 +1,220 @@
+"""Префиксный индекс для подсказок в строке поиска.
+
+Держит в памяти процесса отсортированные списки ключей (название целиком и
+каждый его «хвост» с начала слова, в нижнем регистре) отдельно для вещей,
+категорий и мест и ищет по ним через bisect. Строится лениво при первом
+запросе, дальше обновляется сигналами post_save/post_delete. Записи из других процессов и массовых путей
+(bulk_create, COPY) подхватываются фоновой перестройкой раз в
+SUGGEST_INDEX_TTL секунд или сразу после invalidate().
+"""
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+KINDS = ('item', 'category', 'location')
+
+# Сколько ключей максимум просматриваем на один запрос — защита от «а»
+MAX_SCAN = 5000
+
+WORD_START_RE = re.compile(r'(?<!\w)\w', re.UNICODE)
+
+
+def normalize(text):
+    return (text or '').strip().casefold().replace('ё', 'е')
+
+
+def _keys_for(label):
+    """Ключ всего названия и ключи, начинающиеся с каждого следующего слова"""
+    text = normalize(label)
+    words = {text[match.start():] for match in WORD_START_RE.finditer(text)}
+    words.discard(text)
+    return text, words
+
+
+class _SortedKeys:
+    """Отсортированные ключи и параллельный список pk"""
+
+    __slots__ = ('keys', 'pks')
+
+    def __init__(self, pairs=()):
+        pairs = sorted(pairs)
+        self.keys = [key for key, _ in pairs]
+        self.pks = [pk for _, pk in pairs]
+
+    def insert(self, key, pk):
+        position = bisect_left(self.keys, key)
+        self.keys.insert(position, key)
+        self.pks.insert(position, pk)
+
+    def delete(self, key, pk):
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position] == key:
+            if self.pks[position] == pk:
+                del self.keys[position]
+                del self.pks[position]
+                return
+            position += 1
+
+    def scan(self, prefix):
+        position = bisect_left(self.keys, prefix)
+        end = min(len(self.keys), position + MAX_SCAN)
+        while position < end and self.keys[position].startswith(prefix):
+            yield self.pks[position]
+            position += 1
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # kind -> (ключи целых названий, ключи с начала слов)
+        self._buckets = {}
+        self._labels = {}     # (kind, pk) -> название
+        self._built_at = None
+        self._build_seconds = None
+        self._memory_bytes = 0
+        self._stale = False
+        self._rebuilding = False
+
+    # --- построение ---
+
+    def build(self):
+        from categories.models import Category
+        from inventory.models import Item
+        from locations.models import Location
+
+        started = time.perf_counter()
+        labels = {}
+        buckets = {}
+        for kind, model in (('item', Item), ('category', Category), ('location', Location)):
+            whole, words = [], []
+            rows = model.objects.order_by().values_list('pk', 'name').iterator(chunk_size=5000)
+            for pk, name in rows:
+                labels[(kind, pk)] = name
+                key, word_keys = _keys_for(name)
+                whole.append((key, pk))
+                words.extend((word_key, pk) for word_key in word_keys)
+            buckets[kind] = (_SortedKeys(whole), _SortedKeys(words))
+
+        with self._lock:
+            self._buckets, self._labels = buckets, labels
+            self._built_at = time.time()
+            self._build_seconds = time.perf_counter() - started
+            self._memory_bytes = self._measure()
+            self._stale = False
+
+    def _measure(self):
+        """Примерный объём памяти: списки, ключи, pk и словарь названий"""
+        size = sys.getsizeof(self._labels)
+        for bucket in self._buckets.values():
+            for sorted_keys in bucket:
+                size += sys.getsizeof(sorted_keys.keys) + sys.getsizeof(sorted_keys.pks)
+                size += sum(sys.getsizeof(key) for key in sorted_keys.keys)
+        size += sum(sys.getsizeof(ref) + sys.getsizeof(ref[1]) for ref in self._labels)
+        size += sum(sys.getsizeof(label) for label in self._labels.values())
+        return size
+
+    def ensure_built(self):
+        if self._built_at is None:
+            with self._lock:
+                if self._built_at is None:
+                    self.build()
+            return
+
+        ttl = settings.SUGGEST_INDEX_TTL
+        expired = ttl and time.time() - self._built_at > ttl
+        if (self._stale or expired) and not self._rebuilding:
+            self._rebuild_in_background()
+
+    def _rebuild_in_background(self):
+        self._rebuilding = True
+
+        def run():
+            from django.db import connection
+            try:
+                self.build()
+            finally:
+                self._rebuilding = False
+                connection.close()
+
+        threading.Thread(target=run, name='suggest-index-rebuild', daemon=True).start()
+
+    def invalidate(self):
+        """Пометить индекс устаревшим: перестроится в фоне при следующем запросе"""
+        self._stale = True
+
+    # --- инкрементальные изменения ---
+
+    def add(self, kind, pk, label):
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove(kind, pk)
+            self._labels[(kind, pk)] = label
+            whole, words = self._buckets[kind]
+            key, word_keys = _keys_for(label)
+            whole.insert(key, pk)
+            for word_key in word_keys:
+                words.insert(word_key, pk)
+
+    def remove(self, kind, pk):
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove(kind, pk)
+
+    def _remove(self, kind, pk):
+        label = self._labels.pop((kind, pk), None)
+        if label is None:
+            return
+        whole, words = self._buckets[kind]
+        key, word_keys = _keys_for(label)
+        whole.delete(key, pk)
+        for word_key in word_keys:
+            words.delete(word_key, pk)
+
+    # --- поиск ---
+
+    def suggest(self, prefix, limit=8):
+        """До limit названий каждого типа, начинающихся с prefix.
+
+        Сначала совпадения с начала названия, потом — с начала слова.
+        """
+        prefix = normalize(prefix)
+        result = {kind: [] for kind in KINDS}
+        if not prefix:
+            return result
+
+        self.ensure_built()
+        with self._lock:
+            for kind in KINDS:
+                found = result[kind]
+                seen = set()
+                for sorted_keys in self._buckets[kind]:
+                    for pk in sorted_keys.scan(prefix):
+                        if len(found) >= limit:
+                            break
+                        if pk not in seen:
+                            seen.add(pk)
+                            found.append({'id': pk, 'name': self._labels[(kind, pk)]})
+        return result
+
+    def stats(self):
+        return {
+            'entries': sum(
+                len(sorted_keys.keys)
+                for bucket in self._buckets.values()
+                for sorted_keys in bucket
+            ),
+            'names': len(self._labels),
+            'memory_bytes': self._memory_bytes,
+            'build_ms': round(self._build_seconds * 1000, 1) if self._build_seconds is not None else None,
+            'built_at': self._built_at,
+            'stale': self._stale,
+        }
+
+
+suggest_index = PrefixIndex()
@@ -0,0 +1,43 @@
+"""Фоновые задачи инвентаря для очереди из inventory/jobs.py"""
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from inventory.exporting import export_chunks
+from inventory.jobs import task
+from inventory.models import Item
+from inventory.search import apply_search
+
+QR_CODE_TASK = 'inventory.qr_code'
+EXPORT_TASK = 'inventory.export'
+
+
+@task(QR_CODE_TASK, priority=10)
+def generate_qr_code(item_id):
+    """QR-код файлом в Item.qr_code — для печати; на сайте QR рендерится по запросу"""
+    item = Item.objects.filter(pk=item_id).only('pk', 'qr_code').first()
+    if item is None:
+        return None  # вещь удалили раньше, чем до неё дошла очередь
+    if not item.qr_code:
+        item.generate_qr_code()
+        # Без save(): сигналы пересчитали бы сводки и сбросили кэш ради поля, которого не видно
+        Item.objects.filter(pk=item_id).update(qr_code=item.qr_code.name)
+    return {'qr_code': item.qr_code.name}
+
+
+@task(EXPORT_TASK, max_attempts=2, priority=-10)
+def export_items(fmt='csv', compress=True, q=''):
+    """Выгрузка в файл в MEDIA_ROOT/exports; адрес файла — в результате задачи"""
+    queryset = apply_search(Item.objects.all(), q) if q else Item.objects.all()
+    chunks, _, filename = export_chunks(
+        queryset, fmt, compress, filename=f'inventory-{timezone.now():%Y%m%d-%H%M%S}',
+    )
+    with tempfile.TemporaryFile() as buffer:
+        for chunk in chunks:
+            buffer.write(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+        size = buffer.tell()
+        buffer.seek(0)
+        name = default_storage.save(f'exports/{filename}', File(buffer))
+    return {'name': name, 'url': default_storage.url(name), 'size': size}
@@ -1,3 +1,1444 @@
-from django.test import TestCase
+import csv
+import gzip
+import inspect
+import io
+import json
+import os
+import re
+import subprocess
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import psycopg2
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ninja.testing import TestClient
+from ninja.testing.client import NinjaResponse
+from PIL import Image
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from categories.models import Category
+from config import metrics
+from config.db.pool import ConnectionPool, PoolExhausted
+from inventory import jobs, search, views
+from inventory.api import router
+from inventory.backup import BackupError, restore_backup, write_backup
+from inventory.bulk import delete_items
+from inventory.cache import tiered_cache
+from inventory.dashboard import admin_site
+from inventory.exporting import streaming_export
+from inventory.facets import afacets
+from inventory.importing import import_items, insert_rows
+from inventory.labels import LabelLayout, label_pdf, page_jobs, render_pages
+from inventory.middleware import QueryBudgetMiddleware
+from inventory.models import InventoryRollup, Item, Job, Stocktake, StocktakeScan
+from inventory.qr import build_qr_payload, prune_qr_cache
+from inventory.rollups import diff_rollups, location_totals, location_tree_totals, rebuild_rollups, totals
+from inventory.search import apply_search
+from inventory.stocktake import reconcile, record_scans
+from inventory.suggest import suggest_index
+from inventory.thumbnails import thumbnail_name
+from locations import tree
+from locations.models import Location, LocationClosure
+
+
+def seed_inventory(items=30):
+    """Небольшой, но похожий на настоящий инвентарь: часть вещей без категории/места"""
+    categories = [Category.objects.create(name=name) for name in ('Электроника', 'Документы', 'Одежда', 'Tools')]
+    locations = [Location.objects.create(name=name) for name in ('Кухня', 'Спальня', 'Garage')]
+    Item.objects.bulk_create([
+        Item(
+            name=f'Зарядник {i}' if i % 3 else f'Charger {i}',
+            description='Кабель USB-C, лежит в коробке',
+            category=categories[i % len(categories)] if i % 5 else None,
+            location=locations[i % len(locations)] if i % 7 else None,
+            price=Decimal(i * 10) if i % 2 else None,
+        )
+        for i in range(items)
+    ])
+    rebuild_rollups()
+    return categories, locations
+
+
+# Тесты не должны трогать общий кэш разработчика
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'inventory.cache.SQLiteCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'inventory-test-cache.sqlite3',
+    },
+}
+
+
+class ApiClient(TestClient):
+    """TestClient, который выполняет и асинхронные операции ninja"""
+
+    def _call(self, func, request, kwargs):
+        response = func(request, **kwargs)
+        if inspect.isawaitable(response):
+            async def wait():
+                return await response
+            response = async_to_sync(wait)()
+        return NinjaResponse(response)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class InventoryTestCase(TestCase):
+    def setUp(self):
+        tiered_cache.clear()
+
+
+class QueryBudgetTests(InventoryTestCase):
+    """Точное число SQL-запросов на каждый эндпоинт.
+
+    Числа не должны зависеть от количества вещей — рост означает N+1.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.locations = seed_inventory()
+        cls.item = Item.objects.filter(category__isnull=False, location__isnull=False).first()
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        super().setUp()
+        self.api = ApiClient(router)
+        # Поиск один раз за процесс проверяет наличие FTS-таблицы — прогреваем
+        apply_search(Item.objects.all(), 'прогрев')
+
+    def test_item_list(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.item.location.name)
+        # Категории и места для фильтров — уже из кэша
+        with self.assertNumQueries(1):
+            self.client.get('/')
+
+    def test_item_list_with_search_and_filters(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/', {'q': 'зарядник', 'category': self.categories[1].pk})
+        self.assertEqual(response.status_code, 200)
+
+    def test_item_list_more(self):
+        with self.settings(ITEMS_PAGE_SIZE=5):
+            first = self.client.get('/')
+            cursor = first.context['next_params'].split('cursor=')[1]
+            with self.assertNumQueries(1):
+                response = self.client.get('/items/more/', {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+
+    def test_item_detail(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/item/{self.item.pk}/')
+        self.assertContains(response, self.item.category.name)
+        with self.assertNumQueries(0):
+            cached = self.client.get(f'/item/{self.item.pk}/')
+        self.assertEqual(cached.content, response.content)
+
+    def test_search_view(self):
+        request = RequestFactory().get('/search/', {'q': 'charger'})
+        with self.assertNumQueries(1):
+            response = async_to_sync(views.search_view)(request)
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_csv(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/export/')
+            body = b''.join(response.streaming_content)
+        self.assertEqual(body.decode('utf-8').count('\n'), Item.objects.count() + 1)
+
+    def test_export_csv_asgi(self):
+        response = streaming_export(Item.objects.all(), 'csv', asynchronous=True)
+        self.assertTrue(response.is_async)
+
+        async def consume():
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        with self.assertNumQueries(1):
+            body = async_to_sync(consume)()
+        self.assertEqual(body.decode('utf-8').count('\n'), Item.objects.count() + 1)
+
+    def test_item_detail_async_client(self):
+        async def get():
+            return await self.async_client.get(f'/item/{self.item.pk}/')
+
+        response = async_to_sync(get)()
+        self.assertContains(response, self.item.name)
+
+    def test_admin_changelist(self):
+        self.client.force_login(self.admin)
+        with self.assertNumQueries(7):
+            response = self.client.get('/admin/inventory/item/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_dashboard(self):
+        request = RequestFactory().get('/admin/dashboard/')
+        request.user = self.admin
+        # Итоги, топ категорий, топ мест, последние вещи — без COUNT по таблице вещей
+        with self.assertNumQueries(4):
+            response = admin_site.dashboard_view(request)
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_search(self):
+        with self.assertNumQueries(1):
+            response = self.api.get('/search', query_params={'q': 'зарядник'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json())
+
+    def test_api_get_item(self):
+        with self.assertNumQueries(1):
+            response = self.api.get(f'{self.item.pk}')
+        self.assertEqual(response.json()['category'], self.item.category.name)
+
+    def test_api_create_item(self):
+        payload = {'name': 'Паспорт', 'category_id': self.categories[1].pk, 'location_id': self.locations[0].pk}
+        # 2 справочника + INSERT + 3 строки сводок
+        with self.assertNumQueries(6):
+            response = self.api.post('/', json=payload, user=self.admin)
+        self.assertEqual(response.json()['location'], self.locations[0].name)
+
+    def test_api_bulk_create(self):
+        rows = [
+            {'name': f'Коробка {i}', 'category_id': self.categories[i % 4].pk, 'location_id': self.locations[i % 3].pk}
+            for i in range(50)
+        ]
+        with CaptureQueriesContext(connection) as captured:
+            response = self.api.post('/items/bulk', json={'items': rows}, user=self.admin)
+        self.assertEqual(response.json()['created'], 50)
+        selects = [q['sql'] for q in captured.captured_queries if q['sql'].startswith('SELECT')]
+        # Категории и места резолвятся одним запросом на пачку
+        self.assertEqual(len(selects), 2)
+
+    def test_api_fields(self):
+        response = self.api.get(f'{self.item.pk}', query_params={'fields': 'name,price'})
+        self.assertEqual(set(response.json()), {'id', 'name', 'price'})
+
+        response = self.api.get('/search', query_params={'q': 'зарядник', 'fields': 'category'})
+        self.assertEqual(set(response.json()[0]), {'id', 'category'})
+
+        response = self.api.get(f'{self.item.pk}', query_params={'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_api_mounted(self):
+        response = self.client.get(f'/api/v1/{self.item.pk}')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['name'], self.item.name)
+        self.assertEqual(self.client.get('/api/v1/stats').json()['total_items'], Item.objects.count())
+        # Запись — только для персонала
+        self.assertEqual(self.client.post('/api/v1/', {'name': 'x'}, content_type='application/json').status_code, 401)
+
+    def test_api_stats(self):
+        with self.assertNumQueries(1):
+            response = self.api.get('/stats')
+        self.assertEqual(response.json()['total_items'], Item.objects.count())
+        self.assertEqual(response.json()['categories_count'], len(self.categories))
+
+    def test_suggest_served_from_memory(self):
+        self.client.get('/api/suggest', {'q': 'з'})
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/suggest', {'q': 'зар'})
+        self.assertTrue(response.json()['items'])
+
+
+class RollupTests(InventoryTestCase):
+    """Инкрементальные сводки всегда совпадают с пересчётом с нуля"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.locations = seed_inventory(items=12)
+
+    def assertInSync(self):
+        self.assertEqual(diff_rollups(), {})
+
+    def test_save_update_delete(self):
+        item = Item.objects.create(name='Ноутбук', category=self.categories[0], price=Decimal('1500.50'))
+        self.assertInSync()
+
+        item = Item.objects.get(pk=item.pk)
+        item.category, item.location, item.price = self.categories[1], self.locations[0], 99.9
+        item.save()
+        self.assertInSync()
+
+        Item.objects.only('name').get(pk=item.pk).delete()
+        self.assertInSync()
+
+    def test_deferred_save_keeps_rollups(self):
+        item = Item.objects.filter(price__isnull=False).only('name').first()
+        item.name = 'Переименовано'
+        with self.assertNumQueries(2):  # дочитать состояние + UPDATE
+            item.save()
+        self.assertInSync()
+
+    def test_reference_delete_moves_items_to_unassigned(self):
+        self.categories[0].delete()
+        Location.objects.create(name='Чердак')
+        self.assertInSync()
+        self.assertEqual(totals()['categories_count'], len(self.categories) - 1)
+
+    def test_bulk_paths(self):
+        rows = [{'name': f'Коробка {i}', 'category_id': self.categories[1].pk, 'price': 12.5} for i in range(5)]
+        staff = User.objects.create_user('staff', is_staff=True)
+        ApiClient(router).post('/items/bulk', json={'items': rows}, user=staff)
+        Item.objects.filter(pk__in=Item.objects.values('pk')[:3]).delete()
+        self.assertInSync()
+
+    def test_reconcile_command(self):
+        InventoryRollup.objects.filter(scope=InventoryRollup.TOTAL).update(count=0)
+        self.assertTrue(diff_rollups())
+        call_command('reconcile_rollups', stdout=io.StringIO())
+        self.assertInSync()
+
+
+class BulkApiTests(InventoryTestCase):
+    """Массовые операции: постоянное число запросов, сводки и кэш в порядке"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.locations = seed_inventory(items=60)
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        self.api = ApiClient(router)
+        self.ids = list(Item.objects.order_by('pk').values_list('pk', flat=True))
+
+    def call(self, method, path, payload):
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as captured:
+                response = getattr(self.api, method)(path, json=payload, user=self.staff)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(diff_rollups(), {})
+        return response.json(), len(captured.captured_queries)
+
+    def test_move_is_constant_in_queries(self):
+        small, small_queries = self.call('post', '/items/move', {'ids': self.ids[:5], 'location_id': self.locations[0].pk})
+        large, large_queries = self.call('post', '/items/move', {'ids': self.ids, 'location_id': self.locations[1].pk})
+        self.assertEqual(large['count'], len(self.ids))
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(Item.objects.filter(location=self.locations[1]).count(), len(self.ids))
+
+    def test_patch(self):
+        etag = self.api.get(f'{self.ids[0]}')['ETag']
+        rows = [{'id': pk, 'price': 5, 'category_id': self.categories[2].pk} for pk in self.ids]
+        rows += [{'id': self.ids[0], 'name': 'Переименовано'}, {'id': 10 ** 9, 'name': 'Нет такой'}]
+        rows.append({'id': self.ids[1], 'location_id': 10 ** 9})
+        data, queries = self.call('patch', '/items/bulk', {'items': rows})
+        statuses = {result['id']: result['status'] for result in data['results']}
+        self.assertEqual(statuses[10 ** 9], 'not_found')
+        self.assertEqual(statuses[self.ids[1]], 'invalid')
+        self.assertEqual(data['count'], len(self.ids) - 1)
+        # Блокировка, справочники, UPDATE и по строке на каждую затронутую сводку
+        self.assertLessEqual(queries, 20)
+
+        item = Item.objects.get(pk=self.ids[0])
+        self.assertEqual((item.name, item.price, item.category_id), ('Переименовано', 5, self.categories[2].pk))
+        # Страница вещи в кэше сброшена
+        self.assertEqual(self.api.get(f'{self.ids[0]}', headers={'IF_NONE_MATCH': etag}).status_code, 200)
+
+    def test_patch_rejects_bad_rows_before_update(self):
+        Item.objects.filter(pk=self.ids[0]).update(description='Было')
+        rows = [
+            {'id': self.ids[0], 'description': None},
+            {'id': self.ids[1], 'price': 1e12},
+            {'id': self.ids[2], 'price': 1.234},
+            {'id': self.ids[3], 'name': 'я' * 201},
+            {'id': self.ids[4], 'price': 0.1, 'name': 'Цена с копейками'},
+        ]
+        data, _ = self.call('patch', '/items/bulk', {'items': rows})
+        results = {result['id']: result for result in data['results']}
+        self.assertEqual(data['count'], 2)
+        for pk in self.ids[1:4]:
+            self.assertEqual(results[pk]['status'], 'invalid')
+        self.assertIn('Цена', results[self.ids[1]]['error'])
+        self.assertIn('Название вещи', results[self.ids[3]]['error'])
+        self.assertEqual(Item.objects.get(pk=self.ids[0]).description, '')
+        self.assertEqual(Item.objects.get(pk=self.ids[4]).price, Decimal('0.10'))
+
+    def test_delete(self):
+        data, _ = self.call('delete', '/items/bulk', {'ids': [*self.ids[:10], 10 ** 9]})
+        self.assertEqual(data['count'], 10)
+        self.assertEqual(data['results'][-1], {'id': 10 ** 9, 'status': 'not_found', 'error': None})
+        self.assertFalse(Item.objects.filter(pk__in=self.ids[:10]).exists())
+
+    def test_requires_staff(self):
+        response = self.api.delete('/items/bulk', json={'ids': self.ids})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(Item.objects.count(), len(self.ids))
+
+
+class CacheTests(InventoryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.locations = seed_inventory(items=5)
+        cls.item = Item.objects.filter(category__isnull=False).first()
+
+    def test_shared_backend(self):
+        shared = caches['default']
+        self.assertTrue(shared.add('counter', 1, timeout=60))
+        self.assertFalse(shared.add('counter', 5, timeout=60))
+        self.assertEqual(shared.incr('counter', 2), 3)
+        shared.set('value', {'a': [1, 2]}, timeout=60)
+        self.assertEqual(shared.get_many(['value', 'counter', 'nope']), {'value': {'a': [1, 2]}, 'counter': 3})
+        shared.set('expired', 1, timeout=0)
+        self.assertIsNone(shared.get('expired'))
+        with self.assertRaises(ValueError):
+            shared.incr('expired')
+
+    def test_item_save_invalidates_detail(self):
+        url = f'/item/{self.item.pk}/'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.name = 'Переименованная вещь'
+            self.item.save()
+        self.assertContains(self.client.get(url), 'Переименованная вещь')
+
+    def test_category_rename_invalidates_sidebar(self):
+        self.client.get('/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.filter(pk=self.categories[0].pk).update(name='Инструменты')
+            self.categories[0].refresh_from_db()
+            self.categories[0].save()
+        self.assertContains(self.client.get('/'), 'Инструменты')
+
+    @override_settings(CACHE_VERSION_TTL=0)
+    def test_bump_from_other_process(self):
+        tiered_cache.get_or_set('probe', lambda: 'old', namespaces=['items'])
+        # Соседний воркер увеличил версию прямо в общем кэше
+        caches['default'].incr('ns:items')
+        self.assertEqual(tiered_cache.get_or_set('probe', lambda: 'new', namespaces=['items']), 'new')
+
+    def test_stats(self):
+        build = lambda: 'value'  # noqa: E731
+        tiered_cache.get_or_set('key', build)
+        tiered_cache.get_or_set('key', build)
+        stats = tiered_cache.stats()
+        self.assertEqual((stats['misses'], stats['local_hits']), (1, 1))
+
+
+class ConditionalGetTests(InventoryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_inventory(items=5)
+        cls.item = Item.objects.first()
+
+    def test_item_detail_revalidation(self):
+        url = f'/item/{self.item.pk}/'
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.description = 'Новое описание'
+            self.item.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_item_list_skips_queries_on_304(self):
+        etag = self.client.get('/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/', {'q': 'зарядник'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.create(name='Новая вещь')
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_api_validators(self):
+        api = ApiClient(router)
+        response = api.get(f'{self.item.pk}')
+        self.assertIn('updated_at', response.json())
+        # TestClient сам не приводит имена заголовков к виду META
+        cached = api.get(f'{self.item.pk}', headers={'IF_NONE_MATCH': response['ETag']})
+        self.assertEqual(cached.status_code, 304)
+
+        etag = api.get('/search', query_params={'q': 'зарядник'})['ETag']
+        with self.assertNumQueries(0):
+            cached = api.get('/search', query_params={'q': 'зарядник'}, headers={'IF_NONE_MATCH': etag})
+        self.assertEqual(cached.status_code, 304)
+
+
+def jpeg_bytes(size=(2000, 1500)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'teal').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ThumbnailTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.storage = Item._meta.get_field('photo').storage
+
+    def test_built_after_save(self):
+        item = Item(name='Камера')
+        item.photo.save('camera.jpg', ContentFile(jpeg_bytes()), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        item.refresh_from_db()
+        self.assertEqual(item.photo_thumbs, item.photo.name)
+        for width in settings.THUMBNAIL_WIDTHS:
+            with Image.open(self.storage.open(thumbnail_name(item.photo.name, width, 'webp'))) as thumb:
+                self.assertEqual(thumb.width, width)
+
+        page = self.client.get(f'/item/{item.pk}/').content.decode()
+        self.assertIn('image/webp', page)
+        self.assertIn('320w', page)
+
+        # Фото убрали — превью удаляются вместе с отметкой
+        old = item.photo.name
+        item.photo = None
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        item.refresh_from_db()
+        self.assertEqual(item.photo_thumbs, '')
+        self.assertFalse(self.storage.exists(thumbnail_name(old, 320, 'jpeg')))
+
+    def test_backfill_command(self):
+        name = self.storage.save('items/old.jpg', ContentFile(jpeg_bytes((800, 600))))
+        broken = self.storage.save('items/broken.jpg', ContentFile(b'not an image'))
+        # Старые вещи: фото есть, превью нет (update сигналов не шлёт)
+        good = Item.objects.create(name='Старая вещь')
+        bad = Item.objects.create(name='Битое фото')
+        Item.objects.filter(pk=good.pk).update(photo=name)
+        Item.objects.filter(pk=bad.pk).update(photo=broken)
+
+        call_command('generate_thumbnails', workers=1, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(Item.objects.get(pk=good.pk).photo_thumbs, name)
+        self.assertEqual(Item.objects.get(pk=bad.pk).photo_thumbs, '')
+        # Оригинал всего 800px: крупные превью не растягиваются
+        with Image.open(self.storage.open(thumbnail_name(name, 1280, 'jpeg'))) as thumb:
+            self.assertEqual(thumb.width, 800)
+
+        cards = self.client.get('/').content.decode()
+        self.assertIn('loading="lazy"', cards)
+        self.assertNotIn('via.placeholder.com', cards)
+
+
+class LocationTreeTests(InventoryTestCase):
+    """Гараж -> Стеллаж -> Коробка и Кухня рядом"""
+
+    def setUp(self):
+        super().setUp()
+        self.garage = Location.objects.create(name='Гараж')
+        self.rack = Location.objects.create(name='Стеллаж', parent=self.garage)
+        self.box = Location.objects.create(name='Коробка', parent=self.rack)
+        self.kitchen = Location.objects.create(name='Кухня')
+        for location, price in ((self.garage, 1), (self.rack, 10), (self.box, 100), (self.kitchen, 1000)):
+            Item.objects.create(name=f'Вещь: {location.name}', location=location, price=price)
+
+    def subtree(self, location):
+        return set(Item.objects.filter(tree.subtree_q(location.pk)).values_list('location__name', flat=True))
+
+    def test_subtree_query_and_totals(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.subtree(self.garage), {'Гараж', 'Стеллаж', 'Коробка'})
+        self.assertEqual(self.subtree(self.box), {'Коробка'})
+        with self.assertNumQueries(1):
+            self.assertEqual(location_totals(self.garage.pk), (3, 111))
+        totals = location_tree_totals()
+        self.assertEqual(totals[self.rack.pk], [2, 110])
+        self.assertEqual(totals[self.kitchen.pk], [1, 1000])
+
+    def test_move_branch(self):
+        self.rack.parent = self.kitchen
+        self.rack.save()
+        self.assertEqual(self.subtree(self.garage), {'Гараж'})
+        self.assertEqual(self.subtree(self.kitchen), {'Кухня', 'Стеллаж', 'Коробка'})
+        self.assertEqual(location_totals(self.kitchen.pk), (3, 1110))
+        self.assertEqual(
+            {pair: depth for pair, depth in tree.expected_pairs().items()},
+            {(a, d): depth for a, d, depth in LocationClosure.objects.values_list('ancestor', 'descendant', 'depth')},
+        )
+        # В собственную ветку переносить нельзя
+        self.kitchen.parent = self.box
+        with self.assertRaises(ValidationError):
+            self.kitchen.full_clean()
+
+    def test_list_filter_and_api(self):
+        page = self.client.get(f'/?location={self.rack.pk}').content.decode()
+        self.assertIn('Вещь: Коробка', page)
+        self.assertNotIn('Вещь: Гараж', page)
+        # Путь к выбранному месту и места внутри него
+        self.assertIn(f'?location={self.garage.pk}', page)
+        self.assertIn(f'?location={self.box.pk}', page)
+
+        api = ApiClient(router)
+        names = {row['name'] for row in api.get(f'/search?location={self.garage.pk}').json()}
+        self.assertEqual(names, {'Вещь: Гараж', 'Вещь: Стеллаж', 'Вещь: Коробка'})
+        locations = {row['name']: row for row in api.get('/locations').json()}
+        self.assertEqual((locations['Гараж']['items'], locations['Гараж']['value']), (3, 111.0))
+        self.assertEqual(locations['Коробка']['parent_id'], self.rack.pk)
+
+
+class FacetTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.garage = Location.objects.create(name='Гараж')
+        self.rack = Location.objects.create(name='Стеллаж', parent=self.garage)
+        self.kitchen = Location.objects.create(name='Кухня')
+        self.tools = Category.objects.create(name='Инструменты')
+        self.food = Category.objects.create(name='Продукты')
+        for name, category, location in (
+            ('Дрель ударная', self.tools, self.rack),
+            ('Дрель старая', self.tools, self.kitchen),
+            ('Шуруповёрт', self.tools, self.garage),
+            ('Консервы', self.food, self.rack),
+            ('Чай', self.food, self.kitchen),
+        ):
+            Item.objects.create(name=name, category=category, location=location)
+
+    def counts(self, rows):
+        return {row['name']: row['count'] for row in rows if row['count']}
+
+    def test_counts_follow_search_and_filters(self):
+        facets = async_to_sync(afacets)()
+        self.assertEqual(facets['total'], 5)
+        self.assertEqual(self.counts(facets['categories']), {'Инструменты': 3, 'Продукты': 2})
+        # Гараж считает и то, что лежит на стеллаже
+        self.assertEqual(self.counts(facets['locations']), {'Гараж': 3, 'Стеллаж': 2, 'Кухня': 2})
+
+        facets = async_to_sync(afacets)('дрель', location=self.garage.pk)
+        self.assertEqual(facets['total'], 1)
+        self.assertEqual(self.counts(facets['categories']), {'Инструменты': 1})
+        # Свой фильтр фасет не сужает: видно, что дрель есть и на кухне
+        self.assertEqual(self.counts(facets['locations']), {'Гараж': 1, 'Стеллаж': 1, 'Кухня': 1})
+
+        facets = async_to_sync(afacets)(category=self.food.pk)
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(self.counts(facets['categories']), {'Инструменты': 3, 'Продукты': 2})
+        self.assertEqual(self.counts(facets['locations']), {'Гараж': 1, 'Стеллаж': 1, 'Кухня': 1})
+
+    def test_cached_until_items_change(self):
+        async_to_sync(afacets)('дрель')
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(afacets)(' Дрель ')['total'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.create(name='Дрель новая', category=self.tools)
+        self.assertEqual(async_to_sync(afacets)('дрель')['total'], 3)
+
+    def test_list_and_api(self):
+        page = self.client.get('/', {'q': 'дрель', 'category': self.tools.pk}).content.decode()
+        # Ссылки фасетов сохраняют поиск и другой фильтр
+        self.assertIn(f'q=%D0%B4%D1%80%D0%B5%D0%BB%D1%8C&amp;category={self.tools.pk}&amp;location={self.garage.pk}', page)
+        self.assertNotIn('Продукты', page)
+
+        api = ApiClient(router)
+        response = api.get(f'/facets?q=дрель&location={self.kitchen.pk}')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(self.counts(data['locations']), {'Гараж': 1, 'Стеллаж': 1, 'Кухня': 1})
+        names = {row['name'] for row in api.get(f'/search?q=дрель&category={self.food.pk}').json()}
+        self.assertEqual(names, set())
+
+
+class StocktakeTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.garage = Location.objects.create(name='Гараж')
+        self.rack = Location.objects.create(name='Стеллаж', parent=self.garage)
+        self.kitchen = Location.objects.create(name='Кухня')
+        self.drill = Item.objects.create(name='Дрель', location=self.rack)
+        self.saw = Item.objects.create(name='Пила', location=self.garage)
+        self.kettle = Item.objects.create(name='Чайник', location=self.kitchen)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.api = ApiClient(router)
+
+    def test_resolve_batch(self):
+        codes = [build_qr_payload(self.drill.pk), str(self.kettle.pk), build_qr_payload(self.drill.pk),
+                 'https://example.com/', '999999']
+        with self.assertNumQueries(1):
+            response = self.api.post('/scan/resolve', json={'codes': codes})
+        data = response.json()
+        self.assertEqual([row['id'] for row in data['items']], [self.drill.pk, self.kettle.pk])
+        self.assertEqual(data['items'][0]['location'], 'Стеллаж')
+        self.assertEqual(data['unknown'], ['https://example.com/', '999999'])
+
+    def test_reconcile_and_close(self):
+        response = self.api.post('/stocktakes', json={'location_id': self.garage.pk}, user=self.admin)
+        self.assertEqual(response.status_code, 201)
+        stocktake_id = response.json()['id']
+        url = f'/stocktakes/{stocktake_id}'
+        codes = [build_qr_payload(self.drill.pk), build_qr_payload(self.kettle.pk)]
+        self.api.post(f'{url}/scans', json={'codes': codes}, user=self.admin)
+        # Повторная пачка не добавляет строк
+        self.api.post(f'{url}/scans', json={'codes': codes[:1]}, user=self.admin)
+        self.assertEqual(StocktakeScan.objects.filter(stocktake_id=stocktake_id).count(), 2)
+
+        stocktake = Stocktake.objects.get(pk=stocktake_id)
+        with self.assertNumQueries(3):
+            result = reconcile(stocktake)
+        self.assertEqual(
+            (result['expected'], result['scanned'], result['found'], result['missing_count'], result['misplaced_count']),
+            (2, 2, 1, 1, 1),
+        )
+        self.assertEqual([row['name'] for row in result['missing']], ['Пила'])
+        self.assertEqual([row['name'] for row in result['misplaced']], ['Чайник'])
+
+        response = self.api.post(f'{url}/close', json={'move_misplaced': True}, user=self.admin)
+        self.assertEqual(response.json()['status'], Stocktake.CLOSED)
+        self.assertEqual(response.json()['summary']['moved'], 1)
+        self.kettle.refresh_from_db()
+        self.assertEqual(self.kettle.location, self.garage)
+        response = self.api.post(f'{url}/scans', json={'codes': codes}, user=self.admin)
+        self.assertEqual(response.status_code, 409)
+
+    def test_bulk_delete_drops_scans(self):
+        stocktake = Stocktake.objects.create(location=self.garage)
+        record_scans(stocktake, [str(self.saw.pk)])
+        delete_items([self.saw.pk])
+        self.assertFalse(StocktakeScan.objects.exists())
+
+
+class LabelTests(InventoryTestCase):
+    def labels(self, count):
+        return [(pk, f'Коробка {pk}', build_qr_payload(pk)) for pk in range(1, count + 1)]
+
+    def test_pdf_is_streamed_page_by_page(self):
+        layout = LabelLayout.parse('3x8', dpi=72)
+        chunks = list(label_pdf(self.labels(30), layout, skip=20))
+        pdf = b''.join(chunks)
+        self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+        # 4 свободных ячейки на первом листе, 24 на втором, 2 на третьем
+        self.assertIn(b'/Count 3', pdf)
+        self.assertEqual([len(batch) for _, batch, _ in page_jobs(self.labels(30), layout, skip=20)], [4, 24, 2])
+        # Таблица смещений указывает на начало объектов
+        xref = int(pdf.rsplit(b'startxref\n', 1)[1].split()[0])
+        offsets = [int(line[:10]) for line in pdf[xref:].split(b'\n')[3:] if line.endswith(b' n ')]
+        self.assertEqual(len(offsets), 2 + 3 * 3)
+        for number, offset in enumerate(offsets, start=1):
+            self.assertTrue(pdf[offset:].startswith(f'{number} 0 obj'.encode()))
+
+    def test_parallel_pages_match_serial(self):
+        layout = LabelLayout.parse('2x4', dpi=72)
+        jobs = list(page_jobs(self.labels(20), layout))
+        with mock.patch('inventory.labels.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as executor:
+            self.assertEqual(list(render_pages(jobs, workers=2)), list(render_pages(jobs, workers=1)))
+        # Не fork: веб-воркер многопоточный
+        self.assertEqual(executor.call_args.kwargs['mp_context'].get_start_method(), 'forkserver')
+        with self.assertRaises(ValueError):
+            LabelLayout.parse('3 на 8')
+
+    def test_command_and_admin_action(self):
+        seed_inventory(items=10)
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / 'labels.pdf'
+            call_command('print_labels', str(path), grid='2x4', dpi=72, workers=1, stdout=io.StringIO())
+            self.assertIn(b'/Count 2', path.read_bytes())
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        data = {'action': 'print_labels', '_selected_action': list(Item.objects.values_list('pk', flat=True)[:3])}
+        response = self.client.post('/admin/inventory/item/', data)
+        self.assertContains(response, 'Вещей: 3')
+        response = self.client.post('/admin/inventory/item/', {**data, 'apply': '1', 'grid': '3x8', 'skip': '0'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn(b'/Count 1', b''.join(response.streaming_content))
+
+
+class BackupTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.storage = Item._meta.get_field('photo').storage
+
+    def test_roundtrip(self):
+        seed_inventory(items=12)
+        item = Item.objects.filter(category__isnull=False).order_by('pk').first()
+        item.photo.save('box.jpg', ContentFile(jpeg_bytes()), save=False)
+        item.generate_qr_code()
+        item.save()
+        photo, created_at = item.photo.name, item.created_at
+        Location.objects.filter(pk=item.location_id).update(parent=Location.objects.create(name='Дом'))
+        before = list(Item.objects.order_by('pk').values_list('pk', 'name', 'category__name', 'location__name', 'price'))
+
+        archive = io.BytesIO()
+        stats = write_backup(archive)
+        self.assertEqual((stats.rows['item'], stats.files), (12, 2))
+
+        Item.objects.all().delete()
+        Category.objects.all().delete()
+        Location.objects.update(parent=None)
+        Location.objects.all().delete()
+        self.storage.delete(photo)
+
+        # Пустая база: id сохраняются, даты — из архива
+        archive.seek(0)
+        stats = restore_backup(archive)
+        self.assertFalse(stats.remapped)
+        self.assertEqual(
+            list(Item.objects.order_by('pk').values_list('pk', 'name', 'category__name', 'location__name', 'price')),
+            before,
+        )
+        restored = Item.objects.get(pk=item.pk)
+        self.assertEqual((restored.created_at, restored.photo.name), (created_at, photo))
+        self.assertTrue(self.storage.exists(photo))
+        self.assertEqual(diff_rollups(), {})
+        self.assertEqual(restored.location.parent.name, 'Дом')
+        self.assertEqual(LocationClosure.objects.count(), 1)
+        self.assertEqual(apply_search(Item.objects.all(), before[0][1]).count(), 1)
+        # Последовательность сдвинута за восстановленные id
+        self.assertGreater(Item.objects.create(name='Новая').pk, before[-1][0])
+
+        # Непустая база: новые id, ссылки на категории переназначены, QR-файлы не переносятся
+        archive.seek(0)
+        stats = restore_backup(archive)
+        self.assertTrue(stats.remapped)
+        self.assertEqual(Item.objects.count(), 25)
+        self.assertEqual(Category.objects.count(), 8)
+        copy = Item.objects.exclude(pk__lte=before[-1][0] + 1).get(photo=photo)
+        self.assertEqual(copy.qr_code, '')
+        self.assertEqual(copy.category.name, restored.category.name)
+        self.assertNotEqual(copy.category_id, restored.category_id)
+        self.assertEqual(copy.location.parent.name, 'Дом')
+        self.assertNotEqual(copy.location.parent_id, restored.location.parent_id)
+        self.assertEqual(LocationClosure.objects.count(), 2)
+        self.assertEqual(diff_rollups(), {})
+
+    def test_renamed_file_relinks_only_restored_items(self):
+        seed_inventory(items=3)
+        item = Item.objects.order_by('pk').first()
+        item.photo.save('p.jpg', ContentFile(jpeg_bytes()), save=False)
+        item.save()
+        photo = item.photo.name
+        archive = io.BytesIO()
+        write_backup(archive)
+
+        # В хранилище под тем же именем уже другой файл, и на него ссылается существующая вещь
+        self.storage.delete(photo)
+        self.storage.save(photo, ContentFile(jpeg_bytes((10, 10))))
+        archive.seek(0)
+        stats = restore_backup(archive)
+        self.assertTrue(stats.remapped)
+
+        item.refresh_from_db()
+        self.assertEqual(item.photo.name, photo)
+        copy = Item.objects.exclude(pk=item.pk).get(name=item.name, photo__startswith='items/p')
+        self.assertNotEqual(copy.photo.name, photo)
+        self.assertEqual(self.storage.size(copy.photo.name), len(jpeg_bytes()))
+        self.assertEqual(self.storage.size(photo), len(jpeg_bytes((10, 10))))
+
+    def test_same_size_different_file_is_not_reused(self):
+        seed_inventory(items=3)
+        item = Item.objects.order_by('pk').first()
+        data = jpeg_bytes()
+        item.photo.save('p.jpg', ContentFile(data), save=False)
+        item.save()
+        photo = item.photo.name
+        archive = io.BytesIO()
+        write_backup(archive)
+
+        # Тот же файл — переиспользуется, копия вещи ссылается на него же
+        archive.seek(0)
+        restore_backup(archive)
+        self.assertEqual(Item.objects.filter(photo=photo).count(), 2)
+
+        # Другая картинка того же размера и с тем же именем — файл из архива ложится рядом
+        other = data[:-3] + bytes(255 - byte for byte in data[-3:])
+        self.storage.delete(photo)
+        self.storage.save(photo, ContentFile(other))
+        archive.seek(0)
+        restore_backup(archive)
+        copy = Item.objects.filter(name=item.name).exclude(photo=photo).get()
+        with copy.photo.open('rb') as f:
+            self.assertEqual(f.read(), data)
+        with self.storage.open(photo) as f:
+            self.assertEqual(f.read(), other)
+
+    def test_rejects_foreign_archive(self):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+            info = tarfile.TarInfo('manifest.ndjson.gz')
+            data = gzip.compress(b'{"type": "item", "name": "x"}\n')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        archive.seek(0)
+        with self.assertRaises(BackupError):
+            restore_backup(archive)
+        self.assertFalse(Item.objects.exists())
+
+
+# Падает, пока не выставлен FLAKY['ok'] — для проверки повторов
+FLAKY = {'ok': False}
+
+
+@jobs.task('tests.flaky', max_attempts=2)
+def flaky_task(value):
+    if not FLAKY['ok']:
+        raise RuntimeError('ещё не готово')
+    return {'value': value}
+
+
+@override_settings(JOB_RETRY_DELAY=60)
+class JobQueueTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        FLAKY['ok'] = False
+        self.addCleanup(FLAKY.update, ok=False)
+
+    def test_priority_and_retries(self):
+        low = jobs.enqueue('tests.flaky', {'value': 1})
+        high = jobs.enqueue('tests.flaky', {'value': 2}, priority=5)
+        self.assertEqual(jobs.claim('w').pk, high.pk)
+        self.assertEqual(jobs.claim('w').pk, low.pk)
+        self.assertIsNone(jobs.claim('w'))
+
+        # Первая попытка падает — задача ждёт повтора и в очередь раньше времени не попадает
+        Job.objects.update(status=Job.QUEUED, attempts=0)
+        with self.assertLogs('inventory.jobs', 'ERROR'):
+            self.assertEqual(jobs.work('w', burst=True), 2)
+        low.refresh_from_db()
+        self.assertEqual((low.status, low.attempts), (Job.QUEUED, 1))
+        self.assertIn('ещё не готово', low.error)
+        self.assertIsNone(jobs.claim('w'))
+
+        FLAKY['ok'] = True
+        Job.objects.filter(pk=low.pk).update(run_at=low.created_at)
+        jobs.work('w', burst=True)
+        low.refresh_from_db()
+        self.assertEqual((low.status, low.result, low.error), (Job.DONE, {'value': 1}, ''))
+
+        # Попытки кончились — задача остаётся с ошибкой
+        FLAKY['ok'] = False
+        Job.objects.filter(pk=high.pk).update(run_at=low.created_at)
+        with self.assertLogs('inventory.jobs', 'ERROR'):
+            jobs.work('w', burst=True)
+        high.refresh_from_db()
+        self.assertEqual((high.status, high.attempts), (Job.FAILED, 2))
+
+    def test_stale_jobs_requeued(self):
+        job = jobs.enqueue('tests.flaky', {'value': 1})
+        jobs.claim('пропавший')
+        Job.objects.filter(pk=job.pk).update(started_at=job.created_at - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.claim('w').pk, job.pk)
+
+    def test_qr_code_file_handed_off(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        with override_settings(QR_CODE_FILES=True, MEDIA_ROOT=media.name):
+            item = Item.objects.create(name='Коробка')
+            self.assertFalse(Item.objects.get(pk=item.pk).qr_code)
+            call_command('run_workers', workers=1, burst=True, stdout=io.StringIO())
+        item.refresh_from_db()
+        self.assertTrue(item.qr_code.name.startswith('qrcodes/'))
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_export_status_api(self):
+        seed_inventory(items=5)
+        staff = User.objects.create_user('staff', is_staff=True)
+        api = ApiClient(router)
+        self.assertEqual(api.post('/exports', json={}).status_code, 401)
+        response = api.post('/exports', json={'format': 'ndjson', 'gzip': False}, user=staff)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['id']
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        with override_settings(MEDIA_ROOT=media.name):
+            jobs.work('w', burst=True)
+            data = api.get(f'/jobs/{job_id}', user=staff).json()
+            self.assertEqual(data['status'], 'done')
+            self.assertTrue(data['result']['url'].endswith('.ndjson'))
+            with open(Path(media.name) / data['result']['name'], encoding='utf-8') as f:
+                self.assertEqual(len(f.readlines()), 5)
+        self.assertEqual([row['id'] for row in api.get('/jobs?status=done', user=staff).json()], [job_id])
+
+
+class FakeConnection:
+    """Достаточно psycopg2-подобный объект для проверки логики пула"""
+
+    def __init__(self):
+        self.closed = 0
+        self.alive = True
+        self.info = SimpleNamespace(transaction_status=TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        if not self.alive:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    def rollback(self):
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(TestCase):
+    def make_pool(self, **options):
+        settings = {'size': 2, 'timeout': 0.05, 'max_idle': 60, 'max_lifetime': 600, 'ping_after': 0, **options}
+        return ConnectionPool(FakeConnection, **settings)
+
+    def test_reuses_and_bounds_connections(self):
+        pool = self.make_pool()
+        first, second = pool.checkout(), pool.checkout()
+        with self.assertRaises(PoolExhausted):
+            pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        self.assertEqual(pool.stats()['connected'], 2)
+
+    def test_broken_connection_replaced_on_checkout(self):
+        pool = self.make_pool()
+        conn = pool.checkout()
+        pool.checkin(conn)
+        conn.alive = False
+        fresh = pool.checkout()
+        self.assertIsNot(fresh, conn)
+        self.assertTrue(conn.closed)
+
+    def test_idle_connections_recycled(self):
+        pool = self.make_pool(max_idle=0)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        self.assertIsNot(pool.checkout(), conn)
+        self.assertEqual(pool.stats()['recycled'], 1)
+
+    def test_open_transaction_rolled_back_on_checkin(self):
+        pool = self.make_pool()
+        conn = pool.checkout()
+        conn.info.transaction_status = TRANSACTION_STATUS_INTRANS
+        pool.checkin(conn)
+        self.assertEqual(conn.info.transaction_status, TRANSACTION_STATUS_IDLE)
+        self.assertIs(pool.checkout(), conn)
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    def run_middleware(self, queries, budget=None):
+        def view(request):
+            if budget is not None:
+                request.query_budget = budget
+            for _ in range(queries):
+                Item.objects.filter(pk=1).exists()
+            return HttpResponse()
+
+        request = RequestFactory().get('/probe/')
+        return QueryBudgetMiddleware(view)(request)
+
+    def test_warns_when_budget_exceeded(self):
+        with self.assertLogs('inventory.querybudget', 'WARNING') as logs:
+            self.run_middleware(queries=2, budget=1)
+        self.assertIn('бюджет', logs.output[0])
+
+    def test_warns_about_repeated_sql(self):
+        with self.assertLogs('inventory.querybudget', 'WARNING') as logs:
+            self.run_middleware(queries=5)
+        self.assertIn('N+1', logs.output[0])
+
+    def test_silent_within_budget(self):
+        with self.assertNoLogs('inventory.querybudget', 'WARNING'):
+            self.run_middleware(queries=1, budget=1)
+
+
+class MetricsTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = Path(folder.name)
+        override = override_settings(METRICS_DIR=self.folder, METRICS_TOKEN='secret')
+        override.enable()
+        self.addCleanup(override.disable)
+        seed_inventory(items=5)
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn(f'"{len(queries)} SQL"', timing)
+        self.assertIn('tpl;dur=', timing)
+        # Справочники и фасеты построены заново
+        self.assertRegex(timing, r'cache;desc="\d+ hit, [1-9]\d* miss"')
+
+    def test_nested_template_renders_counted_once(self):
+        seed_inventory(20)
+        admin = User.objects.create_superuser('metrics-admin', password='x')
+        self.client.force_login(admin)
+        # Виджеты форм админки рендерятся шаблонами бэкенда внутри страницы
+        timing = self.client.get('/admin/inventory/item/')['Server-Timing']
+        app, tpl = (float(re.search(rf'{name};dur=([\d.]+)', timing).group(1)) for name in ('app', 'tpl'))
+        self.assertLessEqual(tpl, app)
+
+    def test_metrics_endpoint_sums_processes(self):
+        self.client.get('/')
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        # Завершившийся воркер оставил файл: он вливается в архив ровно один раз
+        process = subprocess.Popen(['true'])
+        process.wait()
+        dead = process.pid
+        (self.folder / f'{dead}-1.json').write_text(json.dumps({
+            'counters': {'db_queries_total{view="inventory:item-list"}': 1000},
+            'histograms': {},
+            'gauges': {},
+        }))
+        auth = {'HTTP_AUTHORIZATION': 'Bearer secret'}
+        for _ in range(2):
+            body = self.client.get('/metrics', **auth).content.decode()
+            self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+            self.assertIn('http_request_duration_seconds_bucket{method="GET",view="inventory:item-list",le="+Inf"}', body)
+            count = int(re.search(r'db_queries_total\{view="inventory:item-list"\} (\d+)', body).group(1))
+            self.assertGreater(count, 1000)
+            self.assertLess(count, 2000)
+        self.assertFalse((self.folder / f'{dead}-1.json').exists())
+        self.assertTrue((self.folder / 'archive.json').exists())
+
+    def test_flush_off_request_path(self):
+        with mock.patch.object(metrics.registry, 'flush') as flush:
+            self.client.get('/')
+        flush.assert_not_called()
+        self.assertEqual(metrics.registry.flusher_pid, os.getpid())
+        self.assertIn('metrics-flush', [thread.name for thread in threading.enumerate()])
+        self.assertEqual(list(self.folder.iterdir()), [])
+
+        # Цикл потока: подождать интервал и сбросить; второй sleep обрывает цикл
+        with mock.patch('config.metrics.time.sleep', side_effect=[None, StopIteration]) as sleep:
+            with self.assertRaises(StopIteration):
+                metrics.registry._flush_loop()
+        sleep.assert_called_with(settings.METRICS_FLUSH_INTERVAL)
+        self.assertEqual([path.name for path in self.folder.glob('*.json')], [metrics.registry.filename])
+
+    def test_without_metrics_dir(self):
+        with override_settings(METRICS_DIR=None):
+            self.client.get('/')
+            metrics.registry.flush()
+            body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",view="inventory:item-list",le="+Inf"}', body)
+        self.assertEqual(list(self.folder.iterdir()), [])
+
+
+class SeedInventoryTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def seed(self, **options):
+        call_command('seed_inventory', stdout=io.StringIO(), **options)
+        return list(Item.objects.order_by('pk').values_list('name', 'category__name', 'location__name', 'price'))
+
+    def test_reproducible_and_consistent(self):
+        first = self.seed(items=300, seed=7, batch_size=128)
+        self.assertEqual(len(first), 300)
+        self.assertEqual(diff_rollups(), {})
+        self.assertEqual(
+            {(row.ancestor_id, row.descendant_id): row.depth for row in LocationClosure.objects.all()},
+            tree.expected_pairs(),
+        )
+        self.assertTrue(Location.objects.filter(parent__parent__parent__isnull=False).exists())
+        # Даты создания заданы генератором и растут вместе с id, как в живой базе
+        created = list(Item.objects.order_by('pk').values_list('created_at', flat=True))
+        self.assertEqual(created, sorted(created))
+        self.assertLess(created[-1], timezone.now() - timedelta(days=365))
+        self.assertTrue(apply_search(Item.objects.all(), first[0][0].split()[0]).exists())
+
+        self.assertEqual(self.seed(items=300, seed=7, clear=True), first)
+        self.assertEqual(diff_rollups(), {})
+        self.assertNotEqual(self.seed(items=300, seed=8, clear=True), first)
+
+    def test_photos(self):
+        self.seed(items=40, photos=1, locations=12, categories=3)
+        self.assertEqual(Category.objects.count(), 3)
+        self.assertEqual(Location.objects.count(), 12)
+        storage = Item._meta.get_field('photo').storage
+        names = set(Item.objects.values_list('photo', flat=True))
+        self.assertNotIn('', names)
+        self.assertTrue(all(storage.exists(name) for name in names))
+
+
+class ImportTests(InventoryTestCase):
+    CSV = (
+        'Название;Категория;Место;Цена;Дата покупки;Лишняя колонка\n'
+        'Дрель Makita;Инструменты;Гараж;1 234,50;05.03.2023;x\n'
+        ';Инструменты;Гараж;10;;\n'
+        'Молоток;Инструменты;Кухня;дорого;;\n'
+        'Шуруповёрт;Инструменты;Гараж;;2023-13-45;\n'
+        'Пылесос;Техника;Кухня;;2022-01-31;\n'
+        '\n'
+        'Отвёртка;;—;;;\n'
+    )
+
+    def setUp(self):
+        super().setUp()
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = Path(folder.name)
+
+    def run_command(self, name, content, **options):
+        path = self.folder / name
+        path.write_text(content, encoding='utf-8')
+        call_command('import_items', str(path), stdout=io.StringIO(), **options)
+        return path
+
+    def test_csv_batches_errors_and_side_effects(self):
+        Category.objects.create(name='Инструменты')
+        version = tiered_cache.versions(['items'])['items']
+        with mock.patch.object(suggest_index, 'invalidate') as invalidate:
+            path = self.run_command('items.csv', self.CSV, batch_size=2)
+        invalidate.assert_called_once()
+        self.assertNotEqual(tiered_cache.versions(['items'])['items'], version)
+
+        self.assertEqual(
+            list(Item.objects.order_by('pk').values_list('name', 'category__name', 'location__name', 'price',
+                                                         'purchase_date')),
+            [
+                ('Дрель Makita', 'Инструменты', 'Гараж', Decimal('1234.50'), date(2023, 3, 5)),
+                ('Пылесос', 'Техника', 'Кухня', None, date(2022, 1, 31)),
+                ('Отвёртка', None, None, None, None),
+            ],
+        )
+        # Существующая категория переиспользована, новые созданы по одному разу на все пачки
+        self.assertEqual(Category.objects.filter(name='Инструменты').count(), 1)
+        self.assertEqual(Location.objects.filter(name='Гараж').count(), 1)
+        self.assertEqual(diff_rollups(), {})
+        self.assertEqual(apply_search(Item.objects.all(), 'дрель').get().name, 'Дрель Makita')
+
+        with open(f'{path}.errors.csv', encoding='utf-8') as report:
+            rows = list(csv.reader(report))
+        self.assertEqual(rows[0], ['line', 'error', 'row'])
+        self.assertEqual([(row[0], row[1].split(':')[0]) for row in rows[1:]],
+                         [('3', 'name'), ('4', 'price'), ('5', 'purchase_date')])
+
+    def test_ndjson_without_errors_removes_report(self):
+        path = self.run_command('items.ndjson', '\n'.join([
+            '{"name": "Tent", "category": "Camping", "price": 99.9}',
+            '',
+            '{"Название": "Палатка", "место": "Дача"}',
+        ]))
+        self.assertEqual(sorted(Item.objects.values_list('name', flat=True)), ['Tent', 'Палатка'])
+        self.assertFalse(Path(f'{path}.errors.csv').exists())
+
+    def test_ndjson_bad_lines(self):
+        report = io.StringIO()
+        stats = import_items(io.BytesIO('{"name": "Ок"}\nне json\n[1, 2]\n'.encode()), fmt='ndjson', report=report)
+        self.assertEqual((stats.rows, stats.imported, stats.errors), (3, 1, 2))
+        self.assertIn('Некорректный JSON', report.getvalue())
+        self.assertIn('Ожидался JSON-объект', report.getvalue())
+
+    def test_insert_rows_column_order(self):
+        category = Category.objects.create(name='Книги')
+        location = Location.objects.create(name='Полка')
+        now = timezone.now()
+        # Порядок колонок общий для COPY и bulk_create
+        with self.assertNumQueries(1):
+            insert_rows([('Книга', 'Описание', category.pk, location.pk, Decimal('12.30'), date(2020, 1, 2),
+                          '', '', now, now)])
+        item = Item.objects.get()
+        self.assertEqual(
+            (item.name, item.description, item.category_id, item.location_id, item.price, item.purchase_date,
+             item.qr_code.name, item.photo_thumbs),
+            ('Книга', 'Описание', category.pk, location.pk, Decimal('12.30'), date(2020, 1, 2), '', ''),
+        )
+        self.assertGreaterEqual(item.created_at, now)
+
+    def test_admin_upload(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.client.force_login(User.objects.create_superuser('importer', password='x'))
+        upload = ContentFile(self.CSV.encode(), name='items.csv')
+        with override_settings(MEDIA_ROOT=media.name):
+            response = self.client.post('/admin/inventory/item/import-items', {'file': upload}, follow=True)
+            messages = [str(message) for message in response.context['messages']]
+            self.assertEqual(Item.objects.count(), 3)
+            self.assertTrue(any('Импортировано 3 из 6 строк' in message for message in messages))
+            self.assertTrue(any('Строк с ошибками: 3' in message for message in messages))
+            self.assertEqual(len(os.listdir(Path(media.name) / 'imports')), 1)
+
+
+class SearchTests(InventoryTestCase):
+    def names(self, query):
+        return [item.name for item in apply_search(Item.objects.all(), query)]
+
+    def test_name_ranks_above_description(self):
+        Item.objects.create(name='Рюкзак', description='Внутри палатка и спальник')
+        Item.objects.create(name='Палатка')
+        self.assertEqual(self.names('палатка'), ['Палатка', 'Рюкзак'])
+
+    def test_index_follows_insert_update_delete(self):
+        item = Item.objects.create(name='Фонарик', description='Запасной')
+        self.assertEqual(self.names('фонарик'), ['Фонарик'])
+        item.name = 'Ёлочная гирлянда'
+        item.save()
+        self.assertEqual(self.names('фонарик'), [])
+        # «ё» в названии и «е» в запросе совпадают
+        self.assertEqual(self.names('елочная'), ['Ёлочная гирлянда'])
+        self.assertEqual(self.names('запасной'), ['Ёлочная гирлянда'])
+        item.delete()
+        self.assertEqual(self.names('гирлянда'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'Запасной путь для SQLite без FTS5')
+    def test_like_fallback_without_fts(self):
+        Item.objects.create(name='Удлинитель', description='5 метров')
+        Item.objects.create(name='Кабель')
+        with mock.patch('inventory.search._sqlite_fts_available', return_value=False):
+            self.assertEqual(self.names('метров'), ['Удлинитель'])
+            # LIKE в SQLite не различает регистр только у латиницы
+            self.assertEqual(list(apply_search(Item.objects.all(), 'Кабель').values_list('rank', flat=True)), [0.0])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Триграммы есть только в PostgreSQL')
+    def test_trigram_only_with_extension(self):
+        Item.objects.create(name='Зарядник')
+        search._trigram_available.clear()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            installed = cursor.fetchone() is not None
+        with self.settings(SEARCH_TRIGRAM=True):
+            # Без pg_trgm запрос не должен падать на операторе %
+            self.assertEqual(self.names('зарятник'), ['Зарядник'] if installed else [])
+            self.assertEqual(self.names('зарядник'), ['Зарядник'])
+
+
+class QrTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = Path(folder.name)
+        qr_cache = override_settings(QR_CACHE_DIR=self.folder)
+        qr_cache.enable()
+        self.addCleanup(qr_cache.disable)
+        self.item = Item.objects.create(name='Коробка')
+
+    def test_png_and_svg(self):
+        png = self.client.get(f'/item/{self.item.pk}/qr.png')
+        self.assertEqual(png['Content-Type'], 'image/png')
+        self.assertTrue(png.content.startswith(b'\x89PNG'))
+        self.assertIn('public', png['Cache-Control'])
+        svg = self.client.get(f'/item/{self.item.pk}/qr.svg')
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', svg.content)
+        self.assertNotEqual(png['ETag'], svg['ETag'])
+        self.assertEqual(self.client.get('/item/999999/qr.png').status_code, 404)
+
+    def test_cached_render_and_not_modified(self):
+        render = mock.Mock(return_value=b'png')
+        with mock.patch.dict('inventory.qr.RENDERERS', {'png': render}):
+            first = self.client.get(f'/item/{self.item.pk}/qr.png')
+            second = self.client.get(f'/item/{self.item.pk}/qr.png')
+        render.assert_called_once_with(build_qr_payload(self.item.pk))
+        self.assertEqual((first.content, second.content), (b'png', b'png'))
+        self.assertEqual(len(list(self.folder.glob('*/*.png'))), 1)
+
+        # 304 решается по ETag, без чтения кэша
+        with mock.patch('inventory.views.get_qr_image') as get_image:
+            response = self.client.get(f'/item/{self.item.pk}/qr.png', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+        get_image.assert_not_called()
+
+    def test_prune_removes_oldest(self):
+        for index in range(5):
+            path = self.folder / 'ab' / f'{index}.png'
+            path.parent.mkdir(exist_ok=True)
+            path.write_bytes(b'x')
+            os.utime(path, (1000 + index, 1000 + index))
+        (self.folder / 'ab' / 'partial.tmp').write_bytes(b'x')
+        self.assertEqual(prune_qr_cache(max_files=2), 3)
+        self.assertEqual(sorted(path.name for path in (self.folder / 'ab').iterdir()), ['3.png', '4.png', 'partial.tmp'])
+        self.assertEqual(prune_qr_cache(max_files=2), 0)
+
+
+class RegenerateQrCodesTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.media = Path(media.name)
+        self.kitchen = Location.objects.create(name='Кухня')
+        self.tools = Category.objects.create(name='Инструменты')
+        self.items = [
+            Item.objects.create(name='Молоток', category=self.tools),
+            Item.objects.create(name='Кастрюля', location=self.kitchen),
+            Item.objects.create(name='Дрель', category=self.tools, location=self.kitchen),
+            Item.objects.create(name='Плед'),
+        ]
+
+    def regenerate(self, **options):
+        call_command('regenerate_qr_codes', stdout=io.StringIO(), workers=1, **options)
+        return {pk for pk, name in Item.objects.values_list('pk', 'qr_code') if name}
+
+    def test_filters(self):
+        hammer, pot, drill, blanket = (item.pk for item in self.items)
+        self.assertEqual(self.regenerate(ids=[pot, blanket]), {pot, blanket})
+        self.assertEqual(self.regenerate(category=self.tools.pk, location=self.kitchen.pk), {pot, drill, blanket})
+
+        # --missing не трогает уже готовые файлы
+        stat = (self.media / 'qrcodes' / f'item_{pot}.png').stat()
+        self.assertEqual(self.regenerate(missing=True), {hammer, pot, drill, blanket})
+        self.assertEqual((self.media / 'qrcodes' / f'item_{pot}.png').stat().st_mtime_ns, stat.st_mtime_ns)
+
+        item = Item.objects.get(pk=hammer)
+        self.assertEqual(item.qr_code.name, f'qrcodes/item_{hammer}.png')
+        with Image.open(item.qr_code.path) as image:
+            self.assertEqual(image.format, 'PNG')
+        self.assertEqual(len(list((self.media / 'qrcodes').iterdir())), 4)
+
+    def test_checkpoint_resume(self):
+        checkpoint = self.media / 'qr.checkpoint'
+        pks = [item.pk for item in self.items]
+        storage = Item._meta.get_field('qr_code').storage
+        save = storage.save
+
+        def failing_save(name, content, **kwargs):
+            if name.endswith(f'item_{pks[2]}.png'):
+                raise OSError('disk full')
+            return save(name, content, **kwargs)
+
+        # Падение на третьей вещи: первые две пачки уже записаны, checkpoint на второй
+        with mock.patch.object(storage, 'save', failing_save), self.assertRaises(OSError):
+            self.regenerate(batch_size=1, checkpoint=str(checkpoint))
+        self.assertEqual(checkpoint.read_text(), str(pks[1]))
+        self.assertEqual({pk for pk, name in Item.objects.values_list('pk', 'qr_code') if name}, set(pks[:2]))
+
+        output = io.StringIO()
+        call_command('regenerate_qr_codes', stdout=output, workers=1, batch_size=1, checkpoint=str(checkpoint))
+        self.assertIn(f'Продолжаем после id={pks[1]}', output.getvalue())
+        self.assertIn('2/2', output.getvalue())
+        self.assertFalse(checkpoint.exists())
+        self.assertEqual(self.regenerate(after_id=pks[3]), set(pks))
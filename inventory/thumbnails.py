@@ -0,0 +1,152 @@
+"""Превью фото вещей: несколько ширин в WebP и JPEG для srcset.
+
+Оригинал с телефона весит мегабайты; карточка в списке показывает его
+шириной в пару сотен пикселей. Превью строятся не в запросе: после сохранения
+фото задача уходит в пул потоков (Pillow отпускает GIL на ресайзе и
+кодировании), а массово — командой generate_thumbnails в пуле процессов.
+
+Имена превью выводятся из имени оригинала, поэтому шаблону не нужны лишние
+запросы: Item.photo_thumbs хранит имя фото, для которого превью готовы.
+"""
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connections
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+logger = logging.getLogger('inventory.thumbnails')
+
+# Формат -> (расширение, параметры кодировщика)
+FORMATS = {
+    'webp': ('webp', {'quality': 75, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def thumbnail_name(photo_name, width, fmt):
+    """items/cat.jpg -> thumbs/items/cat-320w.webp"""
+    stem = posixpath.splitext(photo_name)[0]
+    return f'thumbs/{stem}-{width}w.{FORMATS[fmt][0]}'
+
+
+def thumbnail_names(photo_name):
+    return [
+        thumbnail_name(photo_name, width, fmt)
+        for width in settings.THUMBNAIL_WIDTHS
+        for fmt in FORMATS
+    ]
+
+
+def render_thumbnails(data, widths):
+    """Байты оригинала -> {(ширина, формат): байты}.
+
+    Не трогает Django, поэтому её можно вызывать в дочерних процессах пула.
+    """
+    with Image.open(BytesIO(data)) as image:
+        # Телефоны пишут поворот в EXIF, а не в пиксели
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+        result = {}
+        # От большей ширины к меньшей: каждая следующая уменьшается из предыдущей
+        for width in sorted(widths, reverse=True):
+            if image.width > width:
+                image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            for fmt, (_, options) in FORMATS.items():
+                buffer = BytesIO()
+                image.save(buffer, format=fmt.upper(), **options)
+                result[(width, fmt)] = buffer.getvalue()
+    return result
+
+
+def render_thumbnails_job(job):
+    """Обёртка для ProcessPoolExecutor.map: (pk, имя фото, байты, ширины) -> (pk, имя, превью или None)"""
+    pk, name, data, widths = job
+    try:
+        return pk, name, render_thumbnails(data, widths)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Битый или не картинка — оригинал остаётся, превью не будет
+        return pk, name, None
+
+
+def save_thumbnails(storage, name, thumbnails):
+    for (width, fmt), data in thumbnails.items():
+        thumb = thumbnail_name(name, width, fmt)
+        if storage.exists(thumb):
+            storage.delete(thumb)
+        storage.save(thumb, ContentFile(data))
+
+
+def delete_thumbnails(storage, name):
+    for thumb in thumbnail_names(name):
+        if storage.exists(thumb):
+            storage.delete(thumb)
+
+
+def sources(storage, name):
+    """Для шаблона: srcset по форматам и src — средняя ширина в JPEG"""
+    widths = sorted(settings.THUMBNAIL_WIDTHS)
+    result = {
+        fmt: ', '.join(f'{storage.url(thumbnail_name(name, width, fmt))} {width}w' for width in widths)
+        for fmt in FORMATS
+    }
+    result['src'] = storage.url(thumbnail_name(name, widths[len(widths) // 2], 'jpeg'))
+    return result
+
+
+def build_for_item(pk):
+    """Строит превью для текущего фото вещи и убирает превью прежнего"""
+    from inventory.cache import tiered_cache
+    from inventory.models import Item
+
+    row = Item.objects.filter(pk=pk).values_list('photo', 'photo_thumbs').first()
+    if row is None:
+        return
+    photo, ready = row
+    if (photo or '') == ready:
+        return
+    storage = Item._meta.get_field('photo').storage
+    if photo:
+        with storage.open(photo) as f:
+            _, _, thumbnails = render_thumbnails_job((pk, photo, f.read(), settings.THUMBNAIL_WIDTHS))
+        if thumbnails is None:
+            logger.warning('Не удалось построить превью для вещи %s (%s)', pk, photo)
+            return
+        save_thumbnails(storage, photo, thumbnails)
+    # Фото могли сменить, пока строились превью, — тогда отметку поставит следующая задача
+    same_photo = Q(photo=photo) if photo else Q(photo='') | Q(photo__isnull=True)
+    if Item.objects.filter(same_photo, pk=pk).update(photo_thumbs=photo or ''):
+        if ready:
+            delete_thumbnails(storage, ready)
+        tiered_cache.bump(f'item:{pk}', 'items')
+
+
+def _run(pk):
+    close_old_connections()
+    try:
+        build_for_item(pk)
+    except Exception:
+        logger.exception('Ошибка при построении превью для вещи %s', pk)
+    finally:
+        # У потока пула своё соединение — не держим его открытым между задачами
+        connections.close_all()
+
+
+def schedule(pk):
+    """Поставить построение превью в фоновый пул (THUMBNAIL_WORKERS=0 — сразу)"""
+    global _executor
+    if settings.THUMBNAIL_WORKERS <= 0:
+        build_for_item(pk)
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+    _executor.submit(_run, pk)
@@ -5,8 +5,13 @@ app_name = 'inventory'
 
 urlpatterns = [
     path('', views.item_list, name='item-list'),
+    path('items/more/', views.item_list_more, name='item-list-more'),
     path('item/<int:pk>/', views.item_detail, name='item-detail'),
+    path('item/<int:pk>/qr.png', views.item_qr, {'fmt': 'png'}, name='item-qr'),
+    path('item/<int:pk>/qr.svg', views.item_qr, {'fmt': 'svg'}, name='item-qr-svg'),
     path('export/', views.export_csv, name='export-csv'),
     path('scanner/', views.scanner_view, name='scanner'),
     path('search/', views.item_list, name='search'),  # ВРЕМЕННАЯ ЗАГЛУШКА
+    path('api/suggest', views.suggest, name='suggest'),
+    path('api/cache/stats', views.cache_stats, name='cache-stats'),
 ]
\ No newline at end of file
@@ -1,22 +1,37 @@
-from django.shortcuts import render, get_object_or_404
-from django.db.models import Q
-from .models import Item
-from categories.models import Category
-from locations.models import Location
-import csv
-from django.http import HttpResponse
+import time
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import render
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from .cache import tiered_cache
+from .conditional import acollection_validators, anamespace_validators, not_modified, set_validators
+from .middleware import query_budget
+from .models import Item, Stocktake
+from .pagination import InvalidCursor, akeyset_page, keyset_page
+from .search import apply_search
+from .suggest import suggest_index
+from .qr import CONTENT_TYPES, build_qr_payload, get_qr_image, qr_digest
+from locations import tree
+from .exporting import FORMATS, is_asgi, streaming_export
+from .facets import afacets, parse_id
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotModified
 
-def item_list(request):
-    """Главная страница со списком вещей и поиском"""
-    items = Item.objects.all()
+
+def _list_queryset(request):
+    """Вещи с учётом поиска и фильтров + ключ сортировки для пагинации"""
+    items = Item.objects.select_related('category', 'location')
+    keyset = 'created'
 
     # Поиск
     query = request.GET.get('q')
     if query:
-        items = items.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        )
+        items = apply_search(items, query)
+        keyset = 'rank'
 
     # Фильтры
     category_id = request.GET.get('category')
@@ -25,50 +40,160 @@ def item_list(request):
     if category_id:
         items = items.filter(category_id=category_id)
     if location_id:
-        items = items.filter(location_id=location_id)
+        # Место вместе со всем, что в нём лежит: гараж -> полки -> коробки
+        items = items.filter(tree.subtree_q(location_id))
+
+    return items, keyset, query
+
+
+def _location_nav(locations, selected):
+    """Путь к выбранному месту и места внутри него (или корни) — без запросов"""
+    by_id = {row['id']: row for row in locations}
+    try:
+        selected = int(selected)
+    except (TypeError, ValueError):
+        selected = None
+    if selected not in by_id:
+        selected = None
+    return {
+        'location_path': tree.path(by_id, selected),
+        'location_children': [row for row in locations if row['parent_id'] == selected],
+    }
+
+
+def _next_page_params(request, page):
+    """Текущие параметры фильтра + курсор следующей страницы"""
+    if not page.has_next:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = page.next_cursor
+    return params.urlencode()
+
+
+def _filter_params(request, name, value):
+    """Текущие параметры с другим значением одного фильтра, с первой страницы"""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop(name, None)
+    if value is not None:
+        params[name] = value
+    return params.urlencode()
 
-    categories = Category.objects.all()
-    locations = Location.objects.all()
 
+def _with_links(request, name, rows):
+    return [{**row, 'params': _filter_params(request, name, row['id'])} for row in rows]
+
+
+@query_budget(4)
+async def item_list(request):
+    """Главная страница со списком вещей, поиском и счётчиками по фильтрам"""
+    etag, last_modified = await acollection_validators()
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    # apply_search один раз за процесс проверяет схему БД — синхронно
+    items, keyset, query = await sync_to_async(_list_queryset)(request)
+    try:
+        page = await akeyset_page(items, keyset, request.GET.get('cursor'), settings.ITEMS_PAGE_SIZE)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Некорректный курсор')
+
+    category = parse_id(request.GET.get('category'))
+    location = parse_id(request.GET.get('location'))
+    facets = await afacets(query or '', category, location)
+    nav = _location_nav(facets['locations'], location)
     context = {
-        'items': items,
-        'categories': categories,
-        'locations': locations,
+        'items': page.items,
+        'next_params': _next_page_params(request, page),
         'query': query,
+        'total': facets['total'],
+        'category': category,
+        'categories': _with_links(request, 'category', facets['categories']),
+        'all_categories_params': _filter_params(request, 'category', None),
+        'all_locations_params': _filter_params(request, 'location', None),
+        'location_path': _with_links(request, 'location', nav['location_path']),
+        'location_children': _with_links(request, 'location', nav['location_children']),
     }
-    return render(request, 'inventory/item_list.html', context)
+    return set_validators(render(request, 'inventory/item_list.html', context), etag, last_modified)
 
 
-def item_detail(request, pk):
-    """Страница одной вещи с QR-кодом"""
-    item = get_object_or_404(Item, pk=pk)
-    return render(request, 'inventory/item_detail.html', {'item': item})
+@query_budget(1)
+def item_list_more(request):
+    """Следующая страница карточек HTML-фрагментом для бесконечной прокрутки"""
+    items, keyset, _ = _list_queryset(request)
+    try:
+        page = keyset_page(items, keyset, request.GET.get('cursor'), settings.ITEMS_PAGE_SIZE)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Некорректный курсор')
 
+    return render(request, 'inventory/_item_cards.html', {
+        'items': page.items,
+        'next_params': _next_page_params(request, page),
+    })
 
-def export_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="inventory.csv"'
 
-    writer = csv.writer(response)
-    writer.writerow(['Название', 'Категория', 'Место', 'Цена'])
+@query_budget(1)
+async def item_detail(request, pk):
+    """Страница одной вещи с QR-кодом; готовый HTML берётся из кэша"""
+    async def render_page():
+        try:
+            item = await Item.objects.select_related('category', 'location').aget(pk=pk)
+        except Item.DoesNotExist:
+            raise Http404('Вещь не найдена')
+        return {
+            'content': render(request, 'inventory/item_detail.html', {'item': item}).content,
+            'updated_at': item.updated_at,
+        }
 
-    for item in Item.objects.all():
-        writer.writerow([
-            item.name,
-            item.category.name if item.category else '-',
-            item.location.name if item.location else '-',
-            item.price or 0
-        ])
+    namespaces = [f'item:{pk}', 'refs']
+    page = await tiered_cache.aget_or_set(f'item-detail:{pk}', render_page, namespaces=namespaces)
+    # ETag меняется и при переименовании категории/места, Last-Modified — только при правке вещи
+    etag, _ = await anamespace_validators(namespaces)
+    response = not_modified(request, etag, page['updated_at'])
+    if response is None:
+        response = set_validators(HttpResponse(page['content']), etag, page['updated_at'])
+    return response
 
+
+@query_budget(1)
+def item_qr(request, pk, fmt):
+    """QR-код вещи, рендерится при первом запросе и дальше берётся из кэша"""
+    if not Item.objects.filter(pk=pk).exists():
+        raise Http404('Вещь не найдена')
+
+    payload = build_qr_payload(pk)
+    # ETag считается по содержимому кода — для 304 картинку не читаем и не рендерим
+    etag = f'"{qr_digest(payload, fmt)}"'
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        data, _ = get_qr_image(payload, fmt)
+        response = HttpResponse(data, content_type=CONTENT_TYPES[fmt])
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.QR_CACHE_MAX_AGE)
     return response
 
 
-def search_view(request):
+@query_budget(1)
+def export_csv(request):
+    """Выгрузка всего инвентаря: ?format=csv|ndjson, ?gzip=1 для сжатия"""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest('Неизвестный формат выгрузки')
+    compress = request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+    return streaming_export(Item.objects.all(), fmt, compress=compress, asynchronous=is_asgi(request))
+
+
+@query_budget(2)
+async def search_view(request):
     """Отдельная страница поиска"""
     query = request.GET.get('q', '')
-    items = Item.objects.filter(
-        Q(name__icontains=query) | Q(description__icontains=query)
-    ) if query else []
+    items = []
+    if query:
+        queryset = await sync_to_async(apply_search)(Item.objects.all(), query)
+        items = [item async for item in queryset]
 
     return render(request, 'inventory/search.html', {
         'items': items,
@@ -76,8 +201,54 @@ def search_view(request):
     })
 
 
+@query_budget(3)
+def suggest(request):
+    """Подсказки для строки поиска из префиксного индекса в памяти"""
+    started = time.perf_counter()
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 50)
+    except ValueError:
+        limit = 8
+    query = request.GET.get('q', '')
+    result = suggest_index.suggest(query, limit)
+    for item in result['item']:
+        item['url'] = reverse('inventory:item-detail', kwargs={'pk': item['id']})
+
+    return JsonResponse({
+        'query': query,
+        'items': result['item'],
+        'categories': result['category'],
+        'locations': result['location'],
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+        'index': suggest_index.stats(),
+    })
+
+
+@staff_member_required
+def cache_stats(request):
+    """Попадания и промахи кэша в этом процессе"""
+    return JsonResponse(tiered_cache.stats())
+
+
 def scanner_view(request):
-    return render(request, 'inventory/scanner.html')
+    """Сканер: коды копятся и уходят пачками; ?stocktake=<id> — сканы идут в инвентаризацию"""
+    stocktake = None
+    stocktake_id = parse_id(request.GET.get('stocktake'))
+    if stocktake_id is not None:
+        stocktake = Stocktake.objects.select_related('location').filter(pk=stocktake_id).first()
+        if stocktake is None:
+            raise Http404('Инвентаризация не найдена')
+    if stocktake is not None:
+        kwargs = {'stocktake_id': stocktake.pk}
+        scan_url = reverse('api-v1:stocktake_scans', kwargs=kwargs)
+        reconcile_url = reverse('api-v1:stocktake_reconcile', kwargs=kwargs)
+    else:
+        scan_url, reconcile_url = reverse('api-v1:scan_resolve'), None
+    return render(request, 'inventory/scanner.html', {
+        'stocktake': stocktake,
+        'scan_url': scan_url,
+        'reconcile_url': reconcile_url,
+    })
 
 
 # Обработчики ошибок
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("locations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="children",
+                to="locations.location",
+                verbose_name="Входит в",
+            ),
+        ),
+        migrations.CreateModel(
+            name="LocationClosure",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("depth", models.PositiveSmallIntegerField(verbose_name="Глубина")),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="locations.location",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="locations.location",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Вложенность мест",
+                "verbose_name_plural": "Вложенность мест",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="locationclosure",
+            constraint=models.UniqueConstraint(
+                fields=("ancestor", "descendant"), name="location_closure_uniq"
+            ),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
 
@@ -5,10 +6,38 @@ from django.db import models
 class Location(models.Model):
     name = models.CharField('Название', max_length=100)
     description = models.TextField('Описание', blank=True)
+    # Дом → комната → полка → коробка; предки хранятся ещё и в LocationClosure
+    parent = models.ForeignKey('self', on_delete=models.PROTECT, null=True, blank=True,
+                               related_name='children', verbose_name='Входит в')
 
     class Meta:
         verbose_name = 'Место хранения'
         verbose_name_plural = 'Места хранения'
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+    def clean(self):
+        if self.pk and self.parent_id:
+            if self.parent_id == self.pk or LocationClosure.objects.filter(
+                ancestor_id=self.pk, descendant_id=self.parent_id,
+            ).exists():
+                raise ValidationError({'parent': 'Место нельзя вложить в само себя или в своё вложенное место'})
+
+
+class LocationClosure(models.Model):
+    """Все пары «предок — потомок» дерева мест (без пар места с самим собой).
+
+    Поддерживается сигналами (locations/tree.py). Поддерево места — один
+    запрос по индексу ancestor, перенос ветки меняет только эту таблицу.
+    """
+    ancestor = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='+')
+    descendant = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='+')
+    depth = models.PositiveSmallIntegerField('Глубина')
+
+    class Meta:
+        verbose_name = 'Вложенность мест'
+        verbose_name_plural = 'Вложенность мест'
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='location_closure_uniq'),
+        ]
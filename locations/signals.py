@@ -0,0 +1,27 @@
+"""Поддерживает таблицу замыканий дерева мест (locations/tree.py)"""
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from locations import tree
+from locations.models import Location
+
+
+@receiver(pre_save, sender=Location)
+def remember_parent(sender, instance, raw=False, using=None, **kwargs):
+    if raw or instance.pk is None:
+        return
+    instance._saved_parent_id = (
+        Location.objects.using(using).filter(pk=instance.pk).values_list('parent_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Location)
+def update_closure(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    if created:
+        if instance.parent_id is not None:
+            tree.move(instance.pk, instance.parent_id, created=True, using=using)
+    elif getattr(instance, '_saved_parent_id', None) != instance.parent_id:
+        tree.move(instance.pk, instance.parent_id, using=using)
+    instance._saved_parent_id = instance.parent_id
@@ -0,0 +1,86 @@
+"""Дерево мест: таблица замыканий LocationClosure поверх Location.parent.
+
+В таблице — все пары «предок — потомок» с расстоянием между ними, но без
+пар места с самим собой: так корни, созданные через bulk_create (импорт),
+не требуют строк вовсе. Поэтому «место и всё внутри» — это
+location_id = X OR location_id IN (потомки X), см. subtree_q.
+
+Перенос ветки не трогает ни вещи, ни сводки: удаляются связи ветки со
+старыми предками и добавляются связи с новыми — O(размер ветки × глубина).
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from locations.models import Location, LocationClosure
+
+BATCH_SIZE = 5000
+
+
+def descendants(pk, using='default'):
+    """Подзапрос с id всех мест внутри pk (без самого pk)"""
+    return LocationClosure.objects.using(using).filter(ancestor_id=pk).values('descendant_id')
+
+
+def subtree_q(pk, field='location_id', using='default'):
+    """Условие «в месте pk или где-то внутри него» — фильтр становится одним запросом"""
+    return Q(**{field: pk}) | Q(**{f'{field}__in': descendants(pk, using)})
+
+
+def move(pk, parent_id, created=False, using='default'):
+    """Ставит место pk (вместе с веткой) под parent_id; None — в корень"""
+    closure = LocationClosure.objects.using(using)
+    with transaction.atomic(using=using):
+        subtree = [(pk, 0)]
+        if not created:
+            subtree += closure.filter(ancestor_id=pk).values_list('descendant_id', 'depth')
+            ids = [node for node, _ in subtree]
+            if parent_id in ids:
+                raise ValueError('Место нельзя вложить в само себя или в своё вложенное место')
+            # Связи ветки со старыми предками; связи внутри ветки остаются
+            closure.filter(descendant_id__in=ids).exclude(ancestor_id__in=ids).delete()
+        if parent_id is None:
+            return
+        ancestors = [(parent_id, 1)]
+        ancestors += ((ancestor, depth + 1) for ancestor, depth in
+                      closure.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth'))
+        closure.bulk_create([
+            LocationClosure(ancestor_id=ancestor, descendant_id=node, depth=up + down)
+            for ancestor, up in ancestors
+            for node, down in subtree
+        ], batch_size=BATCH_SIZE)
+
+
+def expected_pairs(using='default'):
+    """(предок, потомок) -> глубина, посчитанные по Location.parent"""
+    parents = dict(Location.objects.using(using).values_list('pk', 'parent_id'))
+    pairs = {}
+    for pk in parents:
+        ancestor, depth = parents[pk], 1
+        # Ограничение глубины — защита от цикла в испорченных данных
+        while ancestor is not None and depth <= len(parents):
+            pairs[(ancestor, pk)] = depth
+            ancestor, depth = parents.get(ancestor), depth + 1
+    return pairs
+
+
+def rebuild(using='default'):
+    """Перестраивает LocationClosure с нуля (после восстановления из архива и т. п.)"""
+    pairs = expected_pairs(using)
+    with transaction.atomic(using=using):
+        LocationClosure.objects.using(using).all().delete()
+        LocationClosure.objects.using(using).bulk_create([
+            LocationClosure(ancestor_id=ancestor, descendant_id=descendant, depth=depth)
+            for (ancestor, descendant), depth in pairs.items()
+        ], batch_size=BATCH_SIZE)
+    return len(pairs)
+
+
+def path(locations, pk):
+    """Цепочка от корня до pk по словарю id -> {'parent_id': …}; без запросов"""
+    chain = []
+    node = locations.get(pk)
+    while node is not None and len(chain) < len(locations):
+        chain.append(node)
+        node = locations.get(node['parent_id'])
+    chain.reverse()
+    return chain